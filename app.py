@@ -1,20 +1,209 @@
 
+import io
 import os
+import sys
+import re
+import csv
+import json
+import base64
 import sqlite3
 import datetime
 import calendar
 import shutil
+import hashlib
+import secrets
+import mimetypes
+import tempfile
+import threading
+import time
+import zlib
+import argparse
+import atexit
+import queue
+import bisect
+import heapq
+import collections
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, session
+from flask import Flask, Response, render_template as flask_render_template, request, redirect, url_for, send_from_directory, send_file, flash, get_flashed_messages, session, g, jsonify, has_app_context
+from markupsafe import Markup, escape
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:
+    from PIL import Image, ImageOps, features as pil_features
+except ImportError:  # thumbnails are skipped and originals served instead
+    Image = None
+
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'database.db')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
+# Content-addressed photo store and derived variants (not under static/, so login applies)
+BLOB_FOLDER = os.path.join(BASE_DIR, 'storage', 'blobs')
+VARIANT_FOLDER = os.path.join(BASE_DIR, 'storage', 'variants')
+# Store files without a blobs row (left by a rolled-back upload) are removed once this old
+BLOB_SWEEP_GRACE_HOURS = 6
 ALLOWED_EXT = {'png', 'jpg', 'jpeg', 'gif'}
 MAX_PER_JOB = 30
+# Resumable photo uploads (/api/jobs/<id>/uploads): largest file, and hours an unfinished
+# upload is kept before its part file is removed
+UPLOAD_MAX_BYTES = 512 * 1024 * 1024
+UPLOAD_EXPIRY_HOURS = 48
+# Hours after creating a job during which its creator may add photos to it with the upload API
+# (admins may add photos to any job at any time)
+STAFF_UPLOAD_WINDOW_HOURS = 48
+
+# SQLite connection tuning (applied once per pooled connection)
+DB_CACHE_SIZE_KB = 32000
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_BUSY_TIMEOUT_MS = 5000
+
+# Listing pagination
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COUNT_CAP = 10000
+
+# Keyword search: bm25 weights for the jobs_fts columns (job_no, name, paper, note)
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+SNIPPET_TOKENS = 12
+
+# Photo variants: bounding box per kind, generated in the background after upload
+VARIANT_SIZES = {'preview': (1280, 1280), 'thumb': (320, 320)}
+VARIANT_QUALITY = 80
+VARIANT_MAX_AGE = 30 * 24 * 3600
+HASH_CHUNK = 1024 * 1024
+
+# Thumbnails and blob garbage collection run here, off the request thread
+BACKGROUND_WORKERS = 2
+
+# Audit log: 'async' (batched writer thread), 'transaction' (joins the handler's commit) or 'sync'
+AUDIT_MODE = 'async'
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL = 0.005
+
+# Live tracker (Server-Sent Events)
+TRACKER_STREAM_BUFFER = 100
+TRACKER_STREAM_HISTORY = 1000
+TRACKER_STREAM_HEARTBEAT = 15
+TRACKER_STREAM_RETRY_MS = 3000
+# Stage analytics: duration histogram bucket upper bounds (seconds); the last bucket is open-ended
+STAGE_DURATION_BOUNDS = (
+    60, 300, 900, 1800, 3600, 2 * 3600, 4 * 3600, 8 * 3600, 12 * 3600,
+    86400, 2 * 86400, 3 * 86400, 5 * 86400, 7 * 86400, 14 * 86400, 30 * 86400,
+)
+STUCK_AFTER_HOURS = 48
+
+# Bulk tracker updates: most jobs one request may touch
+BULK_MAX_JOBS = 500
+# Bulk import of legacy job cards
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+IMPORT_DEFAULT_STAGE = 'POST_DELIVERED'
+IMPORT_FIELDS = ('job_no', 'name', 'date', 'paper', 'note', 'price', 'serial', 'stage', 'photos')
+IMPORT_ALIASES = {
+    'job': 'job_no', 'job_number': 'job_no', 'job_no.': 'job_no',
+    'customer': 'name', 'customer_name': 'name',
+    'notes': 'note', 'description': 'note',
+}
+
+# Backup engine: snapshots go to BACKUP_FOLDER/db, photo files are mirrored under BACKUP_FOLDER/files
+BACKUP_FOLDER = os.path.join(BASE_DIR, 'backups')
+BACKUP_KEEP_SNAPSHOTS = 14
+BACKUP_INTERVAL_HOURS = 24  # 0 turns automatic backups off
+BACKUP_CHECK_SECONDS = 900
+
+# Activity log archival: whole months older than the retention window move to
+# ARCHIVE_FOLDER/activity-YYYY-MM.db and are searched through ATTACH (0 keeps everything live)
+ARCHIVE_FOLDER = os.path.join(BASE_DIR, 'archive')
+ACTIVITY_RETENTION_MONTHS = 12
+
+# Instrumentation: request latency buckets (seconds) for /metrics, the slow-query threshold,
+# entries kept for /system/slow-queries and how many of a statement's parameters they describe
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG_SIZE = 100
+SLOW_QUERY_MAX_PARAMS = 10
+
+# Rendered dashboard/tracker pages kept between writes (bytes of HTML; 0 turns the cache off)
+PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# /api/suggest: default and largest result count, index entries examined per query, and how long
+# the index trusts in-process updates before reloading (catches writes from other processes)
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+SUGGEST_SCAN_LIMIT = 1000
+SUGGEST_MAX_AGE = 600
+SUGGEST_FIELDS = ('job_no', 'customer')
+
+# Customer matching: words dropped when normalizing names, the trigram similarity (0-1) a name
+# needs to be offered as the same customer, the share of a typed query's trigrams (0-1) a name
+# must contain to be suggested for it, and jobs indexed per statement batch
+CUSTOMER_NOISE_WORDS = frozenset('pvt private ltd limited co company plc inc llc the and'.split())
+CUSTOMER_MATCH_THRESHOLD = 0.45
+CUSTOMER_QUERY_THRESHOLD = 0.6
+CUSTOMER_INDEX_BATCH = 500
+
+# Read-only JSON API for the floor tablets (/api/jobs); bump the version on incompatible changes
+JOBS_API_VERSION = 1
+JOB_API_FIELDS = (
+    'id', 'job_no', 'name', 'date', 'paper', 'note', 'price', 'serial', 'customer_id',
+    'created_by', 'created_at', 'updated_by', 'updated_at', 'stage', 'stage_updated_by', 'stage_updated_at',
+    'pre_plate', 'pre_die', 'pre_paper',
+    'plate_sent_at', 'plate_received_at', 'die_sent_at', 'die_received_at', 'paper_sent_at', 'paper_done_at',
+)
+JOB_API_LIST_FIELDS = ('id', 'job_no', 'name', 'stage', 'stage_updated_at', 'updated_at')
+HISTORY_API_FIELDS = ('id', 'stage', 'updated_at', 'updated_by', 'updated_by_name', 'pre_plate', 'pre_die', 'pre_paper')
+
+# Delta sync (/api/changes): triggers log every write to these tables (fields sent per row; updates
+# to other columns are not logged) and changes per response
+CHANGE_FEED_TABLES = {
+    'jobs': tuple(f for f in JOB_API_FIELDS if f != 'customer_id'),
+    'photos': ('id', 'job_id', 'filename', 'uploaded_at', 'sha256'),
+    'stage_history': ('id', 'job_id', 'stage', 'updated_by', 'updated_at', 'pre_plate', 'pre_die', 'pre_paper'),
+    'backup_log': ('id', 'backup_date', 'next_due', 'backup_type', 'backup_location', 'notes', 'created_by',
+                   'created_at', 'snapshot'),
+}
+CHANGES_LIMIT = 500
+CHANGES_MAX_LIMIT = 1000
+
+# Production server (python app.py serve). Each open tracker board keeps one
+# thread busy on /tracker/stream, so leave headroom above the expected boards.
+SERVER_HOST = '0.0.0.0'
+SERVER_PORT = 5000
+SERVER_THREADS = 16
+SERVER_CONNECTION_LIMIT = 200
+SERVER_CHANNEL_TIMEOUT = 120
+MAX_CONTENT_LENGTH = 256 * 1024 * 1024
+
+# Settings file (Python or .json) named by this variable, else settings.cfg next to app.py;
+# ARCHIVE_<KEY> environment variables override it (see create_app)
+SETTINGS_ENV = 'ARCHIVE_SETTINGS'
+SETTINGS_ENV_PREFIX = 'ARCHIVE'
+DEV_SECRET_KEY = 'replace-with-a-secure-secret'
+
+# Streaming exports: rows fetched per step and bytes buffered before each chunk is sent
+EXPORT_FETCH_ROWS = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_DATASETS = ('jobs', 'history', 'activity')
+
+# Outsourced processing checkbox -> timestamp column (set once, when first ticked)
+OUTSOURCE_FLAGS = (
+    ('plate_sent', 'plate_sent_at'),
+    ('plate_received', 'plate_received_at'),
+    ('die_sent', 'die_sent_at'),
+    ('die_received', 'die_received_at'),
+    ('paper_sent', 'paper_sent_at'),
+    ('paper_done', 'paper_done_at'),
+)
+STUCK_LIMIT = 200
+FINAL_STAGE = 'POST_DELIVERED'
+
+TRACKER_FIELDS = (
+    'id', 'job_no', 'name', 'date', 'stage', 'stage_updated_at',
+    'pre_plate', 'pre_die', 'pre_paper',
+    'plate_sent_at', 'plate_received_at', 'die_sent_at', 'die_received_at', 'paper_sent_at', 'paper_done_at',
+)
 
 TRACKER_STAGES = [
     ('PRE_DESIGN', 'Pre-Press: Designing', 'Pre-Press'),
@@ -28,6 +217,16 @@ TRACKER_STAGES = [
     ('POST_DELIVERED', 'Post-Press: Delivered', 'Post-Press'),
 ]
 
+def render_template(template_name_or_list, **context):
+    """flask.render_template, timed into the current request's metrics."""
+    started = time.perf_counter()
+    try:
+        return flask_render_template(template_name_or_list, **context)
+    finally:
+        req = getattr(_metrics_local, 'req', None)
+        if req is not None:
+            req[3] += time.perf_counter() - started
+
 def get_stage_label(code):
     for c, label, group in TRACKER_STAGES:
         if c == code:
@@ -35,18 +234,659 @@ def get_stage_label(code):
     return None
 
 app = Flask(__name__)
+app.config['DATABASE'] = DB_PATH
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['SECRET_KEY'] = 'replace-with-a-secure-secret'
+app.config['BLOB_FOLDER'] = BLOB_FOLDER
+app.config['VARIANT_FOLDER'] = VARIANT_FOLDER
+app.config['BACKUP_FOLDER'] = BACKUP_FOLDER
+app.config['ARCHIVE_FOLDER'] = ARCHIVE_FOLDER
+app.config['SECRET_KEY'] = DEV_SECRET_KEY
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['SERVER_HOST'] = SERVER_HOST
+app.config['SERVER_PORT'] = SERVER_PORT
+app.config['SERVER_THREADS'] = SERVER_THREADS
+app.config['SERVER_CONNECTION_LIMIT'] = SERVER_CONNECTION_LIMIT
+app.config['SERVER_CHANNEL_TIMEOUT'] = SERVER_CHANNEL_TIMEOUT
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Paths in settings may be relative to the application folder
+PATH_SETTINGS = ('DATABASE', 'UPLOAD_FOLDER', 'BLOB_FOLDER', 'VARIANT_FOLDER', 'BACKUP_FOLDER', 'ARCHIVE_FOLDER')
+# Module-level tuning that a settings file or ARCHIVE_<KEY> may override
+TUNABLE_SETTINGS = (
+    'MAX_PER_JOB', 'DB_CACHE_SIZE_KB', 'DB_MMAP_SIZE', 'PAGE_SIZE', 'MAX_PAGE_SIZE', 'BACKGROUND_WORKERS',
+    'AUDIT_MODE', 'BULK_MAX_JOBS', 'BACKUP_INTERVAL_HOURS', 'BACKUP_KEEP_SNAPSHOTS', 'ACTIVITY_RETENTION_MONTHS',
+    'SLOW_QUERY_MS', 'PAGE_CACHE_MAX_BYTES', 'UPLOAD_MAX_BYTES', 'UPLOAD_EXPIRY_HOURS',
+    'STAFF_UPLOAD_WINDOW_HOURS',
+)
+
+_db_local = threading.local()
+_db_stats_lock = threading.Lock()
+_db_stats = {'hits': 0, 'misses': 0, 'opened': 0, 'discarded': 0}
+
+
+_metrics_local = threading.local()
+
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'sql_statements', 'sql_seconds', 'render_seconds')
+
+    def __init__(self):
+        self.buckets = [0] * (len(METRICS_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+class RequestMetrics:
+    """Per-route latency histograms, SQL and template time, and the slow-query log behind /metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.statuses = collections.Counter()
+        self.slow = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self.slow_total = 0
+
+    def observe(self, endpoint, method, status, seconds, sql_statements, sql_seconds, render_seconds):
+        bucket = bisect.bisect_left(METRICS_BUCKETS, seconds)
+        key = (endpoint, method)
+        with self.lock:
+            stats = self.routes.get(key)
+            if stats is None:
+                stats = self.routes[key] = RouteStats()
+            stats.buckets[bucket] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.sql_statements += sql_statements
+            stats.sql_seconds += sql_seconds
+            stats.render_seconds += render_seconds
+            self.statuses[(endpoint, method, status)] += 1
+
+    def slow_query(self, sql, params, seconds):
+        text = ' '.join(sql.split())[:1000]
+        shown = describe_sql_params(params)
+        app.logger.warning('slow query %.1f ms: %s %s', seconds * 1000, text, shown)
+        entry = {'at': datetime.datetime.now().isoformat(timespec='seconds'), 'ms': round(seconds * 1000, 1),
+                 'sql': text, 'params': shown, 'endpoint': getattr(_metrics_local, 'endpoint', None)}
+        with self.lock:
+            self.slow.append(entry)
+            self.slow_total += 1
+
+    def snapshot(self):
+        with self.lock:
+            routes = {key: (list(s.buckets), s.count, s.seconds, s.sql_statements, s.sql_seconds, s.render_seconds)
+                      for key, s in self.routes.items()}
+            return routes, dict(self.statuses), list(self.slow), self.slow_total
+
+
+request_metrics = RequestMetrics()
+
+
+def _describe_sql_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return f'<str:{len(value)}>'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<bytes:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def describe_sql_params(params):
+    """Statement parameters as the slow-query log shows them: numbers as they are, text and
+    blobs only by length (they can hold password hashes, tokens or customer details), and at
+    most SLOW_QUERY_MAX_PARAMS of them."""
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        items = [f'{key}={_describe_sql_value(value)}' for key, value in list(params.items())[:SLOW_QUERY_MAX_PARAMS]]
+    else:
+        params = list(params)
+        items = [_describe_sql_value(value) for value in params[:SLOW_QUERY_MAX_PARAMS]]
+    if len(params) > SLOW_QUERY_MAX_PARAMS:
+        items.append(f'... {len(params) - SLOW_QUERY_MAX_PARAMS} more')
+    return '(' + ', '.join(items) + ')'
+
+
+def _record_sql(seconds, statements=0):
+    req = getattr(_metrics_local, 'req', None)
+    if req is not None:
+        req[1] += statements
+        req[2] += seconds
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that adds statement counts and SQLite time to the current request's metrics.
+
+    Time spent fetching counts towards the statement that produced the rows, so
+    a query that is slow to step through is still caught by the slow-query log.
+    """
+
+    _sql = None
+    _params = None
+    _spent = 0.0
+    _logged = False
+
+    def _account(self, seconds, statements=0):
+        _record_sql(seconds, statements)
+        self._spent += seconds
+        if not self._logged and self._sql is not None and self._spent >= SLOW_QUERY_MS / 1000:
+            self._logged = True
+            request_metrics.slow_query(self._sql, self._params, self._spent)
+
+    def execute(self, sql, parameters=()):
+        self._sql, self._params, self._spent, self._logged = sql, parameters, 0.0, False
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._account(time.perf_counter() - started, 1)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, self._params, self._spent, self._logged = sql, None, 0.0, False
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._account(time.perf_counter() - started, 1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._account(time.perf_counter() - started)
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            self._account(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._account(time.perf_counter() - started)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Per-thread connection. close() hands it back to the pool instead of closing it."""
+
+    db_path = None
+    checkouts = 0
+    users_seen = None
+    committed_changes = 0
+    pending_audit = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    # sqlite3.Connection's shortcuts build a plain Cursor; route them through ours
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        changes = self.total_changes
+        super().commit()
+        if changes != self.committed_changes:
+            self.committed_changes = changes
+            bump_data_generation()
+        # Audit entries logged inside the transaction (see log_action) go out once it is durable
+        if self.pending_audit:
+            rows, self.pending_audit = self.pending_audit, None
+            writer = audit_writer()
+            for row in rows:
+                writer.put(row)
+
+    def rollback(self):
+        self.pending_audit = None
+        super().rollback()
+
+    def close(self):
+        if self.checkouts > 0:
+            self.checkouts -= 1
+        # Last holder released it: drop anything that was never committed
+        if self.checkouts == 0 and self.in_transaction:
+            self.rollback()
+
+    def discard(self):
+        self.checkouts = 0
+        sqlite3.Connection.close(self)
+
+
+def _bump_db_stat(key):
+    with _db_stats_lock:
+        _db_stats[key] += 1
+
+
+def _open_db(path):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, factory=PooledConnection)
     conn.row_factory = sqlite3.Row
+    conn.db_path = path
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    _bump_db_stat('opened')
     return conn
 
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
+def get_db():
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and conn.db_path != DB_PATH:
+        conn.discard()
+        _bump_db_stat('discarded')
+        conn = None
+    if conn is None:
+        conn = _open_db(DB_PATH)
+        _db_local.conn = conn
+        _bump_db_stat('misses')
+    else:
+        _bump_db_stat('hits')
+    conn.checkouts += 1
+    if has_app_context():
+        g._db_conn = conn
+    return conn
+
+
+def close_thread_db():
+    """Really close this thread's pooled connection (worker shutdown, file restore)."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        conn.discard()
+        _db_local.conn = None
+        _bump_db_stat('discarded')
+
+
+def db_pool_stats():
+    with _db_stats_lock:
+        stats = dict(_db_stats)
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / total, 4) if total else None
+    return stats
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.checkouts = 0
+        if conn.in_transaction:
+            conn.rollback()
+
+
+class UserDirectory:
+    """In-memory copy of the users table, so read routes resolve ids without joining it.
+
+    add_user/delete_user call invalidate(). A commit from any other connection,
+    in this process or another, shows up as a new PRAGMA data_version on the
+    caller's connection and makes that connection's next get() reload.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = None
+        self.generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'invalidations': 0}
+
+    def get(self, conn):
+        """{id: {'id', 'full_name', 'username', 'role'}} as of the last commit visible to conn."""
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        with self.lock:
+            if self.users is not None and conn.users_seen == (self.generation, version):
+                self.stats['hits'] += 1
+                return self.users
+            self.stats['misses'] += 1
+            generation = self.generation
+        users = {row['id']: dict(row) for row in conn.execute('SELECT id, full_name, username, role FROM users')}
+        with self.lock:
+            self.stats['reloads'] += 1
+            # An invalidate() while we were reading means these rows may already be stale
+            if generation == self.generation:
+                self.users = users
+                conn.users_seen = (generation, version)
+        return users
+
+    def invalidate(self):
+        with self.lock:
+            self.users = None
+            self.generation += 1
+            self.stats['invalidations'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['users'] = len(self.users) if self.users is not None else None
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / total, 4) if total else None
+        return stats
+
+
+user_directory = UserDirectory()
+
+
+def user_name(users, user_id):
+    user = users.get(user_id)
+    return user['full_name'] if user else None
+
+def with_user_names(rows, users, key, name='full_name'):
+    """Rows as dicts with the full name of the user id in row[key] added as row[name]."""
+    return [dict(row, **{name: user_name(users, row[key])}) for row in rows]
+
+
+_data_generation = 0
+_data_watcher = None
+_data_version_lock = threading.Lock()
+
+def bump_data_generation():
+    global _data_generation
+    with _data_version_lock:
+        _data_generation += 1
+
+def database_version():
+    """(DB_PATH, generation, data_version): changes whenever anything may have been written.
+
+    The generation is bumped by every commit that changed rows through a pooled
+    connection (and by bump_data_generation() for anything else). data_version is
+    read on a watcher connection that never writes, so it moves on any commit by
+    another connection or process.
+    """
+    global _data_watcher
+    with _data_version_lock:
+        if _data_watcher is None or _data_watcher[0] != DB_PATH:
+            if _data_watcher is not None:
+                _data_watcher[1].close()
+            _data_watcher = (DB_PATH, sqlite3.connect(DB_PATH, check_same_thread=False))
+        data_version = _data_watcher[1].execute('PRAGMA data_version').fetchone()[0]
+        return DB_PATH, _data_generation, data_version
+
+
+class PageCache:
+    """LRU of rendered pages, valid until the next write, capped at PAGE_CACHE_MAX_BYTES.
+
+    Entries are tagged with version(): database_version() plus the tracker
+    stream id the tracker page embeds.
+    """
+
+    # Rough per-entry bookkeeping on top of the body
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'stores': 0, 'evictions': 0, 'skipped': 0}
+
+    def version(self):
+        return database_version() + (tracker_events.current_id(),)
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, version, body, content_type):
+        """Store a rendered body; returns the entry (version, body, content type, etag)."""
+        entry = (version, body, content_type, hashlib.blake2b(body, digest_size=16).hexdigest())
+        cost = len(body) + self.ENTRY_OVERHEAD
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1]) + self.ENTRY_OVERHEAD
+            # One page never takes more than a quarter of the cache
+            if cost > PAGE_CACHE_MAX_BYTES // 4:
+                self.stats['skipped'] += 1
+                return entry
+            self.entries[key] = entry
+            self.size += cost
+            self.stats['stores'] += 1
+            while self.size > PAGE_CACHE_MAX_BYTES:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted[1]) + self.ENTRY_OVERHEAD
+                self.stats['evictions'] += 1
+        return entry
+
+    def not_modified(self):
+        with self.lock:
+            self.stats['not_modified'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), bytes=self.size, max_bytes=PAGE_CACHE_MAX_BYTES)
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / total, 4) if total else None
+        return stats
+
+
+page_cache = PageCache()
+
+
+def suggest_key(text):
+    """Typeahead normal form: casefolded with runs of whitespace collapsed."""
+    return ' '.join(str(text or '').casefold().split())
+
+def job_no_key(text):
+    """Job numbers compare on letters and digits only: 'CC-0012 3' -> 'cc00123'."""
+    return re.sub(r'[\W_]+', '', str(text or '').casefold())
+
+def job_no_keys(job_no):
+    """Index keys for a job number: the compact form, and its trailing number without leading zeros."""
+    key = job_no_key(job_no)
+    keys = [key] if key else []
+    number = re.search(r'\d+$', key)
+    if number:
+        digits = number.group().lstrip('0')
+        if digits and digits != key:
+            keys.append(digits)
+    return keys
+
+def customer_word_keys(customer):
+    """'royal ceylon traders' -> itself, 'ceylon traders', 'traders': a prefix of any word matches."""
+    words = customer.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+def _sorted_discard(items, item):
+    i = bisect.bisect_left(items, item)
+    if i < len(items) and items[i] == item:
+        del items[i]
+
+
+class SuggestIndex:
+    """Sorted in-memory prefix index over job numbers and customer names, searched with bisect.
+
+    Loaded on first use (create_app warms it) and kept current by put_job() and
+    drop_job() from the add, edit and delete routes. It reloads after
+    invalidate(), when database_version() shows a commit that did not come
+    through this process, or after SUGGEST_MAX_AGE seconds, which bounds how
+    long an outside write that coincided with one of ours can go unnoticed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.loaded_at = 0.0
+        self.jobs = {}             # id -> (job_no, customer key, date)
+        self.job_keys = []         # sorted (key, job_no, id)
+        self.customers = {}        # customer key -> [name, job count, Counter of dates, last date]
+        self.customer_keys = []    # sorted (word key, customer key)
+        self.stats = {'queries': 0, 'loads': 0, 'load_ms': 0.0, 'updates': 0}
+
+    def _add(self, job_id, job_no, name, date, bulk=False):
+        # Thousands of jobs share each customer and date; keep one copy of those strings
+        customer = sys.intern(suggest_key(name))
+        date = sys.intern(date or '')
+        self.jobs[job_id] = (job_no, customer, date)
+        for key in job_no_keys(job_no):
+            if bulk:
+                self.job_keys.append((key, job_no, job_id))
+            else:
+                bisect.insort(self.job_keys, (key, job_no, job_id))
+        if not customer:
+            return
+        entry = self.customers.get(customer)
+        if entry is None:
+            entry = self.customers[customer] = [None, 0, collections.Counter(), '']
+            for key in customer_word_keys(customer):
+                if bulk:
+                    self.customer_keys.append((key, customer))
+                else:
+                    bisect.insort(self.customer_keys, (key, customer))
+        # Shown as most recently entered
+        entry[0] = ' '.join(name.split())
+        entry[1] += 1
+        if date:
+            entry[2][date] += 1
+            entry[3] = max(entry[3], date)
+
+    def _remove(self, job_id):
+        old = self.jobs.pop(job_id, None)
+        if old is None:
+            return
+        job_no, customer, date = old
+        for key in job_no_keys(job_no):
+            _sorted_discard(self.job_keys, (key, job_no, job_id))
+        entry = self.customers.get(customer)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if date:
+            entry[2][date] -= 1
+            if entry[2][date] <= 0:
+                del entry[2][date]
+                if date == entry[3]:
+                    entry[3] = max(entry[2], default='')
+        if entry[1] <= 0:
+            del self.customers[customer]
+            for key in customer_word_keys(customer):
+                _sorted_discard(self.customer_keys, (key, customer))
+
+    def _load(self, version):
+        started = time.perf_counter()
+        self.jobs, self.job_keys, self.customers, self.customer_keys = {}, [], {}, []
+        conn = get_db()
+        try:
+            for row in conn.execute('SELECT id, job_no, name, date FROM jobs ORDER BY id'):
+                self._add(row['id'], row['job_no'], row['name'], row['date'], bulk=True)
+        finally:
+            conn.close()
+        self.job_keys.sort()
+        self.customer_keys.sort()
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.stats['loads'] += 1
+        self.stats['load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _sync(self):
+        version = database_version()
+        current = self.version
+        if (current is None or current[0] != version[0] or time.monotonic() - self.loaded_at > SUGGEST_MAX_AGE
+                or (version[2] != current[2] and version[1] == current[1])):
+            self._load(version)
+        else:
+            self.version = version
+
+    def refresh(self):
+        with self.lock:
+            self._sync()
+
+    def put_job(self, job_id, job_no, name, date):
+        """Record a job as added or edited (after its commit)."""
+        with self.lock:
+            if self.version is None:
+                return
+            self._remove(job_id)
+            self._add(job_id, job_no, name, date)
+            self.stats['updates'] += 1
+
+    def drop_job(self, job_id):
+        with self.lock:
+            if self.version is None:
+                return
+            self._remove(job_id)
+            self.stats['updates'] += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+
+    def suggest(self, field, q, limit=SUGGEST_LIMIT):
+        """Top matches for a prefix of a job number or of any word of a customer name."""
+        key = job_no_key(q) if field == 'job_no' else suggest_key(q)
+        if not key:
+            return []
+        with self.lock:
+            self._sync()
+            self.stats['queries'] += 1
+            if field == 'job_no':
+                items = self.job_keys
+                start = bisect.bisect_left(items, (key,))
+                matches = {}
+                for i in range(start, min(len(items), start + SUGGEST_SCAN_LIMIT)):
+                    item_key, job_no, job_id = items[i]
+                    if not item_key.startswith(key):
+                        break
+                    # Closest completion first: exact, then shortest
+                    rank = (len(item_key), item_key)
+                    if job_id not in matches or rank < matches[job_id]:
+                        matches[job_id] = rank
+                results = []
+                for job_id in heapq.nsmallest(limit, matches, key=matches.get):
+                    job_no, customer, date = self.jobs[job_id]
+                    entry = self.customers.get(customer)
+                    results.append({'id': job_id, 'job_no': job_no, 'name': entry[0] if entry else None,
+                                    'date': date or None})
+                return results
+
+            items = self.customer_keys
+            start = bisect.bisect_left(items, (key,))
+            matches = {}
+            for i in range(start, min(len(items), start + SUGGEST_SCAN_LIMIT)):
+                item_key, customer = items[i]
+                if not item_key.startswith(key):
+                    break
+                # Names that start with the text first, then the busiest customers
+                rank = (item_key != customer, -self.customers[customer][1], customer)
+                if customer not in matches or rank < matches[customer]:
+                    matches[customer] = rank
+            return [{'name': self.customers[c][0], 'jobs': self.customers[c][1], 'last_date': self.customers[c][3] or None}
+                    for c in heapq.nsmallest(limit, matches, key=matches.get)]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, loaded=self.version is not None, jobs=len(self.jobs),
+                        customers=len(self.customers))
+
+
+suggest_index = SuggestIndex()
+
+
+def _add_missing_columns(cur, table, columns):
+    cur.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cur.fetchall()}
+    for name, decl in columns:
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+def migration_base_schema(cur):
     # Main jobs table
     cur.execute('''
         CREATE TABLE IF NOT EXISTS jobs (
@@ -58,45 +898,28 @@ def init_db():
             note TEXT
         )
     ''')
-    cur.execute("PRAGMA table_info(jobs)")
-    cols = [row[1] for row in cur.fetchall()]
-    if 'price' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN price TEXT")
-    if 'serial' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN serial TEXT")
-    if 'created_by' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN created_by INTEGER")
-    if 'created_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN created_at TEXT")
-    if 'updated_by' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN updated_by INTEGER")
-    if 'updated_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN updated_at TEXT")
-    if 'stage' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN stage TEXT")
-    if 'stage_updated_by' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN stage_updated_by INTEGER")
-    if 'stage_updated_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN stage_updated_at TEXT")
-    if 'pre_plate' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN pre_plate INTEGER DEFAULT 0")
-    if 'pre_die' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN pre_die INTEGER DEFAULT 0")
-    if 'pre_paper' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN pre_paper INTEGER DEFAULT 0")
-    # Outsourced processing timestamps
-    if 'plate_sent_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN plate_sent_at TEXT")
-    if 'plate_received_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN plate_received_at TEXT")
-    if 'die_sent_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN die_sent_at TEXT")
-    if 'die_received_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN die_received_at TEXT")
-    if 'paper_sent_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN paper_sent_at TEXT")
-    if 'paper_done_at' not in cols:
-        cur.execute("ALTER TABLE jobs ADD COLUMN paper_done_at TEXT")
+    # Databases created before migrations existed may have any prefix of these
+    _add_missing_columns(cur, 'jobs', [
+        ('price', 'TEXT'),
+        ('serial', 'TEXT'),
+        ('created_by', 'INTEGER'),
+        ('created_at', 'TEXT'),
+        ('updated_by', 'INTEGER'),
+        ('updated_at', 'TEXT'),
+        ('stage', 'TEXT'),
+        ('stage_updated_by', 'INTEGER'),
+        ('stage_updated_at', 'TEXT'),
+        ('pre_plate', 'INTEGER DEFAULT 0'),
+        ('pre_die', 'INTEGER DEFAULT 0'),
+        ('pre_paper', 'INTEGER DEFAULT 0'),
+        # Outsourced processing timestamps
+        ('plate_sent_at', 'TEXT'),
+        ('plate_received_at', 'TEXT'),
+        ('die_sent_at', 'TEXT'),
+        ('die_received_at', 'TEXT'),
+        ('paper_sent_at', 'TEXT'),
+        ('paper_done_at', 'TEXT'),
+    ])
 
     # Photos table
     cur.execute('''
@@ -160,8 +983,6 @@ def init_db():
         )
     ''')
 
-    conn.commit()
-
     # Ensure default super admin user exists
     cur.execute("SELECT id FROM users WHERE username = ?", ('isuka',))
     row = cur.fetchone()
@@ -171,14 +992,1006 @@ def init_db():
             "INSERT INTO users (full_name, username, password_hash, role) VALUES (?, ?, ?, ?)",
             ('Isuka Kasthuriarachchi', 'isuka', pwd, 'superadmin'),
         )
+
+
+def migration_secondary_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_photos_job ON photos(job_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stage_history_job ON stage_history(job_id, updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stage_history_updated ON stage_history(updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_created ON activity_log(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_stage ON jobs(stage)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_date ON jobs(date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_backup_log_date ON backup_log(backup_date)")
+    # Give the planner (and approx_job_count) table statistics to work with
+    cur.execute("ANALYZE")
+
+
+JOB_YEAR_EXPR = "CASE WHEN length(date) >= 4 THEN substr(date,1,4) END"
+JOB_MONTH_EXPR = "CASE WHEN length(date) >= 7 THEN substr(date,6,2) END"
+
+def init_date_facets(cur):
+    """Indexed year/month columns on jobs plus per-month job counts for the filter bar."""
+    cur.execute("PRAGMA table_xinfo(jobs)")
+    cols = [row[1] for row in cur.fetchall()]
+    if 'year' not in cols:
+        try:
+            cur.execute(f"ALTER TABLE jobs ADD COLUMN year TEXT GENERATED ALWAYS AS ({JOB_YEAR_EXPR}) VIRTUAL")
+            cur.execute(f"ALTER TABLE jobs ADD COLUMN month TEXT GENERATED ALWAYS AS ({JOB_MONTH_EXPR}) VIRTUAL")
+        except sqlite3.OperationalError:
+            # SQLite < 3.31 has no generated columns: keep them current with triggers
+            cur.execute("ALTER TABLE jobs ADD COLUMN year TEXT")
+            cur.execute("ALTER TABLE jobs ADD COLUMN month TEXT")
+            cur.execute(f"UPDATE jobs SET year = {JOB_YEAR_EXPR}, month = {JOB_MONTH_EXPR}")
+            cur.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS jobs_year_month_ai AFTER INSERT ON jobs BEGIN
+                    UPDATE jobs SET year = {JOB_YEAR_EXPR}, month = {JOB_MONTH_EXPR} WHERE id = new.id;
+                END
+            ''')
+            cur.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS jobs_year_month_au AFTER UPDATE OF date ON jobs BEGIN
+                    UPDATE jobs SET year = {JOB_YEAR_EXPR}, month = {JOB_MONTH_EXPR} WHERE id = new.id;
+                END
+            ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_year_month ON jobs(year, month, date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_month ON jobs(month, date)")
+
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job_date_facets'")
+    existed = cur.fetchone() is not None
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS job_date_facets (
+            year TEXT NOT NULL,
+            month TEXT NOT NULL,
+            job_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (year, month)
+        ) WITHOUT ROWID
+    ''')
+    # Facet keys are computed from date directly so they work with either column flavour
+    facet_year = "coalesce(CASE WHEN length({0}.date) >= 4 THEN substr({0}.date,1,4) END, '')"
+    facet_month = "coalesce(CASE WHEN length({0}.date) >= 7 THEN substr({0}.date,6,2) END, '')"
+    add_new = f'''
+        INSERT INTO job_date_facets (year, month, job_count)
+        VALUES ({facet_year.format('new')}, {facet_month.format('new')}, 1)
+        ON CONFLICT (year, month) DO UPDATE SET job_count = job_count + 1;
+    '''
+    drop_old = f'''
+        UPDATE job_date_facets SET job_count = job_count - 1
+        WHERE year = {facet_year.format('old')} AND month = {facet_month.format('old')};
+        DELETE FROM job_date_facets WHERE job_count <= 0;
+    '''
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS job_facets_ai AFTER INSERT ON jobs BEGIN {add_new} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS job_facets_ad AFTER DELETE ON jobs BEGIN {drop_old} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS job_facets_au AFTER UPDATE OF date ON jobs BEGIN {drop_old} {add_new} END")
+    if not existed:
+        cur.execute(f'''
+            INSERT INTO job_date_facets (year, month, job_count)
+            SELECT {facet_year.format('jobs')}, {facet_month.format('jobs')}, count(*) FROM jobs GROUP BY 1, 2
+        ''')
+
+def date_facets(cur, year=None):
+    """Return ([(year, count)], {month: count}) from the facet table; months are for year if given."""
+    cur.execute("SELECT year, sum(job_count) AS n FROM job_date_facets WHERE year != '' GROUP BY year ORDER BY year DESC")
+    year_counts = [(row['year'], row['n']) for row in cur.fetchall()]
+    if year:
+        cur.execute("SELECT month, job_count AS n FROM job_date_facets WHERE year = ? AND month != ''", (year,))
+    else:
+        cur.execute("SELECT month, sum(job_count) AS n FROM job_date_facets WHERE month != '' GROUP BY month")
+    month_counts = {row['month']: row['n'] for row in cur.fetchall()}
+    return year_counts, month_counts
+
+_fts_enabled = None
+
+def init_fts(cur):
+    """Create the jobs_fts index and its sync triggers; backfill it the first time.
+
+    Leaves keyword search on the LIKE path when SQLite was built without FTS5.
+    """
+    global _fts_enabled
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs_fts'")
+    existed = cur.fetchone() is not None
+    try:
+        cur.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+                job_no, name, paper, note,
+                content='jobs', content_rowid='id', prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print('FTS5 not available, keyword search will use LIKE', e)
+        _fts_enabled = False
+        return
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_ai AFTER INSERT ON jobs BEGIN
+            INSERT INTO jobs_fts (rowid, job_no, name, paper, note)
+            VALUES (new.id, new.job_no, new.name, new.paper, new.note);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_ad AFTER DELETE ON jobs BEGIN
+            INSERT INTO jobs_fts (jobs_fts, rowid, job_no, name, paper, note)
+            VALUES ('delete', old.id, old.job_no, old.name, old.paper, old.note);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_au AFTER UPDATE OF job_no, name, paper, note ON jobs BEGIN
+            INSERT INTO jobs_fts (jobs_fts, rowid, job_no, name, paper, note)
+            VALUES ('delete', old.id, old.job_no, old.name, old.paper, old.note);
+            INSERT INTO jobs_fts (rowid, job_no, name, paper, note)
+            VALUES (new.id, new.job_no, new.name, new.paper, new.note);
+        END
+    ''')
+    if not existed:
+        cur.execute("INSERT INTO jobs_fts (jobs_fts) VALUES ('rebuild')")
+    _fts_enabled = True
+
+def fts_available(cur):
+    global _fts_enabled
+    if _fts_enabled is None:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs_fts'")
+        _fts_enabled = cur.fetchone() is not None
+    return _fts_enabled
+
+def fts_query(q):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    terms = re.findall(r'\w+', q)
+    return ' '.join(f'"{t}"*' for t in terms) or None
+
+def migration_photo_variants(cur):
+    _add_missing_columns(cur, 'photos', [
+        ('thumb_filename', 'TEXT'),
+        ('preview_filename', 'TEXT'),
+        ('variants_status', 'TEXT'),
+    ])
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_photos_variants_status ON photos(variants_status)")
+
+
+def migration_blob_store(cur):
+    _add_missing_columns(cur, 'photos', [('sha256', 'TEXT')])
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_photos_sha256 ON photos(sha256)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(sha256) WHERE ref_count <= 0")
+    # Reference counts follow the photos table; collect_blobs() removes the zeroes
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS photos_blob_ai AFTER INSERT ON photos WHEN new.sha256 IS NOT NULL BEGIN
+            UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = new.sha256;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS photos_blob_ad AFTER DELETE ON photos WHEN old.sha256 IS NOT NULL BEGIN
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = old.sha256;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS photos_blob_au AFTER UPDATE OF sha256 ON photos BEGIN
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = old.sha256;
+            UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = new.sha256;
+        END
+    ''')
+
+    # Move the old static/uploads/<job_no>/ files into the store. Files are hard-linked
+    # (or copied) now and the originals only removed once this migration has committed.
+    legacy_variants = os.path.join(BASE_DIR, 'static', 'variants')
+    cur.execute('SELECT p.id, p.filename, j.job_no FROM photos p JOIN jobs j ON j.id = p.job_id WHERE p.sha256 IS NULL')
+    moved = []
+    for row in cur.fetchall():
+        folder = secure_filename(row['job_no'])
+        src = os.path.join(app.config['UPLOAD_FOLDER'], folder, row['filename'])
+        if not os.path.isfile(src):
+            print('photo file missing, left in legacy layout', src)
+            continue
+        sha256 = import_blob_file(cur, src)
+        cur.execute('UPDATE photos SET sha256 = ? WHERE id = ?', (sha256, row['id']))
+        base = os.path.splitext(secure_filename(row['filename']))[0]
+        moved.append((src, os.path.join(legacy_variants, folder), base, sha256))
+
+    def remove_legacy_files():
+        folders = set()
+        for src, variant_folder, base, sha256 in moved:
+            for kind in VARIANT_SIZES:
+                old = os.path.join(variant_folder, f"{base}_{kind}.{variant_format()[1]}")
+                new = variant_path(sha256, kind)
+                if os.path.exists(old):
+                    if not os.path.exists(new):
+                        os.makedirs(os.path.dirname(new), exist_ok=True)
+                        os.replace(old, new)
+                    else:
+                        os.remove(old)
+            try:
+                os.remove(src)
+            except Exception as e:
+                print('could not remove legacy photo', e)
+            folders.update([os.path.dirname(src), variant_folder])
+        for folder in folders:
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass  # not empty: leave unknown files alone
+
+    return remove_legacy_files
+
+
+def duration_bucket_sql(secs):
+    """SQL CASE mapping a seconds expression to its STAGE_DURATION_BOUNDS bucket index."""
+    whens = ' '.join(f"WHEN {secs} < {bound} THEN {i}" for i, bound in enumerate(STAGE_DURATION_BOUNDS))
+    return f"CASE {whens} ELSE {len(STAGE_DURATION_BOUNDS)} END"
+
+def duration_bucket(seconds):
+    for i, bound in enumerate(STAGE_DURATION_BOUNDS):
+        if seconds < bound:
+            return i
+    return len(STAGE_DURATION_BOUNDS)
+
+def migration_stage_rollups(cur):
+    # Completed time-in-stage, as a histogram plus running totals per stage
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stage_duration_stats (
+            stage TEXT PRIMARY KEY,
+            n INTEGER NOT NULL DEFAULT 0,
+            total_seconds REAL NOT NULL DEFAULT 0,
+            max_seconds REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stage_duration_buckets (
+            stage TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stage, bucket)
+        ) WITHOUT ROWID
+    ''')
+    # The stage each job is currently in and since when (from stage_history)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stage_open (
+            job_id INTEGER PRIMARY KEY,
+            stage TEXT,
+            started_at TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stage_wip (
+            stage TEXT PRIMARY KEY,
+            n INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+    # A history row in a different stage closes the job's open interval
+    secs = "max(0, (julianday(new.updated_at) - julianday(o.started_at)) * 86400.0)"
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stage_rollup_ai AFTER INSERT ON stage_history BEGIN
+            INSERT INTO stage_duration_buckets (stage, bucket, n)
+            SELECT o.stage, {duration_bucket_sql(secs)}, 1
+            FROM stage_open o WHERE o.job_id = new.job_id AND o.stage IS NOT new.stage
+            ON CONFLICT (stage, bucket) DO UPDATE SET n = n + 1;
+            INSERT INTO stage_duration_stats (stage, n, total_seconds, max_seconds)
+            SELECT o.stage, 1, {secs}, {secs}
+            FROM stage_open o WHERE o.job_id = new.job_id AND o.stage IS NOT new.stage
+            ON CONFLICT (stage) DO UPDATE SET
+                n = n + 1,
+                total_seconds = total_seconds + excluded.total_seconds,
+                max_seconds = max(max_seconds, excluded.max_seconds);
+            INSERT INTO stage_open (job_id, stage, started_at) VALUES (new.job_id, new.stage, new.updated_at)
+            ON CONFLICT (job_id) DO UPDATE SET stage = excluded.stage, started_at = excluded.started_at
+            WHERE stage IS NOT excluded.stage;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS stage_open_jobs_ad AFTER DELETE ON jobs BEGIN
+            DELETE FROM stage_open WHERE job_id = old.id;
+        END
+    ''')
+
+    wip_add = "INSERT INTO stage_wip (stage, n) VALUES (coalesce(new.stage, ''), 1) ON CONFLICT (stage) DO UPDATE SET n = n + 1;"
+    wip_drop = "UPDATE stage_wip SET n = n - 1 WHERE stage = coalesce(old.stage, '');"
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS stage_wip_ai AFTER INSERT ON jobs BEGIN {wip_add} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS stage_wip_ad AFTER DELETE ON jobs BEGIN {wip_drop} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS stage_wip_au AFTER UPDATE OF stage ON jobs BEGIN {wip_drop} {wip_add} END")
+
+    # Jobs sitting in an unfinished stage, oldest first
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_jobs_open_stage_age ON jobs(stage_updated_at) WHERE stage IS NOT '{FINAL_STAGE}'")
+    rebuild_stage_rollups(cur)
+
+def rebuild_stage_rollups(cur):
+    """Recompute all stage analytics rollups from stage_history and jobs in one pass."""
+    for table in ('stage_duration_stats', 'stage_duration_buckets', 'stage_open', 'stage_wip'):
+        cur.execute(f"DELETE FROM {table}")
+    cur.execute("INSERT INTO stage_wip (stage, n) SELECT coalesce(stage, ''), count(*) FROM jobs GROUP BY 1")
+
+    stats = {}
+    buckets = collections.Counter()
+    open_rows = {}
+    live = set()
+    # History of deleted jobs still counts towards durations, as it did when recorded
+    cur.execute('''
+        SELECT h.job_id, h.stage, h.updated_at, j.id IS NOT NULL FROM stage_history h LEFT JOIN jobs j ON j.id = h.job_id
+        ORDER BY h.job_id, h.updated_at, h.id
+    ''')
+    for job_id, stage, updated_at, exists in cur:
+        if exists:
+            live.add(job_id)
+        current = open_rows.get(job_id)
+        if current and current[0] == stage:
+            continue
+        if current:
+            try:
+                started = datetime.datetime.fromisoformat(current[1])
+                ended = datetime.datetime.fromisoformat(updated_at)
+            except (TypeError, ValueError):
+                started = ended = None
+            if started and ended:
+                secs = max(0.0, (ended - started).total_seconds())
+                n, total, longest = stats.get(current[0], (0, 0.0, 0.0))
+                stats[current[0]] = (n + 1, total + secs, max(longest, secs))
+                buckets[(current[0], duration_bucket(secs))] += 1
+        open_rows[job_id] = (stage, updated_at)
+
+    cur.executemany(
+        "INSERT INTO stage_duration_stats (stage, n, total_seconds, max_seconds) VALUES (?, ?, ?, ?)",
+        [(stage,) + values for stage, values in stats.items()],
+    )
+    cur.executemany(
+        "INSERT INTO stage_duration_buckets (stage, bucket, n) VALUES (?, ?, ?)",
+        [(stage, bucket, n) for (stage, bucket), n in buckets.items()],
+    )
+    cur.executemany(
+        "INSERT INTO stage_open (job_id, stage, started_at) VALUES (?, ?, ?)",
+        [(job_id, stage, started_at) for job_id, (stage, started_at) in open_rows.items() if job_id in live],
+    )
+
+
+def migration_fts_bulk_load(cur):
+    # While a writer holds a row here (inside its own transaction) the per-row
+    # jobs_fts insert trigger stands down and the writer indexes its batch in
+    # one INSERT ... SELECT, which is several times faster for large imports.
+    cur.execute('CREATE TABLE IF NOT EXISTS fts_bulk_load (active INTEGER)')
+    if not fts_available(cur):
+        return
+    cur.execute('DROP TRIGGER IF EXISTS jobs_fts_ai')
+    cur.execute('''
+        CREATE TRIGGER jobs_fts_ai AFTER INSERT ON jobs WHEN NOT EXISTS (SELECT 1 FROM fts_bulk_load) BEGIN
+            INSERT INTO jobs_fts (rowid, job_no, name, paper, note)
+            VALUES (new.id, new.job_no, new.name, new.paper, new.note);
+        END
+    ''')
+
+
+def migration_backup_engine(cur):
+    _add_missing_columns(cur, 'backup_log', [
+        ('snapshot', 'TEXT'),
+        ('files_copied', 'INTEGER'),
+        ('bytes_copied', 'INTEGER'),
+        ('duration_seconds', 'REAL'),
+        ('throughput_bps', 'REAL'),
+    ])
+
+
+def customer_norm(name):
+    """Normal form of a customer name: 'A.B.C. Traders (Pvt) Ltd' and 'abc trader' -> 'abc trader'.
+
+    Casefolds, drops dots and apostrophes inside words, legal-form and filler
+    words (CUSTOMER_NOISE_WORDS) and a plural s.
+    """
+    text = re.sub(r"[.'\u2019]", '', str(name or '').casefold().replace('&', ' and '))
+    words = re.findall(r'[^\W_]+', text)
+    kept = [w for w in words if w not in CUSTOMER_NOISE_WORDS] or words
+    return ' '.join(w[:-1] if len(w) > 3 and w.endswith('s') and not w.endswith('ss') else w for w in kept)
+
+
+def name_trigrams(norm):
+    """Trigrams of each word padded as '  word ', so word starts weigh more than endings."""
+    grams = set()
+    for word in norm.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def index_customers(cur, batch_size=CUSTOMER_INDEX_BATCH):
+    """Point jobs with no customer_id at their normalized name, adding new names and their trigrams.
+
+    Runs on the caller's transaction. New jobs start without a customer_id and a
+    trigger clears it when a job's name changes, so this only touches those rows.
+    Returns the number of jobs indexed.
+    """
+    total = 0
+    while True:
+        cur.execute('SELECT id, name FROM jobs WHERE customer_id IS NULL LIMIT ?', (batch_size,))
+        rows = cur.fetchall()
+        if not rows:
+            return total
+        norms = {}
+        for row in rows:
+            norms.setdefault(customer_norm(row['name']), ' '.join(str(row['name'] or '').split()))
+        cur.execute(f"SELECT id, norm FROM customer_names WHERE norm IN ({', '.join('?' * len(norms))})",
+                    list(norms))
+        name_ids = {r['norm']: r['id'] for r in cur.fetchall()}
+        for norm, display in norms.items():
+            if norm in name_ids:
+                continue
+            grams = name_trigrams(norm)
+            cur.execute('INSERT INTO customer_names (norm, display, trigram_count) VALUES (?, ?, ?)',
+                        (norm, display, len(grams)))
+            name_id = name_ids[norm] = cur.lastrowid
+            cur.executemany('INSERT INTO customer_trigrams (trigram, name_id) VALUES (?, ?)',
+                            [(gram, name_id) for gram in grams])
+        # A new name is its own customer until someone groups it with another
+        cur.execute('UPDATE customer_names SET canonical_id = id WHERE canonical_id IS NULL')
+        cur.executemany('UPDATE jobs SET customer_id = ? WHERE id = ?',
+                        [(name_ids[customer_norm(row['name'])], row['id']) for row in rows])
+        total += len(rows)
+
+
+def backfill_customer_index():
+    """Index jobs written without index_customers() (other tools, older scripts). Returns how many.
+
+    The app's own write paths keep the index current. init_db() runs this at
+    start-up and the maintenance scheduler on every pass, so lookups never
+    have to write.
+    """
+    conn = get_db()
+    try:
+        if conn.execute('SELECT 1 FROM jobs WHERE customer_id IS NULL LIMIT 1').fetchone() is None:
+            return 0
+        conn.execute('BEGIN IMMEDIATE')
+        indexed = index_customers(conn.cursor())
         conn.commit()
+        return indexed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def customer_matches(cur, q, limit=SUGGEST_LIMIT, threshold=None, whole_name=False):
+    """Customers whose names look like q, best first, one entry per group of names.
+
+    For a typed query, similarity is the share of q's trigrams a name contains,
+    so 'lanka' finds every 'Lanka ... Textiles' (closer spellings first). With
+    whole_name, q is another customer's name and similarity is the Jaccard index
+    of the two trigram sets. Each entry has the group's id and main name, the
+    closest spelling and its similarity, and the group's job count and last job
+    date. Groups with no jobs left are skipped.
+    """
+    if threshold is None:
+        threshold = CUSTOMER_MATCH_THRESHOLD if whole_name else CUSTOMER_QUERY_THRESHOLD
+    grams = sorted(name_trigrams(customer_norm(q)))
+    if not grams:
+        return []
+    jaccard = 'count(*) * 1.0 / (? + n.trigram_count - count(*))'
+    score = jaccard if whole_name else 'count(*) * 1.0 / ?'
+    cur.execute(
+        f"SELECT n.id, n.display, n.canonical_id, {score} AS similarity, {jaccard} AS jaccard "
+        "FROM customer_trigrams t JOIN customer_names n ON n.id = t.name_id "
+        f"WHERE t.trigram IN ({', '.join('?' * len(grams))}) GROUP BY n.id "
+        "HAVING similarity >= ? ORDER BY similarity DESC, jaccard DESC, n.id",
+        [len(grams), len(grams), *grams, threshold],
+    )
+    best = {}
+    for row in cur.fetchall():
+        best.setdefault(row['canonical_id'], row)
+    if not best:
+        return []
+    cur.execute(
+        "SELECT n.canonical_id, c.display, count(*) AS jobs, max(j.date) AS last_date "
+        "FROM customer_names n JOIN customer_names c ON c.id = n.canonical_id JOIN jobs j ON j.customer_id = n.id "
+        f"WHERE n.canonical_id IN ({', '.join('?' * len(best))}) GROUP BY n.canonical_id",
+        list(best),
+    )
+    groups = {row['canonical_id']: row for row in cur.fetchall()}
+    results = [
+        {'id': group, 'name': groups[group]['display'], 'matched': row['display'],
+         'similarity': round(row['similarity'], 3), 'jobs': groups[group]['jobs'],
+         'last_date': groups[group]['last_date']}
+        for group, row in best.items() if group in groups
+    ]
+    results.sort(key=lambda r: (-r['similarity'], -r['jobs']))
+    return results[:limit]
 
+
+def migration_customer_index(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS customer_names (
+            id INTEGER PRIMARY KEY,
+            norm TEXT NOT NULL UNIQUE,
+            display TEXT,
+            trigram_count INTEGER NOT NULL DEFAULT 0,
+            canonical_id INTEGER
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_customer_names_canonical ON customer_names(canonical_id)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS customer_trigrams (
+            trigram TEXT NOT NULL,
+            name_id INTEGER NOT NULL,
+            PRIMARY KEY (trigram, name_id)
+        ) WITHOUT ROWID
+    ''')
+    _add_missing_columns(cur, 'jobs', [('customer_id', 'INTEGER')])
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_customer ON jobs(customer_id, date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_customer_pending ON jobs(id) WHERE customer_id IS NULL")
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS jobs_customer_au AFTER UPDATE OF name ON jobs BEGIN
+            UPDATE jobs SET customer_id = NULL WHERE id = new.id;
+        END
+    ''')
+    index_customers(cur)
+
+
+def migration_job_change_indexes(cur):
+    # /api/jobs?updated_since= filters on either timestamp
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs(updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_stage_updated_at ON jobs(stage_updated_at)")
+
+
+def migration_change_feed(cur):
+    # AUTOINCREMENT so a seq is never handed out twice, even after compaction deletes the newest rows
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_changes_row ON changes(tbl, row_id)")
+    # horizon: clients that synced to below it must start again (see restart_change_feed);
+    # compacted: the log holds one change per row up to this seq
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS change_feed (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            horizon INTEGER NOT NULL,
+            compacted INTEGER NOT NULL
+        )
+    ''')
+    cur.execute("INSERT OR IGNORE INTO change_feed (id, horizon, compacted) VALUES (1, 0, 0)")
+    for table, fields in CHANGE_FEED_TABLES.items():
+        watched = ', '.join(f for f in fields if f != 'id')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS changes_{table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO changes (tbl, row_id) VALUES ('{table}', new.id);
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS changes_{table}_au AFTER UPDATE OF {watched} ON {table} BEGIN
+                INSERT INTO changes (tbl, row_id) VALUES ('{table}', new.id);
+            END
+        ''')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS changes_{table}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO changes (tbl, row_id, deleted) VALUES ('{table}', old.id, 1);
+            END
+        ''')
+    seed_changes(cur)
+
+
+def seed_changes(cur):
+    """Log an upsert for every row already in the CHANGE_FEED_TABLES: where every replica starts from."""
+    for table in CHANGE_FEED_TABLES:
+        cur.execute(f"INSERT INTO changes (tbl, row_id) SELECT '{table}', id FROM {table} ORDER BY id")
+    cur.execute('UPDATE change_feed SET compacted = (SELECT coalesce(max(seq), 0) FROM changes)')
+
+
+def migration_photo_uploads(cur):
+    # sha256 is what the client declared, if anything; it is checked at finalize
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS photo_uploads (
+            id TEXT PRIMARY KEY,
+            job_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT,
+            created_by INTEGER,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_uploads_created ON photo_uploads(created_at)")
+
+
+# (version, name, function). Append only: never renumber or edit an applied migration.
+MIGRATIONS = [
+    (1, 'base schema', migration_base_schema),
+    (2, 'jobs year/month columns and date facets', init_date_facets),
+    (3, 'jobs full-text index', init_fts),
+    (4, 'secondary indexes', migration_secondary_indexes),
+    (5, 'photo variant columns', migration_photo_variants),
+    (6, 'content-addressed photo store', migration_blob_store),
+    (7, 'stage analytics rollups', migration_stage_rollups),
+    (8, 'deferred full-text indexing for bulk loads', migration_fts_bulk_load),
+    (9, 'backup run statistics', migration_backup_engine),
+    (10, 'customer name trigram index', migration_customer_index),
+    (11, 'job change-time indexes', migration_job_change_indexes),
+    (12, 'change feed for delta sync', migration_change_feed),
+    (13, 'resumable photo uploads', migration_photo_uploads),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, verbose=False):
+    """Apply pending migrations, each in its own transaction. Returns [(version, name, seconds)].
+
+    A migration may return a callable; it runs after that migration has committed
+    (for filesystem work that must not happen if the transaction rolls back).
+    """
+    applied = []
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return applied
+    for version, name, func in MIGRATIONS:
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock in case another process got here first
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            after_commit = func(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if callable(after_commit):
+            after_commit()
+        elapsed = time.perf_counter() - started
+        applied.append((version, name, elapsed))
+        if verbose:
+            print(f"  applied {version:03d} {name} in {elapsed * 1000:.1f} ms")
+    return applied
+
+
+def migration_status(conn):
+    current = schema_version(conn)
+    return [(version, name, version <= current) for version, name, func in MIGRATIONS]
+
+
+def init_db():
+    conn = get_db()
+    migrate(conn)
     conn.close()
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    backfill_customer_index()
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['BLOB_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['VARIANT_FOLDER'], exist_ok=True)
 
 def allowed_file(fn):
     return '.' in fn and fn.rsplit('.', 1)[1].lower() in ALLOWED_EXT
 
+_background_pool = None
+_background_pool_lock = threading.Lock()
+
+def background_pool():
+    global _background_pool
+    with _background_pool_lock:
+        if _background_pool is None:
+            _background_pool = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='background')
+        return _background_pool
+
+def shutdown_background_pool(wait=True):
+    global _background_pool
+    with _background_pool_lock:
+        pool, _background_pool = _background_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+def blob_path(sha256):
+    return os.path.join(app.config['BLOB_FOLDER'], sha256[:2], sha256[2:4], sha256)
+
+def variant_format():
+    if Image is not None and pil_features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+def variant_path(sha256, kind):
+    return os.path.join(app.config['VARIANT_FOLDER'], sha256[:2], f"{sha256}_{kind}.{variant_format()[1]}")
+
+def spool_blob(stream):
+    """Copy a stream to a temp file in the blob store, hashing as it goes. Returns (tmp_path, sha256, size)."""
+    tmp_dir = os.path.join(app.config['BLOB_FOLDER'], 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return tmp, digest.hexdigest(), size
+
+def _register_blob(cur, sha256, size):
+    # Takes the write lock, so placing the file below cannot race collect_blobs()
+    cur.execute(
+        'INSERT INTO blobs (sha256, size, ref_count, created_at) VALUES (?, ?, 0, ?) ON CONFLICT (sha256) DO NOTHING',
+        (sha256, size, datetime.datetime.now().isoformat()),
+    )
+    dest = blob_path(sha256)
+    if os.path.exists(dest):
+        return dest, False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    return dest, True
+
+def commit_blob(cur, tmp, sha256, size):
+    """Move a spooled file into the store, or drop it if those bytes are already stored.
+
+    The file is in place before cur's transaction commits; if that rolls back,
+    sweep_blob_store() later removes the file the blobs row was to describe.
+    """
+    dest, missing = _register_blob(cur, sha256, size)
+    if missing:
+        os.replace(tmp, dest)
+    else:
+        os.remove(tmp)
+
+def import_blob_file(cur, src):
+    """Add an existing file to the store without moving it; hard-linked when possible."""
+    digest = hashlib.sha256()
+    with open(src, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    sha256 = digest.hexdigest()
+    dest, missing = _register_blob(cur, sha256, os.path.getsize(src))
+    if missing:
+        try:
+            os.link(src, dest)
+        except OSError:
+            tmp = dest + '.tmp'
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+    return sha256
+
+def stamped_photo_name(filename):
+    base, ext = os.path.splitext(secure_filename(filename))
+    stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    return f"{base}_{stamp}{ext}"
+
+def save_job_photos(cur, job_id, files):
+    """Store uploaded photos for a job (deduplicated by content); returns the new photo ids."""
+    spooled = []
+    try:
+        for f in files:
+            if f and f.filename and allowed_file(f.filename) and len(spooled) < MAX_PER_JOB:
+                spooled.append((stamped_photo_name(f.filename),) + spool_blob(f.stream))
+        photo_ids = []
+        while spooled:
+            fn, tmp, sha256, size = spooled.pop(0)
+            commit_blob(cur, tmp, sha256, size)
+            cur.execute(
+                'INSERT INTO photos (job_id, filename, uploaded_at, variants_status, sha256) VALUES (?, ?, ?, ?, ?)',
+                (job_id, fn, datetime.datetime.now().isoformat(), 'pending', sha256),
+            )
+            photo_ids.append(cur.lastrowid)
+        return photo_ids
+    finally:
+        for fn, tmp, sha256, size in spooled:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+def upload_part_path(upload_id):
+    """Where a resumable upload's bytes collect: next to spool_blob()'s files, so commit_blob() can move it."""
+    return os.path.join(app.config['BLOB_FOLDER'], 'tmp', f"upload-{upload_id}")
+
+
+class UploadDigests:
+    """Running sha256 of each resumable upload, so chunks are hashed as they arrive.
+
+    Also hands out one lock per upload: chunks and the finalize of one upload never
+    overlap, while different uploads (for the same job or not) proceed in parallel.
+    The hash state lives in memory only; after a restart, or a chunk that failed
+    half-written, it is rebuilt from the part file on the next use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._digests = {}  # upload id -> (bytes hashed, hashlib object)
+
+    def lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def digest(self, upload_id, path):
+        """The hash of the part file as it is now. Call with the upload's lock held."""
+        size = os.path.getsize(path)
+        hashed, digest = self._digests.get(upload_id, (0, None))
+        if digest is None or hashed != size:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+                    digest.update(chunk)
+        self._digests[upload_id] = (size, digest)
+        return digest
+
+    def advance(self, upload_id, size, digest):
+        self._digests[upload_id] = (size, digest)
+
+    def forget(self, upload_id):
+        with self._lock:
+            self._locks.pop(upload_id, None)
+            self._digests.pop(upload_id, None)
+
+    def snapshot(self):
+        with self._lock:
+            return {'open': len(self._locks), 'hashing': len(self._digests)}
+
+upload_digests = UploadDigests()
+
+def discard_upload(upload_id, conn=None):
+    """Forget an upload and delete its part file."""
+    own = conn is None
+    conn = conn or get_db()
+    conn.execute('DELETE FROM photo_uploads WHERE id = ?', (upload_id,))
+    if own:
+        conn.commit()
+        conn.close()
+    upload_digests.forget(upload_id)
+    path = upload_part_path(upload_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+def expire_uploads(hours=None):
+    """Drop uploads started more than hours ago and never finalized. Returns how many."""
+    hours = UPLOAD_EXPIRY_HOURS if hours is None else hours
+    cutoff = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
+    conn = get_db()
+    stale = [row['id'] for row in conn.execute('SELECT id FROM photo_uploads WHERE created_at < ?', (cutoff,))]
+    for upload_id in stale:
+        with upload_digests.lock(upload_id):
+            discard_upload(upload_id, conn)
+    conn.commit()
+    conn.close()
+    return len(stale)
+
+def collect_blobs():
+    """Delete blobs no photo references any more, together with their variants."""
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute('SELECT sha256 FROM blobs WHERE ref_count <= 0').fetchall()
+        for row in rows:
+            paths = [blob_path(row['sha256'])] + [variant_path(row['sha256'], kind) for kind in VARIANT_SIZES]
+            for path in paths:
+                if os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except Exception as e:
+                        print('could not delete blob file', e)
+        conn.execute('DELETE FROM blobs WHERE ref_count <= 0')
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def sweep_blob_store(grace_hours=None):
+    """Delete store files that have no blobs row, and stray spool files. Returns how many.
+
+    Such files are left when a transaction that placed a blob rolls back. Each
+    folder is checked under the write lock, like collect_blobs(), and only files
+    older than grace_hours go, so blobs of transactions still in flight are safe.
+    """
+    grace_hours = BLOB_SWEEP_GRACE_HOURS if grace_hours is None else grace_hours
+    cutoff = time.time() - grace_hours * 3600
+    root = app.config['BLOB_FOLDER']
+    removed = 0
+    tmp_dir = os.path.join(root, 'tmp')
+    if os.path.isdir(tmp_dir):
+        # Resumable upload parts are expire_uploads()'s business
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            if not name.startswith('upload-') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    conn = get_db()
+    try:
+        for folder, dirs, names in os.walk(root):
+            if folder == tmp_dir:
+                dirs[:] = []
+                continue
+            old = [n for n in names if os.path.getmtime(os.path.join(folder, n)) < cutoff]
+            if not old:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                known = {r['sha256'] for r in conn.execute(
+                    f"SELECT sha256 FROM blobs WHERE sha256 IN ({', '.join('?' * len(old))})", old)}
+                for name in old:
+                    if name not in known:
+                        os.remove(os.path.join(folder, name))
+                        removed += 1
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+    return removed
+
+def schedule_blob_gc():
+    return background_pool().submit(collect_blobs)
+
+def render_variants(src, sha256):
+    """Write every VARIANT_SIZES kind of src next to the other variants of sha256; returns {kind: filename}."""
+    fmt, _ = variant_format()
+    names = {}
+    sizes = sorted(VARIANT_SIZES.items(), key=lambda kv: kv[1], reverse=True)
+    with Image.open(src) as im:
+        # Let the JPEG decoder downscale while reading; far cheaper than full-size decode
+        im.draft('RGB', sizes[0][1])
+        img = ImageOps.exif_transpose(im)
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA')
+        # Largest first, each smaller kind is resized from the previous one
+        for kind, size in sizes:
+            img = img.copy()
+            img.thumbnail(size)
+            path = variant_path(sha256, kind)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Two photos with the same bytes may be rendered at once: keep temp names apart
+            tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            img.save(tmp, fmt, quality=VARIANT_QUALITY)
+            os.replace(tmp, path)
+            names[kind] = os.path.basename(path)
+    return names
+
+def build_photo_variants(photo_id):
+    """Generate thumb/preview files for one photo and record them. Runs on the background pool."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT sha256 FROM photos WHERE id = ?', (photo_id,))
+        row = cur.fetchone()
+        if not row or not row['sha256']:
+            return False
+        sha256 = row['sha256']
+        paths = {kind: variant_path(sha256, kind) for kind in VARIANT_SIZES}
+        try:
+            if all(os.path.exists(path) for path in paths.values()):
+                # Same bytes were uploaded before: reuse their variants
+                names = {kind: os.path.basename(path) for kind, path in paths.items()}
+            else:
+                names = render_variants(blob_path(sha256), sha256)
+            status = 'ready'
+        except Exception as e:
+            print('could not build photo variants', photo_id, e)
+            names = {}
+            status = 'failed'
+        cur.execute(
+            'UPDATE photos SET thumb_filename = ?, preview_filename = ?, variants_status = ? WHERE id = ?',
+            (names.get('thumb'), names.get('preview'), status, photo_id),
+        )
+        conn.commit()
+        return status == 'ready'
+    finally:
+        conn.close()
+
+def queue_photo_variants(photo_ids):
+    """Hand freshly saved photos to the background pool; returns the futures."""
+    if Image is None:
+        return []
+    pool = background_pool()
+    return [pool.submit(build_photo_variants, photo_id) for photo_id in photo_ids]
+
 def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -187,6 +2000,37 @@ def login_required(f):
         return f(*args, **kwargs)
     return wrapper
 
+def cached_page(f):
+    """Serve a GET page from page_cache while nothing has been written, with ETag/304.
+
+    Keyed on the path, the non-empty query args in sorted order and the
+    session's user (the layout shows their name and role-dependent links).
+    Requests with pending flash messages are rendered fresh and not stored.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or PAGE_CACHE_MAX_BYTES <= 0 or session.get('_flashes'):
+            return f(*args, **kwargs)
+        key = (request.path, tuple(sorted((k, v) for k, v in request.args.items(multi=True) if v)),
+               session.get('user_id'), session.get('role'), session.get('full_name'))
+        version = page_cache.version()
+        entry = page_cache.get(key, version)
+        if entry is None:
+            response = app.make_response(f(*args, **kwargs))
+            # Don't keep a page that showed flash messages, or drop ones it left pending
+            if (response.status_code != 200 or response.is_streamed
+                    or session.get('_flashes') or get_flashed_messages()):
+                return response
+            entry = page_cache.put(key, version, response.get_data(), response.content_type)
+        response = Response(entry[1], content_type=entry[2])
+        response.set_etag(entry[3])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.make_conditional(request)
+        if response.status_code == 304:
+            page_cache.not_modified()
+        return response
+    return wrapper
+
 def role_required(*roles):
     def decorator(f):
         @wraps(f)
@@ -200,16 +2044,337 @@ def role_required(*roles):
         return wrapper
     return decorator
 
-def log_action(user_id, action, job_id=None, job_no=None, details=None):
+AUDIT_INSERT = "INSERT INTO activity_log (user_id, action, job_id, job_no, details, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+class AuditWriter:
+    """Writer thread that group-commits queued activity_log rows.
+
+    A batch is written once AUDIT_BATCH_SIZE rows are waiting or AUDIT_FLUSH_INTERVAL
+    has passed since the first one, whichever comes first.
+    """
+
+    def __init__(self, batch_size=AUDIT_BATCH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+        }
+        self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self.thread.start()
+
+    def put(self, row):
+        with self.cond:
+            if self.stopped:
+                # Too late for the writer thread: write it here rather than lose it
+                self.stats['enqueued'] += 1
+                self._write([row])
+                return
+            self.stats['enqueued'] += 1
+        self.queue.put(row)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        written = 0
+        conn = get_db()
+        for attempt in range(3):
+            try:
+                conn.executemany(AUDIT_INSERT, batch)
+                conn.commit()
+                written = len(batch)
+                break
+            except sqlite3.Error as e:
+                conn.rollback()
+                print('audit log write failed, retrying', e)
+                time.sleep(0.05 * (attempt + 1))
+        conn.close()
+        if written < len(batch):
+            print('audit log entries lost', batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.cond:
+            st = self.stats
+            st['written'] += written
+            st['failed'] += len(batch) - written
+            st['batches'] += 1
+            st['max_batch'] = max(st['max_batch'], len(batch))
+            st['last_flush_ms'] = round(elapsed_ms, 3)
+            st['max_flush_ms'] = round(max(st['max_flush_ms'], elapsed_ms), 3)
+            self.cond.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is written. Returns False on timeout."""
+        with self.cond:
+            target = self.stats['enqueued']
+            return self.cond.wait_for(lambda: self.stats['written'] + self.stats['failed'] >= target, timeout)
+
+    def stop(self, timeout=5.0):
+        with self.cond:
+            if self.stopped:
+                return
+            self.stopped = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def snapshot(self):
+        with self.cond:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['pending'] = stats['enqueued'] - stats['written'] - stats['failed']
+        return stats
+
+
+_audit_writer = None
+_audit_writer_lock = threading.Lock()
+
+def audit_writer():
+    global _audit_writer
+    with _audit_writer_lock:
+        if _audit_writer is None:
+            _audit_writer = AuditWriter()
+            # Flush on interpreter shutdown so queued entries are not lost
+            atexit.register(_audit_writer.stop)
+        return _audit_writer
+
+def flush_audit_log(timeout=5.0):
+    return _audit_writer.flush(timeout) if _audit_writer is not None else True
+
+def audit_stats():
+    stats = _audit_writer.snapshot() if _audit_writer is not None else {}
+    stats['mode'] = AUDIT_MODE
+    return stats
+
+def _write_audit(rows, conn):
+    if AUDIT_MODE == 'async':
+        if conn is not None and conn.in_transaction:
+            # Handed to the writer by conn.commit(), dropped by its rollback
+            conn.pending_audit = (conn.pending_audit or []) + rows
+            return
+        writer = audit_writer()
+        for row in rows:
+            writer.put(row)
+        return
+    # 'transaction' and 'sync' both join an open transaction on this thread's connection
+    # (committing it here would commit the handler's half-done work); 'sync' otherwise
+    # commits the entry on the spot
+    own = conn if conn is not None else get_db()
+    joined = own.in_transaction
+    own.executemany(AUDIT_INSERT, rows)
+    if not joined and (AUDIT_MODE == 'sync' or conn is None):
+        own.commit()
+    if conn is None:
+        own.close()
+
+def log_actions(entries, conn=None):
+    """Bulk log_action(): entries are (user_id, action, job_id, job_no, details) tuples."""
+    now = datetime.datetime.now().isoformat()
+    _write_audit([tuple(entry) + (now,) for entry in entries], conn)
+
+def log_action(user_id, action, job_id=None, job_no=None, details=None, conn=None):
+    """Record an audit entry.
+
+    Given the handler's conn inside its transaction, the entry only lands if that
+    transaction commits: AUDIT_MODE 'async' queues it for the batch writer once
+    conn.commit() succeeds, 'transaction' and 'sync' insert it on conn to commit
+    (or roll back) with the handler's own work. Outside a transaction it is queued
+    ('async') or committed on the spot.
+    """
+    _write_audit([(user_id, action, job_id, job_no, details, datetime.datetime.now().isoformat())], conn)
+
+
+class StreamSubscriber:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lagged = False
+
+
+class EventBroker:
+    """In-process fan-out of events to stream subscribers, with a replay buffer.
+
+    Each subscriber has a bounded queue; one that falls behind is cut loose and
+    resumes from its Last-Event-ID, replayed from the last TRACKER_STREAM_HISTORY
+    events. Event ids are '<boot>-<n>' so ids from a previous process are detected.
+    """
+
+    def __init__(self, history=TRACKER_STREAM_HISTORY, buffer=TRACKER_STREAM_BUFFER):
+        self.lock = threading.Lock()
+        self.history = collections.deque(maxlen=history)
+        self.subscribers = set()
+        self.buffer = buffer
+        self.boot = format(int(time.time()), 'x')
+        self.seq = 0
+
+    def current_id(self):
+        with self.lock:
+            return f"{self.boot}-{self.seq}"
+
+    def publish(self, event, data):
+        payload = json.dumps(data, separators=(',', ':'))
+        with self.lock:
+            self.seq += 1
+            item = (f"{self.boot}-{self.seq}", self.seq, event, payload)
+            self.history.append(item)
+            for sub in list(self.subscribers):
+                try:
+                    sub.queue.put_nowait(item)
+                except queue.Full:
+                    sub.lagged = True
+                    self.subscribers.discard(sub)
+
+    def subscribe(self, last_event_id=None):
+        """Returns (subscriber, replay). replay is None when the client must reload instead."""
+        sub = StreamSubscriber(self.buffer)
+        replay = []
+        with self.lock:
+            if last_event_id:
+                boot, _, seq = last_event_id.partition('-')
+                try:
+                    seq = int(seq)
+                except ValueError:
+                    seq = -1
+                oldest = self.history[0][1] if self.history else self.seq + 1
+                if boot != self.boot or seq < 0 or seq > self.seq or seq < oldest - 1:
+                    replay = None
+                else:
+                    replay = [item for item in self.history if item[1] > seq]
+            self.subscribers.add(sub)
+        return sub, replay
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def stats(self):
+        with self.lock:
+            return {'subscribers': len(self.subscribers), 'last_id': f"{self.boot}-{self.seq}", 'history': len(self.history)}
+
+
+tracker_events = EventBroker()
+
+def format_sse(item):
+    event_id, seq, event, payload = item
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+
+def publish_job_change(job_id):
+    """Push the tracker row for a job that was just committed (or its deletion)."""
+    publish_job_changes([job_id])
+
+def publish_job_changes(job_ids):
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
     conn = get_db()
     cur = conn.cursor()
+    marks = ', '.join('?' * len(job_ids))
+    cur.execute(f"SELECT {', '.join(TRACKER_FIELDS)} FROM jobs WHERE id IN ({marks})", job_ids)
+    rows = {row['id']: row for row in cur.fetchall()}
+    conn.close()
+    for job_id in job_ids:
+        row = rows.get(job_id)
+        if row is None:
+            tracker_events.publish('delete', {'id': job_id})
+            continue
+        data = dict(row)
+        data['stage_label'] = get_stage_label(row['stage'])
+        tracker_events.publish('job', data)
+
+def histogram_percentile(counts, q, max_seconds):
+    """Approximate the q quantile (0..1) from per-bucket counts, interpolating inside the bucket."""
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for i, n in enumerate(counts):
+        if n and seen + n >= target:
+            lo = STAGE_DURATION_BOUNDS[i - 1] if i > 0 else 0
+            hi = STAGE_DURATION_BOUNDS[i] if i < len(STAGE_DURATION_BOUNDS) else max(max_seconds, lo)
+            return min(lo + (hi - lo) * (target - seen) / n, max_seconds)
+        seen += n
+    return max_seconds
+
+def stage_analytics(cur):
+    """Per-stage time-in-stage summary and WIP, read from the rollup tables only."""
+    cur.execute("SELECT * FROM stage_duration_stats")
+    stats = {row['stage']: row for row in cur.fetchall()}
+    counts = collections.defaultdict(lambda: [0] * (len(STAGE_DURATION_BOUNDS) + 1))
+    cur.execute("SELECT stage, bucket, n FROM stage_duration_buckets")
+    for row in cur.fetchall():
+        counts[row['stage']][row['bucket']] = row['n']
+    cur.execute("SELECT stage, n FROM stage_wip WHERE n > 0")
+    wip = {row['stage']: row['n'] for row in cur.fetchall()}
+
+    rows = []
+    for code, label, group in TRACKER_STAGES:
+        st = stats.get(code)
+        n = st['n'] if st else 0
+        rows.append({
+            'stage': code,
+            'label': label,
+            'group': group,
+            'completed': n,
+            'mean_seconds': st['total_seconds'] / n if n else None,
+            'median_seconds': histogram_percentile(counts[code], 0.5, st['max_seconds']) if n else None,
+            'p90_seconds': histogram_percentile(counts[code], 0.9, st['max_seconds']) if n else None,
+            'max_seconds': st['max_seconds'] if n else None,
+            'wip': wip.get(code, 0),
+        })
+    return rows
+
+def stuck_jobs(cur, hours=STUCK_AFTER_HOURS, limit=STUCK_LIMIT):
+    cutoff = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
     cur.execute(
-        "INSERT INTO activity_log (user_id, action, job_id, job_no, details, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, action, job_id, job_no, details, datetime.datetime.now().isoformat()),
+        f"SELECT id, job_no, name, stage, stage_updated_at FROM jobs "
+        f"WHERE stage IS NOT '{FINAL_STAGE}' AND stage_updated_at < ? ORDER BY stage_updated_at LIMIT ?",
+        (cutoff, limit),
     )
-    conn.commit()
-    conn.close()
+    return cur.fetchall()
 
+@app.template_filter('duration')
+def format_duration(seconds):
+    if seconds is None:
+        return '-'
+    seconds = int(seconds)
+    days, rem = divmod(seconds, 86400)
+    hours, rem = divmod(rem, 3600)
+    minutes = rem // 60
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
 
 def add_one_month(date_str: str) -> str:
     """Add one calendar month to a YYYY-MM-DD date string (clamp day)."""
@@ -236,6 +2401,600 @@ def backup_status(next_due_str: str, due_soon_days: int = 5):
         return ("due_soon", delta)
     return ("up_to_date", delta)
 
+_backup_lock = threading.Lock()
+_maintenance_scheduler = None
+_maintenance_stop = threading.Event()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_backup_manifest(dest):
+    """The backup's manifest: files maps 'files/...' paths to [size, mtime_ns, sha256]."""
+    try:
+        with open(os.path.join(dest, 'manifest.json')) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {'files': {}, 'snapshots': []}
+
+def save_backup_manifest(dest, manifest):
+    path = os.path.join(dest, 'manifest.json')
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def backup_file_roots():
+    """(manifest prefix, live folder, names are hashes) for every file folder that is backed up."""
+    return [
+        ('files/blobs', app.config['BLOB_FOLDER'], True),
+        ('files/uploads', app.config['UPLOAD_FOLDER'], False),
+        ('files/archive', app.config['ARCHIVE_FOLDER'], False),
+    ]
+
+def snapshot_database(dest_path):
+    """Copy the live database to dest_path with the online backup API, in one step.
+
+    The copy reads one consistent WAL snapshot, so writers carry on meanwhile. A
+    stepped copy would restart from the first page whenever another connection
+    commits, and on a busy archive it would never finish.
+    """
+    tmp = dest_path + '.tmp'
+    src = sqlite3.connect(DB_PATH)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst, pages=-1)
+        # A snapshot is a single self-contained file
+        dst.execute('PRAGMA journal_mode = DELETE')
+        check = dst.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    if check != 'ok':
+        os.remove(tmp)
+        raise RuntimeError(f"snapshot failed quick_check: {check}")
+    os.replace(tmp, dest_path)
+
+def sync_backup_files(src_root, dest, prefix, files, names_are_hashes=False):
+    """Copy new or changed files under src_root into dest/prefix. Returns (files, bytes) copied.
+
+    Files whose size and mtime match the manifest are skipped without reading
+    them. Nothing is deleted from the mirror: older snapshots still refer to
+    photos that have since been removed from the live store.
+    """
+    copied = copied_bytes = 0
+    if not os.path.isdir(src_root):
+        return copied, copied_bytes
+    for dirpath, dirnames, filenames in os.walk(src_root):
+        dirnames[:] = [d for d in dirnames if d != 'tmp']
+        for name in filenames:
+            if name.endswith('.tmp'):
+                continue
+            src = os.path.join(dirpath, name)
+            rel = prefix + '/' + os.path.relpath(src, src_root).replace(os.sep, '/')
+            dst = os.path.join(dest, *rel.split('/'))
+            st = os.stat(src)
+            entry = files.get(rel)
+            present = os.path.exists(dst)
+            if entry and present and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                continue
+            sha256 = name if names_are_hashes else file_sha256(src)
+            if not (entry and present and entry[2] == sha256):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(src, dst + '.tmp')
+                os.replace(dst + '.tmp', dst)
+                copied += 1
+                copied_bytes += st.st_size
+            files[rel] = [st.st_size, st.st_mtime_ns, sha256]
+    return copied, copied_bytes
+
+def prune_snapshots(dest, manifest):
+    snapshots = manifest['snapshots']
+    while len(snapshots) > BACKUP_KEEP_SNAPSHOTS:
+        old = snapshots.pop(0)
+        path = os.path.join(dest, 'db', old['file'])
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_backup(dest=None, user_id=None, backup_type='automatic'):
+    """Snapshot the database, copy new photo files and record the run in backup_log.
+
+    Returns a summary dict; raises RuntimeError if another backup is running.
+    """
+    dest = dest or app.config['BACKUP_FOLDER']
+    if not _backup_lock.acquire(blocking=False):
+        raise RuntimeError('A backup is already running')
+    try:
+        started = time.perf_counter()
+        now = datetime.datetime.now()
+        manifest = load_backup_manifest(dest)
+        os.makedirs(os.path.join(dest, 'db'), exist_ok=True)
+
+        name = f"database-{now:%Y%m%d-%H%M%S}.db"
+        taken = {e['file'] for e in manifest['snapshots']}
+        n = 1
+        while name in taken or os.path.exists(os.path.join(dest, 'db', name)):
+            n += 1
+            name = f"database-{now:%Y%m%d-%H%M%S}-{n}.db"
+        snapshot = os.path.join(dest, 'db', name)
+        snapshot_database(snapshot)
+        snapshot_size = os.path.getsize(snapshot)
+        manifest['snapshots'].append({
+            'file': name,
+            'size': snapshot_size,
+            'sha256': file_sha256(snapshot),
+            'created_at': now.isoformat(timespec='seconds'),
+        })
+        files_copied, bytes_copied = 1, snapshot_size
+        for prefix, root, names_are_hashes in backup_file_roots():
+            n, size = sync_backup_files(root, dest, prefix, manifest['files'], names_are_hashes)
+            files_copied += n
+            bytes_copied += size
+        prune_snapshots(dest, manifest)
+        save_backup_manifest(dest, manifest)
+        duration = time.perf_counter() - started
+    finally:
+        _backup_lock.release()
+
+    summary = {
+        'snapshot': name,
+        'location': dest,
+        'files_copied': files_copied,
+        'bytes_copied': bytes_copied,
+        'duration_seconds': round(duration, 3),
+        'throughput_bps': round(bytes_copied / max(duration, 1e-6)),
+    }
+    backup_date = now.strftime('%Y-%m-%d')
+    notes = (f"{files_copied} files, {bytes_copied / 1048576:.1f} MB in {duration:.1f} s "
+             f"({summary['throughput_bps'] / 1048576:.1f} MB/s)")
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO backup_log (backup_date, next_due, backup_type, backup_location, notes, created_by, created_at, "
+        "snapshot, files_copied, bytes_copied, duration_seconds, throughput_bps) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (backup_date, add_one_month(backup_date), backup_type, dest, notes, user_id, now.isoformat(),
+         name, files_copied, bytes_copied, summary['duration_seconds'], summary['throughput_bps']),
+    )
+    log_action(user_id, 'BACKUP_RUN', details=f"{name}: {notes}", conn=conn)
+    conn.commit()
+    conn.close()
+    return summary
+
+def verify_backup(dest=None, snapshot=None, deep=False):
+    """Check a snapshot (default: the newest) against the manifest.
+
+    Verifies the snapshot's hash and integrity_check, and that every photo it
+    references is in the mirror (deep also re-hashes those files).
+    Returns (manifest entry or None, list of problems).
+    """
+    dest = dest or app.config['BACKUP_FOLDER']
+    manifest = load_backup_manifest(dest)
+    entries = [e for e in manifest['snapshots'] if snapshot in (None, e['file'])]
+    if not entries:
+        return None, [f"no snapshot {snapshot} in {dest}" if snapshot else f"no snapshots in {dest}"]
+    entry = entries[-1]
+    path = os.path.join(dest, 'db', entry['file'])
+    if not os.path.exists(path):
+        return entry, [f"{entry['file']} is missing"]
+    if file_sha256(path) != entry['sha256']:
+        return entry, [f"{entry['file']} does not match its recorded hash"]
+
+    problems = []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            problems.append(f"integrity_check: {result}")
+        shas = [r[0] for r in conn.execute('SELECT DISTINCT sha256 FROM photos WHERE sha256 IS NOT NULL')]
+    finally:
+        conn.close()
+    blob_root = app.config['BLOB_FOLDER']
+    for sha256 in shas:
+        rel = 'files/blobs/' + os.path.relpath(blob_path(sha256), blob_root).replace(os.sep, '/')
+        copy = os.path.join(dest, *rel.split('/'))
+        if not os.path.exists(copy):
+            problems.append(f"photo {sha256} is not in the backup")
+        elif deep and file_sha256(copy) != sha256:
+            problems.append(f"photo {sha256} is corrupt in the backup")
+    return entry, problems
+
+def restore_backup(dest=None, snapshot=None):
+    """Put a verified snapshot back in place of the live database and copy back missing photos.
+
+    The current database is kept next to it as database.db.pre-restore-<time>.
+    Meant for the CLI with the server stopped. Returns (entry, problems, result).
+    """
+    global _fts_enabled
+    dest = dest or app.config['BACKUP_FOLDER']
+    entry, problems = verify_backup(dest, snapshot)
+    if entry is None or problems:
+        return entry, problems, None
+
+    keep = f"{DB_PATH}.pre-restore-{datetime.datetime.now():%Y%m%d-%H%M%S}"
+    close_thread_db()
+    live = sqlite3.connect(DB_PATH)
+    try:
+        seen = last_change_seq(live)
+        safety = sqlite3.connect(keep)
+        live.backup(safety)
+        safety.close()
+        src = sqlite3.connect(os.path.join(dest, 'db', entry['file']))
+        src.backup(live)
+        src.close()
+    finally:
+        live.close()
+    # Remote replicas have seen changes the snapshot never had; make them start over
+    conn = get_db()
+    migrate(conn)
+    restart_change_feed(conn, seen)
+    conn.close()
+    _fts_enabled = None
+    user_directory.invalidate()
+    page_cache.clear()
+    suggest_index.invalidate()
+
+    restored = 0
+    manifest = load_backup_manifest(dest)
+    for prefix, root, names_are_hashes in backup_file_roots():
+        for rel in manifest['files']:
+            if not rel.startswith(prefix + '/'):
+                continue
+            target = os.path.join(root, *rel[len(prefix) + 1:].split('/'))
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(os.path.join(dest, *rel.split('/')), target)
+                restored += 1
+    return entry, [], {'safety_copy': keep, 'files_restored': restored}
+
+def backup_due():
+    conn = get_db()
+    row = conn.execute("SELECT max(created_at) FROM backup_log WHERE backup_type = 'automatic'").fetchone()
+    conn.close()
+    if not row[0]:
+        return True
+    last = datetime.datetime.fromisoformat(row[0])
+    return datetime.datetime.now() - last >= datetime.timedelta(hours=BACKUP_INTERVAL_HOURS)
+
+def compact_changes():
+    """Drop changes superseded by a newer one for the same row. Returns the number removed.
+
+    What is left is one change per row: the latest upsert of every live row and a
+    tombstone for every deleted one, so a replay from since=0 still rebuilds the
+    tables and a client resuming from any seq misses nothing.
+    """
+    conn = get_db()
+    cur = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        compacted = cur.execute('SELECT compacted FROM change_feed').fetchone()[0]
+        top = cur.execute('SELECT coalesce(max(seq), 0) FROM changes').fetchone()[0]
+        # Only changes logged since the last run can supersede anything
+        cur.execute(
+            'DELETE FROM changes WHERE seq IN (SELECT o.seq FROM changes n '
+            'JOIN changes o ON o.tbl = n.tbl AND o.row_id = n.row_id AND o.seq < n.seq '
+            'WHERE n.seq > ? AND n.seq <= ?)',
+            (compacted, top),
+        )
+        removed = cur.rowcount
+        cur.execute('UPDATE change_feed SET compacted = ?', (top,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return removed
+
+def restart_change_feed(conn, seq):
+    """Log the whole database again with seqs after seq, and reset clients that synced to seq or below.
+
+    For a restored database, whose own log is behind what clients have already seen.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM changes')
+        if not cur.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'changes'", (seq,)).rowcount:
+            cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('changes', ?)", (seq,))
+        cur.execute("UPDATE change_feed SET horizon = (SELECT seq FROM sqlite_sequence WHERE name = 'changes') + 1")
+        seed_changes(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def last_change_seq(conn):
+    """The newest seq ever handed out (0 before the change feed exists)."""
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def run_maintenance():
+    """One pass of periodic upkeep; each step logs and swallows its own failure.
+
+    Archives activity months that have left the retention window (unless
+    ACTIVITY_RETENTION_MONTHS is 0), indexes customer names written by other
+    tools, compacts the change log, drops abandoned uploads and orphaned store
+    files, then runs an automatic backup whenever the last one is
+    BACKUP_INTERVAL_HOURS old (unless that is 0).
+    """
+    try:
+        if ACTIVITY_RETENTION_MONTHS > 0:
+            moved = archive_activity_log()
+            if moved:
+                print('archived activity', moved)
+    except Exception as e:
+        print('activity archival failed', e)
+    try:
+        indexed = backfill_customer_index()
+        if indexed:
+            print('indexed customer names of', indexed, 'jobs')
+    except Exception as e:
+        print('customer index backfill failed', e)
+    try:
+        removed = compact_changes()
+        if removed:
+            print('compacted change log', removed, 'rows')
+    except Exception as e:
+        print('change log compaction failed', e)
+    try:
+        expired = expire_uploads()
+        if expired:
+            print('expired unfinished uploads', expired)
+    except Exception as e:
+        print('upload expiry failed', e)
+    try:
+        swept = sweep_blob_store()
+        if swept:
+            print('removed unreferenced store files', swept)
+    except Exception as e:
+        print('blob store sweep failed', e)
+    try:
+        if BACKUP_INTERVAL_HOURS > 0 and backup_due():
+            summary = run_backup()
+            print('automatic backup', summary['snapshot'], summary['bytes_copied'], 'bytes')
+    except Exception as e:
+        print('automatic backup failed', e)
+
+def start_maintenance_scheduler():
+    """Background thread that calls run_maintenance() every BACKUP_CHECK_SECONDS.
+
+    It always runs: change-log compaction, upload expiry, the store sweep and
+    the customer index backfill depend on it even with backups and archival off.
+    """
+    global _maintenance_scheduler
+    if _maintenance_scheduler is not None:
+        return
+
+    def loop():
+        while not _maintenance_stop.is_set():
+            run_maintenance()
+            _maintenance_stop.wait(BACKUP_CHECK_SECONDS)
+
+    _maintenance_scheduler = threading.Thread(target=loop, name='maintenance', daemon=True)
+    _maintenance_scheduler.start()
+    atexit.register(_maintenance_stop.set)
+
+def build_job_filters(args, cur=None):
+    """Translate the dashboard q/mode/year/month args into a WHERE clause for jobs.
+
+    Returns (where, params, filters, match). For keyword searches on an FTS5
+    build, match is the jobs_fts query and is not part of where; use
+    search_jobs_page() or match_clause() to apply it.
+    """
+    q = args.get('q', '').strip()
+    mode = args.get('mode', '')
+    year = args.get('year', '').strip()
+    month = args.get('month', '').strip()
+
+    where = "1=1"
+    params = []
+    if year:
+        where += " AND year = ?"
+        params.append(year)
+    if month:
+        if len(month) == 1:
+            month = f"0{month}"
+        where += " AND month = ?"
+        params.append(month)
+
+    if q and mode == 'job':
+        where += " AND job_no LIKE ?"
+        params.append(f"%{q}%")
+    elif q and mode == 'customer':
+        # Substring matches plus every spelling grouped with the customer the text normalizes to
+        where += (" AND (name LIKE ? OR customer_id IN (SELECT id FROM customer_names WHERE canonical_id IN "
+                  "(SELECT canonical_id FROM customer_names WHERE norm = ?)))")
+        params.extend([f"%{q}%", customer_norm(q)])
+    elif q and mode == 'keyword':
+        match = fts_query(q) if cur is not None and fts_available(cur) else None
+        if match:
+            return where, params, (q, mode, year, month), match
+        like = f"%{q}%"
+        where += " AND (name LIKE ? OR note LIKE ? OR paper LIKE ? OR job_no LIKE ?)"
+        params.extend([like, like, like, like])
+    return where, params, (q, mode, year, month), None
+
+def match_clause(where, params, match):
+    """Fold an FTS match into a plain jobs WHERE clause (for counts and exports)."""
+    if not match:
+        return where, params
+    return where + " AND id IN (SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH ?)", list(params) + [match]
+
+def _pack_cursor(values):
+    raw = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _unpack_cursor(token):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+
+def encode_cursor(row):
+    return _pack_cursor([row['date'], row['id']])
+
+def decode_cursor(token):
+    """Return (date, id) from a page cursor, or None if missing/garbled."""
+    values = _unpack_cursor(token)
+    if values is None:
+        return None
+    date, row_id = values
+    if date is not None and not isinstance(date, str):
+        return None
+    try:
+        return date, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def decode_rank_cursor(token):
+    values = _unpack_cursor(token)
+    if values is None:
+        return None
+    try:
+        return float(values[0]), int(values[1])
+    except (ValueError, TypeError):
+        return None
+
+def get_page_size():
+    try:
+        n = int(request.args.get('per_page', PAGE_SIZE))
+    except ValueError:
+        n = PAGE_SIZE
+    return max(1, min(n, MAX_PAGE_SIZE))
+
+def page_url(**cursor):
+    """URL for the current listing with the same filters and the given after/before cursor."""
+    cursor = {k: v for k, v in cursor.items() if v}
+    if not cursor:
+        return None
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    return url_for(request.endpoint, **args)
+
+def fetch_jobs_page(cur, where, params, per_page, columns='*'):
+    """Keyset page over jobs ordered by (date DESC, id DESC).
+
+    Uses the after/before cursors from the query string and returns
+    (rows, next_cursor, prev_cursor). NULL dates sort last, as in ORDER BY.
+    """
+    after = decode_cursor(request.args.get('after'))
+    before = None if after else decode_cursor(request.args.get('before'))
+    query = f"SELECT {columns} FROM jobs WHERE {where}"
+    params = list(params)
+    order = "date DESC, id DESC"
+    if after:
+        date, row_id = after
+        if date is None:
+            query += " AND date IS NULL AND id < ?"
+            params.append(row_id)
+        else:
+            query += " AND (date < ? OR (date = ? AND id < ?) OR date IS NULL)"
+            params.extend([date, date, row_id])
+    elif before:
+        date, row_id = before
+        if date is None:
+            query += " AND (date IS NOT NULL OR id > ?)"
+            params.append(row_id)
+        else:
+            query += " AND (date > ? OR (date = ? AND id > ?))"
+            params.extend([date, date, row_id])
+        order = "date ASC, id ASC"
+    query += f" ORDER BY {order} LIMIT ?"
+    params.append(per_page + 1)
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, bool(after)
+    next_cursor = encode_cursor(rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+def highlight_snippet(text):
+    """Escape an FTS snippet and turn its \x02/\x03 markers into <mark> tags."""
+    if not text:
+        return None
+    return escape(text).replace('\x02', Markup('<mark>')).replace('\x03', Markup('</mark>'))
+
+def search_jobs_page(cur, match, where, params, per_page):
+    """Relevance-ranked keyword search page (bm25), keyset-paginated on (score, id).
+
+    Returns (rows, snippets, next_cursor, prev_cursor); snippets maps job id to
+    highlighted markup.
+    """
+    after = decode_rank_cursor(request.args.get('after'))
+    before = None if after else decode_rank_cursor(request.args.get('before'))
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    query = (
+        "SELECT jobs.*, f.score, f.snippet FROM ("
+        f"SELECT rowid, bm25(jobs_fts, {weights}) AS score, "
+        f"snippet(jobs_fts, -1, char(2), char(3), '...', {SNIPPET_TOKENS}) AS snippet "
+        "FROM jobs_fts WHERE jobs_fts MATCH ?"
+        f") f JOIN jobs ON jobs.id = f.rowid WHERE {where}"
+    )
+    params = [match] + list(params)
+    order = "f.score ASC, jobs.id ASC"
+    if after:
+        query += " AND (f.score > ? OR (f.score = ? AND jobs.id > ?))"
+        params.extend([after[0], after[0], after[1]])
+    elif before:
+        query += " AND (f.score < ? OR (f.score = ? AND jobs.id < ?))"
+        params.extend([before[0], before[0], before[1]])
+        order = "f.score DESC, jobs.id DESC"
+    query += f" ORDER BY {order} LIMIT ?"
+    params.append(per_page + 1)
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, bool(after)
+    next_cursor = _pack_cursor([rows[-1]['score'], rows[-1]['id']]) if rows and has_next else None
+    prev_cursor = _pack_cursor([rows[0]['score'], rows[0]['id']]) if rows and has_prev else None
+    snippets = {row['id']: highlight_snippet(row['snippet']) for row in rows}
+    return rows, snippets, next_cursor, prev_cursor
+
+def estimated_rows(cur, table):
+    """Row estimate from sqlite_stat1 (written by ANALYZE / PRAGMA optimize), if any."""
+    try:
+        cur.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,))
+    except sqlite3.OperationalError:
+        return None
+    row = cur.fetchone()
+    if not row or not row[0]:
+        return None
+    try:
+        return int(row[0].split()[0])
+    except ValueError:
+        return None
+
+def approx_job_count(cur, where, params):
+    """Return (count, exact). Unfiltered uses table stats; filtered counts stop at COUNT_CAP."""
+    if where == "1=1":
+        est = estimated_rows(cur, 'jobs')
+        if est is not None:
+            return est, False
+    cur.execute(f"SELECT count(*) FROM (SELECT 1 FROM jobs WHERE {where} LIMIT ?)", list(params) + [COUNT_CAP + 1])
+    n = cur.fetchone()[0]
+    return min(n, COUNT_CAP), n <= COUNT_CAP
+
 @app.context_processor
 def inject_user():
     return {
@@ -275,54 +3034,43 @@ def logout():
 
 @app.route('/')
 @login_required
+@cached_page
 def index():
-    q = request.args.get('q', '').strip()
-    mode = request.args.get('mode', '')
-    year = request.args.get('year', '').strip()
-    month = request.args.get('month', '').strip()
+    per_page = get_page_size()
 
     conn = get_db()
     cur = conn.cursor()
-    query = "SELECT * FROM jobs WHERE 1=1"
-    params = []
-    if year:
-        query += " AND substr(date,1,4) = ?"
-        params.append(year)
-    if month:
-        if len(month) == 1:
-            month = f"0{month}"
-        query += " AND substr(date,6,2) = ?"
-        params.append(month)
-
-    if q and mode == 'job':
-        query += " AND job_no LIKE ?"
-        params.append(f"%{q}%")
-    elif q and mode == 'customer':
-        query += " AND name LIKE ?"
-        params.append(f"%{q}%")
-    elif q and mode == 'keyword':
-        like = f"%{q}%"
-        query += " AND (name LIKE ? OR note LIKE ? OR paper LIKE ? OR job_no LIKE ?)"
-        params.extend([like, like, like, like])
+    where, params, filters, match = build_job_filters(request.args, cur)
+    q, mode, year, month = filters
+    snippets = {}
+    if match:
+        jobs, snippets, next_cursor, prev_cursor = search_jobs_page(cur, match, where, params, per_page)
+    else:
+        jobs, next_cursor, prev_cursor = fetch_jobs_page(cur, where, params, per_page)
 
-    query += " ORDER BY date DESC, id DESC"
-    cur.execute(query, params)
-    jobs = cur.fetchall()
+    total_count = total_exact = None
+    if request.args.get('count') == '1':
+        total_count, total_exact = approx_job_count(cur, *match_clause(where, params, match))
 
-    cur.execute("SELECT DISTINCT substr(date,1,4) AS y FROM jobs WHERE date IS NOT NULL AND date != '' ORDER BY y DESC")
-    years = [row['y'] for row in cur.fetchall() if row['y']]
+    year_counts, month_counts = date_facets(cur, year)
+    years = [y for y, n in year_counts]
 
     
     # Backup status (monthly)
-    cur.execute("SELECT b.*, u.full_name FROM backup_log b LEFT JOIN users u ON b.created_by = u.id ORDER BY b.backup_date DESC, b.id DESC LIMIT 1")
+    cur.execute("SELECT * FROM backup_log ORDER BY backup_date DESC, id DESC LIMIT 1")
     last_backup = cur.fetchone()
+    if last_backup:
+        last_backup = with_user_names([last_backup], user_directory.get(conn), 'created_by')[0]
     backup_status_key = None
     backup_days_until = None
     if last_backup and last_backup['next_due']:
         backup_status_key, backup_days_until = backup_status(last_backup['next_due'], due_soon_days=5)
 
     conn.close()
-    return render_template('dashboard.html', jobs=jobs, q=q, mode=mode, sel_year=year, sel_month=month, years=years, last_backup=last_backup, backup_status_key=backup_status_key, backup_days_until=backup_days_until)
+    return render_template('dashboard.html', jobs=jobs, q=q, mode=mode, sel_year=year, sel_month=month, years=years, last_backup=last_backup, backup_status_key=backup_status_key, backup_days_until=backup_days_until,
+                           per_page=per_page, next_url=page_url(after=next_cursor), prev_url=page_url(before=prev_cursor),
+                           total_count=total_count, total_exact=total_exact, snippets=snippets,
+                           year_counts=year_counts, month_counts=month_counts)
 
 @app.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -345,8 +3093,13 @@ def add():
         pre_plate = 1 if request.form.get('pre_plate') == 'on' else 0
         pre_die = 1 if request.form.get('pre_die') == 'on' else 0
         pre_paper = 1 if request.form.get('pre_paper') == 'on' else 0
+        # A page script posting the form without photos gets JSON back, then sends the
+        # photos through the resumable uploads (see api_upload_start)
+        as_json = request.accept_mimetypes.best == 'application/json'
 
         if not job_no or not name:
+            if as_json:
+                return jsonify({'error': 'Job number and customer name are required'}), 400
             flash('Job number and customer name are required', 'warning')
             return redirect(url_for('add'))
 
@@ -376,8 +3129,10 @@ def add():
                 ),
             )
         except sqlite3.IntegrityError:
-            flash('Job number already exists. Use edit to modify.', 'danger')
             conn.close()
+            if as_json:
+                return jsonify({'error': 'Job number already exists'}), 409
+            flash('Job number already exists. Use edit to modify.', 'danger')
             return redirect(url_for('add'))
 
         job_id = cur.lastrowid
@@ -386,30 +3141,21 @@ def add():
             'INSERT INTO stage_history (job_id, stage, updated_by, updated_at, pre_plate, pre_die, pre_paper) VALUES (?, ?, ?, ?, ?, ?, ?)',
             (job_id, stage, session.get('user_id'), now, pre_plate, pre_die, pre_paper),
         )
+        index_customers(cur)
         conn.commit()
 
-        files = request.files.getlist('photos')
-        job_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no))
-        os.makedirs(job_folder, exist_ok=True)
-        saved = 0
-        for f in files:
-            if f and f.filename and allowed_file(f.filename) and saved < MAX_PER_JOB:
-                fn = secure_filename(f.filename)
-                base, ext = os.path.splitext(fn)
-                stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
-                fn = f"{base}_{stamp}{ext}"
-                f.save(os.path.join(job_folder, fn))
-                cur.execute(
-                    'INSERT INTO photos (job_id, filename, uploaded_at) VALUES (?, ?, ?)',
-                    (job_id, fn, datetime.datetime.now().isoformat()),
-                )
-                saved += 1
+        new_photos = save_job_photos(cur, job_id, request.files.getlist('photos'))
 
+        log_action(session.get('user_id'), 'CREATE_JOB', job_id=job_id, job_no=job_no, conn=conn)
         conn.commit()
         conn.close()
+        suggest_index.put_job(job_id, job_no, name, date)
+        queue_photo_variants(new_photos)
+        publish_job_change(job_id)
 
-        log_action(session.get('user_id'), 'CREATE_JOB', job_id=job_id, job_no=job_no)
-
+        if as_json:
+            return jsonify({'id': job_id, 'job_no': job_no, 'photos': new_photos,
+                            'uploads': url_for('api_upload_start', job_id=job_id)}), 201
         flash('Job saved successfully', 'success')
         return redirect(url_for('index'))
 
@@ -430,16 +3176,9 @@ def job_detail(job_id):
     cur.execute('SELECT * FROM photos WHERE job_id = ? ORDER BY id DESC', (job_id,))
     photos = cur.fetchall()
 
-    created_by_name = None
-    updated_by_name = None
-    if job['created_by']:
-        cur.execute("SELECT full_name FROM users WHERE id = ?", (job['created_by'],))
-        u = cur.fetchone()
-        created_by_name = u['full_name'] if u else None
-    if job['updated_by']:
-        cur.execute("SELECT full_name FROM users WHERE id = ?", (job['updated_by'],))
-        u = cur.fetchone()
-        updated_by_name = u['full_name'] if u else None
+    users = user_directory.get(conn)
+    created_by_name = user_name(users, job['created_by'])
+    updated_by_name = user_name(users, job['updated_by'])
 
     conn.close()
     stage_label = get_stage_label(job['stage']) if job['stage'] else None
@@ -450,8 +3189,28 @@ def job_detail(job_id):
 @app.route('/uploads/<job_no>/<filename>')
 @login_required
 def uploaded_file(job_no, filename):
-    folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no))
-    return send_from_directory(folder, filename)
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(
+        'SELECT p.sha256 FROM photos p JOIN jobs j ON j.id = p.job_id WHERE j.job_no = ? AND p.filename = ?',
+        (job_no, filename),
+    )
+    row = cur.fetchone()
+    conn.close()
+    if not row or not row['sha256']:
+        # Not in the blob store: old per-job folder layout
+        folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no))
+        return send_from_directory(folder, filename)
+
+    sha256 = row['sha256']
+    kind = request.args.get('v')
+    if kind in VARIANT_SIZES:
+        path = variant_path(sha256, kind)
+        if os.path.exists(path):
+            return send_file(path, max_age=VARIANT_MAX_AGE, etag=f"{sha256}-{kind}")
+        # Variant not built yet (or no Pillow): fall back to the original, uncached
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return send_file(blob_path(sha256), mimetype=mimetype, etag=sha256)
 
 @app.route('/delete_job/<int:job_id>', methods=['POST'])
 @login_required
@@ -473,17 +3232,17 @@ def delete_job(job_id):
 
     cur.execute('DELETE FROM photos WHERE job_id = ?', (job_id,))
     cur.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+    log_action(session.get('user_id'), 'DELETE_JOB', job_id=job_id, job_no=job_no, conn=conn)
     conn.commit()
     conn.close()
+    suggest_index.drop_job(job_id)
+    tracker_events.publish('delete', {'id': job_id})
 
+    # Photo bytes are shared by content; unreferenced blobs are removed in the background
+    schedule_blob_gc()
     folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no))
     if os.path.exists(folder):
-        try:
-            shutil.rmtree(folder)
-        except Exception as e:
-            print('Error deleting folder', e)
-
-    log_action(session.get('user_id'), 'DELETE_JOB', job_id=job_id, job_no=job_no)
+        background_pool().submit(shutil.rmtree, folder, True)
 
     flash('Job deleted', 'success')
     return redirect(url_for('index'))
@@ -513,16 +3272,6 @@ def edit(job_id):
         price = request.form.get('price', '').strip()
         serial = request.form.get('serial', '').strip()
 
-        old_job_no = job['job_no']
-        if job_no != old_job_no:
-            old_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(old_job_no))
-            new_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no))
-            if os.path.exists(old_folder):
-                try:
-                    os.rename(old_folder, new_folder)
-                except Exception as e:
-                    print('Error renaming folder', e)
-
         try:
             cur.execute(
                 'UPDATE jobs SET job_no = ?, name = ?, date = ?, paper = ?, note = ?, price = ?, serial = ?, updated_by = ?, updated_at = ? WHERE id = ?',
@@ -543,28 +3292,16 @@ def edit(job_id):
             flash('Job number already exists for another job', 'danger')
             conn.close()
             return redirect(url_for('edit', job_id=job_id))
+        index_customers(cur)
 
-        files = request.files.getlist('photos')
-        job_folder = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no))
-        os.makedirs(job_folder, exist_ok=True)
-        saved = 0
-        for f in files:
-            if f and f.filename and allowed_file(f.filename) and saved < MAX_PER_JOB:
-                fn = secure_filename(f.filename)
-                base, ext = os.path.splitext(fn)
-                stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
-                fn = f"{base}_{stamp}{ext}"
-                f.save(os.path.join(job_folder, fn))
-                cur.execute(
-                    'INSERT INTO photos (job_id, filename, uploaded_at) VALUES (?, ?, ?)',
-                    (job_id, fn, datetime.datetime.now().isoformat()),
-                )
-                saved += 1
+        new_photos = save_job_photos(cur, job_id, request.files.getlist('photos'))
 
+        log_action(session.get('user_id'), 'EDIT_JOB', job_id=job_id, job_no=job_no, conn=conn)
         conn.commit()
         conn.close()
-
-        log_action(session.get('user_id'), 'EDIT_JOB', job_id=job_id, job_no=job_no)
+        suggest_index.put_job(job_id, job_no, name, date)
+        queue_photo_variants(new_photos)
+        publish_job_change(job_id)
 
         flash('Job updated', 'success')
         return redirect(url_for('job_detail', job_id=job_id))
@@ -583,7 +3320,7 @@ def delete_photo(photo_id):
 
     conn = get_db()
     cur = conn.cursor()
-    cur.execute('SELECT filename, job_id FROM photos WHERE id = ?', (photo_id,))
+    cur.execute('SELECT filename, job_id, sha256 FROM photos WHERE id = ?', (photo_id,))
     row = cur.fetchone()
     if not row:
         conn.close()
@@ -601,7 +3338,9 @@ def delete_photo(photo_id):
     conn.commit()
     conn.close()
 
-    if job_no:
+    if row['sha256']:
+        schedule_blob_gc()
+    elif job_no:
         path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(job_no), filename)
         if os.path.exists(path):
             try:
@@ -612,52 +3351,516 @@ def delete_photo(photo_id):
     flash('Photo deleted', 'success')
     return redirect(url_for('edit', job_id=job_id))
 
-@app.route('/activity')
-@role_required('superadmin', 'admin')
-def activity():
-    # Filters: single date and/or date range (ignoring time part)
-    date = request.args.get('date', '').strip()
-    from_date = request.args.get('from_date', '').strip()
-    to_date = request.args.get('to_date', '').strip()
+def find_upload(upload_id):
+    """The signed-in user's upload with this id, or None."""
+    conn = get_db()
+    row = conn.execute('SELECT * FROM photo_uploads WHERE id = ? AND created_by IS ?',
+                       (upload_id, session.get('user_id'))).fetchone()
+    conn.close()
+    return row
+
+def upload_status(upload, received, code=200):
+    return jsonify({'id': upload['id'], 'job_id': upload['job_id'], 'filename': upload['filename'],
+                    'size': upload['size'], 'offset': received,
+                    'url': url_for('api_upload', upload_id=upload['id'])}), code
+
+@app.route('/api/jobs/<int:job_id>/uploads', methods=['POST'])
+@role_required('superadmin', 'admin', 'staff')
+def api_upload_start(job_id):
+    """Open a resumable photo upload from JSON {filename, size, sha256 (optional)}.
+
+    For a new job, post the /add form without photos and with Accept:
+    application/json; the reply carries the job id and this url, so the form is
+    saved before any photo bytes travel. Then, per photo: open an upload here,
+    PUT the bytes to the returned url in one or more chunks (?offset= is the
+    number of bytes the server already has; GET the url to find out after a
+    dropped connection), and POST url/finalize to add the photo to the job.
+    A job may have several uploads going at once.
+
+    Admins may add photos to any job, as in edit(); staff only to jobs they
+    created themselves in the last STAFF_UPLOAD_WINDOW_HOURS.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '').strip()
+    size = data.get('size')
+    sha256 = str(data.get('sha256') or '').strip().lower() or None
+    if not allowed_file(filename):
+        return jsonify({'error': f"Only {', '.join(sorted(ALLOWED_EXT))} files can be uploaded"}), 400
+    if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= UPLOAD_MAX_BYTES:
+        return jsonify({'error': f"size must be a byte count from 1 to {UPLOAD_MAX_BYTES}"}), 400
+    if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        return jsonify({'error': 'sha256 must be 64 hex digits'}), 400
 
     conn = get_db()
     cur = conn.cursor()
+    job = cur.execute('SELECT created_by, created_at FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is None:
+        conn.close()
+        return jsonify({'error': 'Job not found'}), 404
+    if session.get('role') not in ('superadmin', 'admin'):
+        since = (datetime.datetime.now() - datetime.timedelta(hours=STAFF_UPLOAD_WINDOW_HOURS)).isoformat()
+        if job['created_by'] != session.get('user_id') or (job['created_at'] or '') < since:
+            conn.close()
+            return jsonify({'error': 'Only admin or super admin can add photos to this job'}), 403
+    if cur.execute('SELECT count(*) FROM photos WHERE job_id = ?', (job_id,)).fetchone()[0] >= MAX_PER_JOB:
+        conn.close()
+        return jsonify({'error': f"A job can have at most {MAX_PER_JOB} photos"}), 409
+    upload_id = secrets.token_hex(16)
+    path = upload_part_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    cur.execute(
+        'INSERT INTO photo_uploads (id, job_id, filename, size, sha256, created_by, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (upload_id, job_id, filename, size, sha256, session.get('user_id'), datetime.datetime.now().isoformat()),
+    )
+    conn.commit()
+    upload = cur.execute('SELECT * FROM photo_uploads WHERE id = ?', (upload_id,)).fetchone()
+    conn.close()
+    return upload_status(upload, 0, 201)
 
-    base_query = '''
-        SELECT a.*, u.full_name
-        FROM activity_log a
-        LEFT JOIN users u ON a.user_id = u.id
-        WHERE 1=1
-    '''
-    params = []
+@app.route('/api/uploads/<upload_id>')
+@role_required('superadmin', 'admin', 'staff')
+def api_upload(upload_id):
+    upload = find_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    path = upload_part_path(upload_id)
+    return upload_status(upload, os.path.getsize(path) if os.path.exists(path) else 0)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@role_required('superadmin', 'admin', 'staff')
+def api_upload_chunk(upload_id):
+    """Append the request body to the upload at ?offset=. Streamed to disk, never held in memory."""
+    upload = find_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'offset (bytes already sent) is required'}), 400
+
+    path = upload_part_path(upload_id)
+    with upload_digests.lock(upload_id):
+        if not os.path.exists(path):
+            return jsonify({'error': 'Upload not found'}), 404
+        received = os.path.getsize(path)
+        if offset != received:
+            return jsonify({'error': 'offset does not match the bytes received', 'offset': received}), 409
+        digest = upload_digests.digest(upload_id, path)
+        try:
+            with open(path, 'ab') as out:
+                while True:
+                    chunk = request.stream.read(HASH_CHUNK)
+                    if not chunk:
+                        break
+                    if received + len(chunk) > upload['size']:
+                        return jsonify({'error': f"More than the {upload['size']} bytes announced",
+                                        'offset': received}), 413
+                    out.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+        finally:
+            # Whatever arrived before a dropped connection is kept for the client to resume from
+            upload_digests.advance(upload_id, received, digest)
+    return upload_status(upload, received)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@role_required('superadmin', 'admin', 'staff')
+def api_upload_cancel(upload_id):
+    if find_upload(upload_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    with upload_digests.lock(upload_id):
+        discard_upload(upload_id)
+    return jsonify({'id': upload_id, 'cancelled': True})
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@role_required('superadmin', 'admin', 'staff')
+def api_upload_finalize(upload_id):
+    """Check the finished upload against ALLOWED_EXT, MAX_PER_JOB and its sha256, then store it as a photo."""
+    upload = find_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    path = upload_part_path(upload_id)
+    with upload_digests.lock(upload_id):
+        if not os.path.exists(path):
+            return jsonify({'error': 'Upload not found'}), 404
+        received = os.path.getsize(path)
+        if received != upload['size']:
+            return jsonify({'error': f"{upload['size'] - received} bytes still to send", 'offset': received}), 409
+        sha256 = upload_digests.digest(upload_id, path).hexdigest()
+
+        conn = get_db()
+        cur = conn.cursor()
+        # Under the write lock, so parallel finalizes for one job cannot pass MAX_PER_JOB together
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            job = cur.execute('SELECT job_no FROM jobs WHERE id = ?', (upload['job_id'],)).fetchone()
+            error = None
+            if job is None:
+                error = ('Job not found', 404)
+            elif not allowed_file(upload['filename']):
+                error = (f"Only {', '.join(sorted(ALLOWED_EXT))} files can be uploaded", 400)
+            elif upload['sha256'] and upload['sha256'] != sha256:
+                error = ('The file received does not match its sha256; upload it again', 422)
+            elif cur.execute('SELECT count(*) FROM photos WHERE job_id = ?',
+                             (upload['job_id'],)).fetchone()[0] >= MAX_PER_JOB:
+                error = (f"A job can have at most {MAX_PER_JOB} photos", 409)
+            if error:
+                discard_upload(upload_id, conn)
+                conn.commit()
+                return jsonify({'error': error[0]}), error[1]
+            commit_blob(cur, path, sha256, received)
+            filename = stamped_photo_name(upload['filename'])
+            cur.execute(
+                'INSERT INTO photos (job_id, filename, uploaded_at, variants_status, sha256) VALUES (?, ?, ?, ?, ?)',
+                (upload['job_id'], filename, datetime.datetime.now().isoformat(), 'pending', sha256),
+            )
+            photo_id = cur.lastrowid
+            discard_upload(upload_id, conn)
+            log_action(session.get('user_id'), 'ADD_PHOTO', job_id=upload['job_id'], job_no=job['job_no'],
+                       details=filename, conn=conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    queue_photo_variants([photo_id])
+    publish_job_change(upload['job_id'])
+    return jsonify({'photo_id': photo_id, 'job_id': upload['job_id'], 'filename': filename,
+                    'sha256': sha256, 'size': received}), 201
 
-    # Single-date filter: exact match on date portion only
+def _day_after(day):
+    try:
+        return (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+    except ValueError:
+        return None
+
+def build_activity_filters(args):
+    """Translate the activity date/from_date/to_date args into a WHERE clause on activity_log a.
+
+    Dates become half-open created_at ranges so idx_activity_created can serve
+    them. Returns (where, params, (date, from_date, to_date), (low, high)) where
+    low/high are the ISO bounds (high exclusive) or None.
+    """
+    date = args.get('date', '').strip()
+    from_date = args.get('from_date', '').strip()
+    to_date = args.get('to_date', '').strip()
+
+    # A single date wins over the range; unparseable dates are ignored
     if date:
-        base_query += " AND substr(a.created_at, 1, 10) = ?"
-        params.append(date)
+        low, high = (date, _day_after(date)) if _day_after(date) else (None, None)
+    else:
+        low = from_date if _day_after(from_date) else None
+        high = _day_after(to_date) if to_date else None
+
+    where = "1=1"
+    params = []
+    if low:
+        where += " AND a.created_at >= ?"
+        params.append(low)
+    if high:
+        where += " AND a.created_at < ?"
+        params.append(high)
+    return where, params, (date, from_date, to_date), (low, high)
+
+def month_bounds(month):
+    """'YYYY-MM' -> ('YYYY-MM-01', first day of the next month)."""
+    start = f"{month}-01"
+    return start, add_one_month(start)
+
+def activity_archives(low=None, high=None):
+    """[(month, path)] of archive files, oldest first, optionally only months overlapping [low, high)."""
+    folder = app.config['ARCHIVE_FOLDER']
+    found = []
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            m = re.fullmatch(r'activity-(\d{4}-\d{2})\.db', name)
+            if not m:
+                continue
+            start, end = month_bounds(m.group(1))
+            if (low and end <= low) or (high and start >= high):
+                continue
+            found.append((m.group(1), os.path.join(folder, name)))
+    return sorted(found)
+
+def attach_archive(conn, path):
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+
+def detach_archive(conn):
+    try:
+        conn.execute("DETACH DATABASE archive")
+    except sqlite3.OperationalError as e:
+        print('could not detach activity archive', e)
+
+def archive_activity_log(retention_months=None):
+    """Move activity_log rows from whole months before the retention window into monthly archive files.
+
+    Returns {month: rows moved}. Rows are copied with INSERT OR IGNORE before
+    being deleted, so a run interrupted between the two files is finished by
+    the next one.
+    """
+    if retention_months is None:
+        retention_months = ACTIVITY_RETENTION_MONTHS
+    today = datetime.date.today()
+    y, m = divmod(today.year * 12 + today.month - 1 - retention_months, 12)
+    cutoff = f"{y:04d}-{m + 1:02d}-01"
+    os.makedirs(app.config['ARCHIVE_FOLDER'], exist_ok=True)
+    moved = {}
+    conn = get_db()
+    try:
+        while True:
+            row = conn.execute("SELECT min(created_at) FROM activity_log WHERE created_at < ?", (cutoff,)).fetchone()
+            if not row[0]:
+                break
+            month = row[0][:7]
+            start, end = month_bounds(month)
+            attach_archive(conn, os.path.join(app.config['ARCHIVE_FOLDER'], f"activity-{month}.db"))
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS archive.activity_log (
+                        id INTEGER PRIMARY KEY,
+                        user_id INTEGER,
+                        action TEXT,
+                        job_id INTEGER,
+                        job_no TEXT,
+                        details TEXT,
+                        created_at TEXT
+                    )
+                ''')
+                conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_activity_created ON activity_log(created_at)")
+                conn.execute(
+                    "INSERT OR IGNORE INTO archive.activity_log (id, user_id, action, job_id, job_no, details, created_at) "
+                    "SELECT id, user_id, action, job_id, job_no, details, created_at FROM main.activity_log "
+                    "WHERE created_at >= ? AND created_at < ?",
+                    (start, end),
+                )
+                cur = conn.execute("DELETE FROM main.activity_log WHERE created_at >= ? AND created_at < ?", (start, end))
+                moved[month] = cur.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                detach_archive(conn)
+    finally:
+        conn.close()
+    return moved
+
+def decode_activity_cursor(token):
+    values = _unpack_cursor(token)
+    if values is None or not isinstance(values[0], str):
+        return None
+    try:
+        return values[0], int(values[1])
+    except (ValueError, TypeError):
+        return None
+
+def activity_page(conn, where, params, per_page, bounds):
+    """Keyset page over the live activity log and its archives, newest first on (created_at, id).
+
+    The live table is read first; archive months are attached one at a time in
+    scan order and skipped once they can only hold rows past the page.
+    Returns (rows, next_cursor, prev_cursor).
+    """
+    after = decode_activity_cursor(request.args.get('after'))
+    before = None if after else decode_activity_cursor(request.args.get('before'))
+    params = list(params)
+    direction = 'DESC'
+    if after:
+        where += " AND (a.created_at < ? OR (a.created_at = ? AND a.id < ?))"
+        params.extend([after[0], after[0], after[1]])
+    elif before:
+        where += " AND (a.created_at > ? OR (a.created_at = ? AND a.id > ?))"
+        params.extend([before[0], before[0], before[1]])
+        direction = 'ASC'
+    limit = per_page + 1
+    params.append(limit)
+    query = (
+        "SELECT a.* FROM {schema}.activity_log a "
+        f"WHERE {where} ORDER BY a.created_at {direction}, a.id {direction} LIMIT ?"
+    )
+    descending = direction == 'DESC'
+    rows = conn.execute(query.format(schema='main'), params).fetchall()
+    archives = activity_archives(*bounds)
+    if descending:
+        archives.reverse()
+    for month, path in archives:
+        start, end = month_bounds(month)
+        # Months entirely on the far side of the cursor hold nothing for this page
+        if (after and start > after[0]) or (before and end <= before[0]):
+            continue
+        if len(rows) >= limit:
+            edge = rows[-1]['created_at']
+            if (descending and end <= edge) or (not descending and start > edge):
+                break
+        attach_archive(conn, path)
+        try:
+            rows.extend(conn.execute(query.format(schema='archive'), params).fetchall())
+        finally:
+            detach_archive(conn)
+        rows.sort(key=lambda r: (r['created_at'] or '', r['id']), reverse=descending)
+        del rows[limit:]
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+        has_next, has_prev = True, more
     else:
-        # Range filter only applies when no single date is given
-        if from_date:
-            base_query += " AND substr(a.created_at, 1, 10) >= ?"
-            params.append(from_date)
-        if to_date:
-            base_query += " AND substr(a.created_at, 1, 10) <= ?"
-            params.append(to_date)
+        has_next, has_prev = more, bool(after)
+    next_cursor = _pack_cursor([rows[-1]['created_at'], rows[-1]['id']]) if rows and has_next else None
+    prev_cursor = _pack_cursor([rows[0]['created_at'], rows[0]['id']]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+@app.route('/activity')
+@role_required('superadmin', 'admin')
+def activity():
+    where, params, (date, from_date, to_date), bounds = build_activity_filters(request.args)
+    per_page = get_page_size()
+
+    conn = get_db()
+    rows, next_cursor, prev_cursor = activity_page(conn, where, params, per_page, bounds)
+    rows = with_user_names(rows, user_directory.get(conn), 'user_id')
+    conn.close()
+    return render_template('activity.html', rows=rows, date=date, from_date=from_date, to_date=to_date,
+                           per_page=per_page, next_url=page_url(after=next_cursor), prev_url=page_url(before=prev_cursor),
+                           archived_months=[month for month, path in activity_archives()])
+
+def export_query(dataset, args, cur):
+    """Queries for an export, filtered like the dashboard (jobs, history) or activity page.
+
+    Returns a list of (sql, params, archive path or None) run in order; the
+    activity export reads each overlapping archive month, then the live table.
+    """
+    if dataset == 'activity':
+        where, params, filters, (low, high) = build_activity_filters(args)
+        query = f'''
+            SELECT a.id, a.created_at, a.user_id, u.full_name AS user_name, a.action, a.job_id, a.job_no, a.details
+            FROM {{schema}}.activity_log a
+            LEFT JOIN main.users u ON u.id = a.user_id
+            WHERE {where}
+            ORDER BY a.created_at, a.id
+        '''
+        queries = [(query.format(schema='archive'), params, path) for month, path in activity_archives(low, high)]
+        return queries + [(query.format(schema='main'), params, None)]
+
+    where, params, filters, match = build_job_filters(args, cur)
+    where, params = match_clause(where, params, match)
+    if dataset == 'history':
+        return [(f'''
+            SELECT h.id, h.job_id, j.job_no, j.name, h.stage, h.updated_at, u.full_name AS updated_by_name,
+                   h.pre_plate, h.pre_die, h.pre_paper
+            FROM stage_history h
+            JOIN (SELECT id, job_no, name FROM jobs WHERE {where}) j ON j.id = h.job_id
+            LEFT JOIN users u ON u.id = h.updated_by
+            ORDER BY h.id
+        ''', params, None)]
+    outsource = ', '.join(f"j.{column}" for flag, column in OUTSOURCE_FLAGS)
+    return [(f'''
+        SELECT j.id, j.job_no, j.name, j.date, j.paper, j.note, j.price, j.serial, j.stage,
+               j.created_at, cu.full_name AS created_by_name,
+               j.updated_at, uu.full_name AS updated_by_name,
+               j.stage_updated_at, su.full_name AS stage_updated_by_name,
+               j.pre_plate, j.pre_die, j.pre_paper, {outsource}
+        FROM (SELECT * FROM jobs WHERE {where}) j
+        LEFT JOIN users cu ON cu.id = j.created_by
+        LEFT JOIN users uu ON uu.id = j.updated_by
+        LEFT JOIN users su ON su.id = j.stage_updated_by
+        ORDER BY j.id
+    ''', params, None)]
+
+def iter_export(queries, fmt='csv', compress=False):
+    """Yield the rows of export_query() queries as CSV or JSON Lines chunks of about EXPORT_CHUNK_BYTES.
+
+    Rows are stepped off the cursor EXPORT_FETCH_ROWS at a time, so memory stays
+    flat however large the result. With compress the chunks form one gzip stream.
+    """
+    conn = get_db()
+    try:
+        buf = io.StringIO()
+        writer = csv.writer(buf) if fmt == 'csv' else None
+        zipper = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        columns = None
+
+        def drain():
+            data = buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+            return zipper.compress(data) if zipper else data
+
+        for sql, params, archive in queries:
+            if archive:
+                attach_archive(conn, archive)
+            try:
+                cur = conn.execute(sql, params)
+                if columns is None:
+                    columns = [c[0] for c in cur.description]
+                    if writer:
+                        writer.writerow(columns)
+                while True:
+                    rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+                    if not rows:
+                        break
+                    for row in rows:
+                        if writer:
+                            writer.writerow(row)
+                        else:
+                            buf.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                            buf.write('\n')
+                    if buf.tell() >= EXPORT_CHUNK_BYTES:
+                        chunk = drain()
+                        if chunk:
+                            yield chunk
+                cur.close()
+            finally:
+                if archive:
+                    detach_archive(conn)
+        chunk = drain()
+        if zipper:
+            chunk += zipper.flush()
+        if chunk:
+            yield chunk
+    finally:
+        conn.close()
 
-    base_query += " ORDER BY a.created_at DESC LIMIT 500"
+def export_filename(dataset, fmt, compress):
+    name = f"{dataset}-{datetime.date.today().isoformat()}.{fmt}"
+    return name + '.gz' if compress else name
+
+@app.route('/export/<dataset>')
+@role_required('superadmin', 'admin')
+def export(dataset):
+    if dataset not in EXPORT_DATASETS:
+        flash('Unknown export', 'warning')
+        return redirect(url_for('index'))
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        fmt = 'csv'
+    compress = request.args.get('gzip') == '1'
 
-    cur.execute(base_query, params)
-    rows = cur.fetchall()
+    conn = get_db()
+    queries = export_query(dataset, request.args, conn.cursor())
     conn.close()
-    return render_template('activity.html', rows=rows, date=date, from_date=from_date, to_date=to_date)
+    filename = export_filename(dataset, fmt, compress)
+    log_action(session.get('user_id'), 'EXPORT', details=f"{filename} {request.query_string.decode()}".strip())
+
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    # Streamed without a Content-Length, so the server sends it chunked
+    return Response(iter_export(queries, fmt, compress), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
 
 @app.route('/users')
 @role_required('superadmin')
 def users():
     conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT id, full_name, username, role FROM users ORDER BY full_name")
-    users = cur.fetchall()
+    users = sorted(user_directory.get(conn).values(), key=lambda u: u['full_name'] or '')
     conn.close()
     return render_template('users.html', users=users)
 
@@ -686,6 +3889,7 @@ def add_user():
             conn.close()
             return redirect(url_for('add_user'))
         conn.close()
+        user_directory.invalidate()
         flash('User added', 'success')
         return redirect(url_for('users'))
     return render_template('add_user.html')
@@ -707,28 +3911,70 @@ def delete_user(user_id):
         return redirect(url_for('users'))
 
     cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    details = f"Deleted user {u['username']} ({u['full_name']})"
+    log_action(session.get('user_id'), 'DELETE_USER', details=details, conn=conn)
     conn.commit()
     conn.close()
-
-    details = f"Deleted user {u['username']} ({u['full_name']})"
-    log_action(session.get('user_id'), 'DELETE_USER', details=details)
+    user_directory.invalidate()
 
     flash('User deleted', 'success')
     return redirect(url_for('users'))
 
 @app.route('/tracker')
 @login_required
+@cached_page
 def tracker():
     q = request.args.get('job_no', '').strip()
+    per_page = get_page_size()
+    where = "1=1"
+    params = []
+    if q:
+        where += " AND job_no LIKE ?"
+        params.append(f"%{q}%")
     conn = get_db()
     cur = conn.cursor()
-    if q:
-        cur.execute("SELECT * FROM jobs WHERE job_no LIKE ? ORDER BY date DESC, id DESC", (f"%{q}%",))
-    else:
-        cur.execute("SELECT * FROM jobs ORDER BY date DESC, id DESC")
-    jobs = cur.fetchall()
+    jobs, next_cursor, prev_cursor = fetch_jobs_page(cur, where, params, per_page)
+    total_count = total_exact = None
+    if request.args.get('count') == '1':
+        total_count, total_exact = approx_job_count(cur, where, params)
     conn.close()
-    return render_template('tracker.html', jobs=jobs)
+    return render_template('tracker.html', jobs=jobs, per_page=per_page, stream_last_id=tracker_events.current_id(),
+                           next_url=page_url(after=next_cursor), prev_url=page_url(before=prev_cursor),
+                           total_count=total_count, total_exact=total_exact)
+
+@app.route('/tracker/stream')
+@login_required
+def tracker_stream():
+    # EventSource sends Last-Event-ID on reconnect; the first connect passes the
+    # id the page was rendered at so nothing committed in between is missed.
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    sub, replay = tracker_events.subscribe(last_event_id)
+
+    def generate():
+        try:
+            yield f"retry: {TRACKER_STREAM_RETRY_MS}\n\n"
+            if replay is None:
+                yield f"id: {tracker_events.current_id()}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                for item in replay:
+                    yield format_sse(item)
+            while True:
+                try:
+                    item = sub.queue.get(timeout=TRACKER_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    if sub.lagged:
+                        return
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(item)
+                if sub.lagged and sub.queue.empty():
+                    # Fell behind: end the stream, the client resumes from its last id
+                    return
+        finally:
+            tracker_events.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/tracker/job/<int:job_id>')
 @login_required
@@ -742,17 +3988,8 @@ def tracker_job_detail(job_id):
         flash('Job not found', 'warning')
         return redirect(url_for('tracker'))
 
-    cur.execute(
-        '''
-        SELECT h.*, u.full_name
-        FROM stage_history h
-        LEFT JOIN users u ON h.updated_by = u.id
-        WHERE h.job_id = ?
-        ORDER BY h.updated_at ASC
-        ''',
-        (job_id,),
-    )
-    history = cur.fetchall()
+    cur.execute('SELECT * FROM stage_history WHERE job_id = ? ORDER BY updated_at ASC', (job_id,))
+    history = with_user_names(cur.fetchall(), user_directory.get(conn), 'updated_by')
     conn.close()
     return render_template('tracker_detail.html', job=job, history=history)
 
@@ -834,12 +4071,12 @@ def tracker_update(job_id):
             (job_id, stage, session.get('user_id'), now, pre_plate, pre_die, pre_paper),
         )
 
-        conn.commit()
-        conn.close()
-
         label = get_stage_label(stage) or stage
         details = f"Stage set to {label}; Pre-press: Plate={bool(pre_plate)}, Die={bool(pre_die)}, Paper={bool(pre_paper)}"
-        log_action(session.get('user_id'), 'UPDATE_STAGE', job_id=job_id, job_no=job['job_no'], details=details)
+        log_action(session.get('user_id'), 'UPDATE_STAGE', job_id=job_id, job_no=job['job_no'], details=details, conn=conn)
+        conn.commit()
+        conn.close()
+        publish_job_change(job_id)
 
         flash('Job stage updated', 'success')
         return redirect(url_for('tracker'))
@@ -849,19 +4086,417 @@ def tracker_update(job_id):
 
 
 
+@app.route('/analytics')
+@role_required('superadmin', 'admin')
+def analytics():
+    try:
+        stuck_hours = max(1, int(request.args.get('stuck_hours', STUCK_AFTER_HOURS)))
+    except ValueError:
+        stuck_hours = STUCK_AFTER_HOURS
+    conn = get_db()
+    cur = conn.cursor()
+    stages = stage_analytics(cur)
+    stuck = stuck_jobs(cur, stuck_hours)
+    conn.close()
+    return render_template('analytics.html', stages=stages, stuck=stuck, stuck_hours=stuck_hours)
+
+class ImportConflictError(ValueError):
+    def __init__(self, line_no, job_no):
+        super().__init__(f"Line {line_no}: job number {job_no} already exists")
+        self.line_no = line_no
+        self.job_no = job_no
+
+def import_format(filename, fmt=None):
+    if fmt in ('csv', 'jsonl'):
+        return fmt
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+def iter_import_rows(stream, fmt):
+    """Yield (line_no, record, error) from a text stream of CSV or JSON Lines, one row at a time."""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"invalid JSON: {e}"
+                continue
+            if isinstance(record, dict):
+                yield line_no, record, None
+            else:
+                yield line_no, None, 'expected a JSON object'
+        return
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record, None
+
+def normalize_import_row(record):
+    """Map a raw record onto IMPORT_FIELDS and validate it. Returns (row, error)."""
+    row = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        key = key.strip().lower().replace(' ', '_')
+        key = IMPORT_ALIASES.get(key, key)
+        if key in IMPORT_FIELDS:
+            row[key] = '' if value is None else str(value).strip()
+    if not row.get('job_no') or not row.get('name'):
+        return None, 'job_no and name are required'
+    date = row.get('date')
+    if date:
+        for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y'):
+            try:
+                row['date'] = datetime.datetime.strptime(date, fmt).strftime('%Y-%m-%d')
+                break
+            except ValueError:
+                pass
+        else:
+            return None, f"unrecognised date {date!r}"
+    stage = row.get('stage')
+    if stage:
+        code = next((c for c, label, group in TRACKER_STAGES if stage in (c, label)), None)
+        if code is None:
+            return None, f"unknown stage {stage!r}"
+        row['stage'] = code
+    return row, None
+
+def _import_photos(cur, rows, photos_dir, stats):
+    """Attach files named in each row's photos column (';'-separated) from photos_dir."""
+    marks = ', '.join('?' * len(rows))
+    cur.execute(f"SELECT id, job_no FROM jobs WHERE job_no IN ({marks})", [row['job_no'] for line_no, row in rows])
+    job_ids = {r['job_no']: r['id'] for r in cur.fetchall()}
+    photo_rows = []
+    for line_no, row in rows:
+        job_id = job_ids[row['job_no']]
+        names = [n.strip() for n in re.split(r'[;|]', row['photos']) if n.strip()][:MAX_PER_JOB]
+        for name in names:
+            path = os.path.join(photos_dir, os.path.basename(name))
+            if not allowed_file(name) or not os.path.isfile(path):
+                _import_error(stats, line_no, f"photo {name!r} not found or not an allowed type")
+                continue
+            with open(path, 'rb') as fh:
+                tmp, sha256, size = spool_blob(fh)
+            commit_blob(cur, tmp, sha256, size)
+            cur.execute('SELECT 1 FROM photos WHERE job_id = ? AND sha256 = ?', (job_id, sha256))
+            if cur.fetchone():
+                continue  # re-running an import must not attach the same photo twice
+            photo_rows.append((job_id, stamped_photo_name(name), datetime.datetime.now().isoformat(), 'pending', sha256))
+    cur.executemany(
+        'INSERT INTO photos (job_id, filename, uploaded_at, variants_status, sha256) VALUES (?, ?, ?, ?, ?)',
+        photo_rows,
+    )
+    stats['photos'] += len(photo_rows)
+
+def _import_error(stats, line_no, message):
+    if len(stats['errors']) < IMPORT_MAX_ERRORS:
+        stats['errors'].append((line_no, message))
+
+def _import_batch(cur, batch, on_conflict, photos_dir, user_id, stats):
+    now = datetime.datetime.now().isoformat()
+    # Within a batch the first row wins for 'skip' and the last one for 'update'
+    # (counted as an update of the earlier row, as if the rows were applied in turn)
+    by_job = {}
+    for line_no, row in batch:
+        job_no = row['job_no']
+        if job_no in by_job:
+            if on_conflict == 'fail':
+                raise ImportConflictError(line_no, job_no)
+            if on_conflict == 'skip':
+                stats['skipped'] += 1
+                continue
+            stats['updated'] += 1
+        by_job[job_no] = (line_no, row)
+
+    marks = ', '.join('?' * len(by_job))
+    cur.execute(f"SELECT job_no FROM jobs WHERE job_no IN ({marks})", list(by_job))
+    existing = {r['job_no'] for r in cur.fetchall()}
+    inserts, updates = [], []
+    for job_no, (line_no, row) in by_job.items():
+        if job_no not in existing:
+            inserts.append((line_no, row))
+        elif on_conflict == 'fail':
+            raise ImportConflictError(line_no, job_no)
+        elif on_conflict == 'update':
+            updates.append((line_no, row))
+        else:
+            stats['skipped'] += 1
+
+    deferred_fts = bool(inserts) and fts_available(cur)
+    if deferred_fts:
+        cur.execute('SELECT coalesce(max(id), 0) FROM jobs')
+        first_new_id = cur.fetchone()[0] + 1
+        cur.execute('INSERT INTO fts_bulk_load (active) VALUES (1)')
+    cur.executemany(
+        'INSERT INTO jobs (job_no, name, date, paper, note, price, serial, created_by, created_at, stage, stage_updated_by, stage_updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            (row['job_no'], row['name'], row.get('date', ''), row.get('paper', ''), row.get('note', ''),
+             row.get('price', ''), row.get('serial', ''), user_id, now,
+             row.get('stage') or IMPORT_DEFAULT_STAGE, user_id, now)
+            for line_no, row in inserts
+        ],
+    )
+    if deferred_fts:
+        cur.execute(
+            'INSERT INTO jobs_fts (rowid, job_no, name, paper, note) '
+            'SELECT id, job_no, name, paper, note FROM jobs WHERE id >= ?',
+            (first_new_id,),
+        )
+        cur.execute('DELETE FROM fts_bulk_load')
+    cur.executemany(
+        'INSERT INTO stage_history (job_id, stage, updated_by, updated_at, pre_plate, pre_die, pre_paper) '
+        'SELECT id, stage, ?, ?, 0, 0, 0 FROM jobs WHERE job_no = ?',
+        [(user_id, now, row['job_no']) for line_no, row in inserts],
+    )
+    # Columns missing from the file keep their current value
+    cur.executemany(
+        'UPDATE jobs SET name = ?, date = coalesce(?, date), paper = coalesce(?, paper), note = coalesce(?, note), '
+        'price = coalesce(?, price), serial = coalesce(?, serial), updated_by = ?, updated_at = ? WHERE job_no = ?',
+        [
+            (row['name'], row.get('date'), row.get('paper'), row.get('note'), row.get('price'), row.get('serial'),
+             user_id, now, row['job_no'])
+            for line_no, row in updates
+        ],
+    )
+    stats['inserted'] += len(inserts)
+    stats['updated'] += len(updates)
+
+    index_customers(cur)
+
+    with_photos = [(line_no, row) for line_no, row in inserts + updates if row.get('photos')]
+    if photos_dir and with_photos:
+        _import_photos(cur, with_photos, photos_dir, stats)
+
+def import_jobs(records, on_conflict='skip', photos_dir=None, user_id=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Stream (line_no, record, error) tuples into jobs and stage_history in batched transactions.
+
+    on_conflict decides what happens to a job_no that already exists: 'skip' it,
+    'update' the card fields, or 'fail'. With 'fail' the whole import is one
+    transaction, so a conflict leaves the database untouched and raises
+    ImportConflictError. progress(stats) is called after every batch.
+    """
+    if on_conflict not in ('skip', 'update', 'fail'):
+        raise ValueError(f"unknown conflict policy {on_conflict!r}")
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'invalid': 0, 'photos': 0, 'errors': []}
+    started = time.perf_counter()
+
+    def tick():
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        stats['rows_per_second'] = round(stats['rows'] / max(stats['seconds'], 1e-6))
+        if progress:
+            progress(stats)
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    def run_batch(batch):
+        # Take the write lock before the batch reads max(id) and the existing job numbers,
+        # so a job added meanwhile cannot be indexed twice or slip past the conflict check
+        if on_conflict != 'fail':
+            conn.execute('BEGIN IMMEDIATE')
+        _import_batch(cur, batch, on_conflict, photos_dir, user_id, stats)
+        if on_conflict != 'fail':
+            conn.commit()
+
+    try:
+        if on_conflict == 'fail':
+            conn.execute('BEGIN IMMEDIATE')
+        batch = []
+        for line_no, record, error in records:
+            stats['rows'] += 1
+            row = None
+            if error is None:
+                row, error = normalize_import_row(record)
+            if error:
+                stats['invalid'] += 1
+                _import_error(stats, line_no, error)
+                continue
+            batch.append((line_no, row))
+            if len(batch) >= batch_size:
+                run_batch(batch)
+                batch = []
+                tick()
+        if batch:
+            run_batch(batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        # Batches already committed count too; reload rather than patch thousands of entries
+        suggest_index.invalidate()
+    tick()
+    if stats['photos']:
+        conn = get_db()
+        pending = [r['id'] for r in conn.execute("SELECT id FROM photos WHERE variants_status = 'pending'")]
+        conn.close()
+        queue_photo_variants(pending)
+    return stats
+
+def bulk_stage_update(cur, job_ids, stage, pre_flags, outsource, user_id):
+    """Apply one stage and flag change to many jobs on cur (caller commits).
+
+    pre_flags maps pre_plate/pre_die/pre_paper to 0/1 and only lists the flags to
+    change; outsource lists OUTSOURCE_FLAGS names to stamp. Returns (applied, skipped).
+    """
+    now = datetime.datetime.now().isoformat()
+    marks = ', '.join('?' * len(job_ids))
+    cur.execute(f"SELECT * FROM jobs WHERE id IN ({marks})", job_ids)
+    jobs = {row['id']: row for row in cur.fetchall()}
+
+    updates, history, audit, applied, skipped = [], [], [], [], []
+    label = get_stage_label(stage) or stage
+    for job_id in job_ids:
+        job = jobs.get(job_id)
+        if job is None:
+            skipped.append({'id': job_id, 'reason': 'not found'})
+            continue
+        flags = {name: pre_flags.get(name, job[name] or 0) for name in ('pre_plate', 'pre_die', 'pre_paper')}
+        stamps = {column: job[column] for flag, column in OUTSOURCE_FLAGS}
+        for flag, column in OUTSOURCE_FLAGS:
+            if flag in outsource and not stamps[column]:
+                stamps[column] = now
+        unchanged = (
+            job['stage'] == stage
+            and all(flags[name] == (job[name] or 0) for name in flags)
+            and all(stamps[column] == job[column] for column in stamps)
+        )
+        if unchanged:
+            skipped.append({'id': job_id, 'job_no': job['job_no'], 'reason': 'no change'})
+            continue
+        updates.append((stage, user_id, now, flags['pre_plate'], flags['pre_die'], flags['pre_paper'])
+                       + tuple(stamps[column] for flag, column in OUTSOURCE_FLAGS) + (job_id,))
+        history.append((job_id, stage, user_id, now, flags['pre_plate'], flags['pre_die'], flags['pre_paper']))
+        details = (f"Bulk: stage set to {label}; Pre-press: Plate={bool(flags['pre_plate'])}, "
+                   f"Die={bool(flags['pre_die'])}, Paper={bool(flags['pre_paper'])}")
+        audit.append((user_id, 'UPDATE_STAGE', job_id, job['job_no'], details))
+        applied.append({'id': job_id, 'job_no': job['job_no'], 'from_stage': job['stage'], 'to_stage': stage})
+
+    cur.executemany(
+        "UPDATE jobs SET stage = ?, stage_updated_by = ?, stage_updated_at = ?, "
+        "pre_plate = ?, pre_die = ?, pre_paper = ?, "
+        "plate_sent_at = ?, plate_received_at = ?, "
+        "die_sent_at = ?, die_received_at = ?, "
+        "paper_sent_at = ?, paper_done_at = ? "
+        "WHERE id = ?",
+        updates,
+    )
+    cur.executemany(
+        'INSERT INTO stage_history (job_id, stage, updated_by, updated_at, pre_plate, pre_die, pre_paper) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        history,
+    )
+    if audit:
+        log_actions(audit, conn=cur.connection)
+    return applied, skipped
+
+@app.route('/tracker/bulk', methods=['POST'])
+@role_required('superadmin', 'admin', 'staff')
+def tracker_bulk_update():
+    """Advance many jobs at once. Accepts the /tracker multi-select form or JSON:
+    {"job_ids": [..], "stage": "POST_PACKING", "pre_plate": true, "outsource": ["plate_sent"]}
+    """
+    error = None
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        raw_ids = data.get('job_ids') or []
+        stage = data.get('stage') or ''
+        raw_outsource = data.get('outsource') or []
+        # Check shapes before building sets: a string would be read character by character
+        if not isinstance(raw_ids, list) or not all(type(x) is int for x in raw_ids):
+            error = 'job_ids must be a list of integers'
+        elif not isinstance(raw_outsource, list) or not all(isinstance(x, str) for x in raw_outsource):
+            error = 'outsource must be a list of strings'
+        elif not isinstance(stage, str):
+            error = 'Unknown stage'
+        if error:
+            return jsonify({'error': error}), 400
+        stage = stage.strip()
+        pre_flags = {name: 1 if data[name] else 0 for name in ('pre_plate', 'pre_die', 'pre_paper') if name in data}
+        outsource = set(raw_outsource)
+    else:
+        raw_ids = request.form.getlist('job_ids')
+        stage = request.form.get('stage', '').strip()
+        # Only ticked boxes change a flag: unticked leaves each job's own value alone
+        pre_flags = {name: 1 for name in ('pre_plate', 'pre_die', 'pre_paper') if request.form.get(name) == 'on'}
+        outsource = {flag for flag, column in OUTSOURCE_FLAGS if request.form.get(flag) == 'on'}
+
+    try:
+        job_ids = list(dict.fromkeys(int(x) for x in raw_ids))
+    except (TypeError, ValueError):
+        job_ids = []
+        error = 'Invalid job id'
+    if not error and not job_ids:
+        error = 'No jobs selected'
+    elif not error and len(job_ids) > BULK_MAX_JOBS:
+        error = f'At most {BULK_MAX_JOBS} jobs can be updated at once'
+    elif not error and get_stage_label(stage) is None:
+        error = 'Unknown stage'
+    elif not error and not outsource <= {flag for flag, column in OUTSOURCE_FLAGS}:
+        error = 'Unknown outsourced processing flag'
+    if error:
+        if request.is_json:
+            return jsonify({'error': error}), 400
+        flash(error, 'warning')
+        return redirect(url_for('tracker'))
+
+    conn = get_db()
+    try:
+        # Read-modify-write of every selected row: hold the write lock from the read
+        conn.execute('BEGIN IMMEDIATE')
+        applied, skipped = bulk_stage_update(conn.cursor(), job_ids, stage, pre_flags, outsource, session.get('user_id'))
+        conn.commit()
+    finally:
+        conn.close()
+    publish_job_changes(job['id'] for job in applied)
+
+    if request.is_json:
+        return jsonify({'applied': applied, 'skipped': skipped})
+    flash(f"{len(applied)} job(s) moved to {get_stage_label(stage)}"
+          + (f", {len(skipped)} skipped" if skipped else ''), 'success')
+    return redirect(url_for('tracker'))
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+@role_required('superadmin', 'admin')
+def import_page():
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        on_conflict = request.form.get('on_conflict', 'skip')
+        if not upload or not upload.filename:
+            flash('Choose a CSV or JSONL file to import', 'warning')
+            return redirect(url_for('import_page'))
+        if on_conflict not in ('skip', 'update', 'fail'):
+            flash('Unknown conflict policy', 'warning')
+            return redirect(url_for('import_page'))
+        fmt = import_format(upload.filename, request.form.get('format'))
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        try:
+            result = import_jobs(iter_import_rows(stream, fmt), on_conflict=on_conflict, user_id=session.get('user_id'))
+        except ImportConflictError as e:
+            flash(f'Import cancelled, nothing was saved. {e}', 'danger')
+            return redirect(url_for('import_page'))
+        except (UnicodeDecodeError, csv.Error) as e:
+            flash(f'Could not read {upload.filename}: {e}', 'danger')
+            return redirect(url_for('import_page'))
+        summary = (f"Imported {upload.filename}: {result['inserted']} added, {result['updated']} updated, "
+                   f"{result['skipped']} skipped, {result['invalid']} invalid")
+        log_action(session.get('user_id'), 'IMPORT_JOBS', details=summary)
+        flash(summary, 'success' if not result['invalid'] else 'warning')
+    return render_template('import_jobs.html', result=result)
+
 @app.route('/backups')
 @role_required('superadmin', 'admin', 'staff')
 def backups():
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT b.*, u.full_name
-        FROM backup_log b
-        LEFT JOIN users u ON b.created_by = u.id
-        ORDER BY b.backup_date DESC, b.id DESC
-        LIMIT 200
-    """)
-    rows = cur.fetchall()
+    cur.execute("SELECT * FROM backup_log ORDER BY backup_date DESC, id DESC LIMIT 200")
+    rows = with_user_names(cur.fetchall(), user_directory.get(conn), 'created_by')
 
     last = rows[0] if rows else None
     status_key = None
@@ -872,6 +4507,23 @@ def backups():
     conn.close()
     return render_template('backups.html', rows=rows, last=last, status_key=status_key, days_until=days_until)
 
+@app.route('/backups/run', methods=['POST'])
+@role_required('superadmin', 'admin')
+def backups_run():
+    if _backup_lock.locked():
+        flash('A backup is already running', 'warning')
+        return redirect(url_for('backups'))
+
+    def job(user_id):
+        try:
+            run_backup(user_id=user_id, backup_type='manual')
+        except Exception as e:
+            print('backup failed', e)
+
+    background_pool().submit(job, session.get('user_id'))
+    flash('Backup started; it will appear in the logbook when it finishes', 'info')
+    return redirect(url_for('backups'))
+
 @app.route('/backups/add', methods=['GET', 'POST'])
 @role_required('superadmin', 'admin', 'staff')
 def backups_add():
@@ -893,10 +4545,10 @@ def backups_add():
             "INSERT INTO backup_log (backup_date, next_due, backup_type, backup_location, notes, created_by, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (backup_date, next_due, backup_type, backup_location, notes, session.get('user_id'), datetime.datetime.now().isoformat()),
         )
+        log_action(session.get('user_id'), 'BACKUP_ADDED', details=f"Backup on {backup_date}, next due {next_due}", conn=conn)
         conn.commit()
         conn.close()
 
-        log_action(session.get('user_id'), 'BACKUP_ADDED', details=f"Backup on {backup_date}, next due {next_due}")
         flash('Backup entry added.', 'success')
         return redirect(url_for('backups'))
 
@@ -931,18 +4583,710 @@ def backups_edit(backup_id):
             "UPDATE backup_log SET backup_date=?, next_due=?, backup_type=?, backup_location=?, notes=? WHERE id=?",
             (backup_date, next_due, backup_type, backup_location, notes, backup_id),
         )
+        log_action(session.get('user_id'), 'BACKUP_EDITED', details=f"Backup #{backup_id} updated: {backup_date}, next due {next_due}", conn=conn)
         conn.commit()
         conn.close()
 
-        log_action(session.get('user_id'), 'BACKUP_EDITED', details=f"Backup #{backup_id} updated: {backup_date}, next due {next_due}")
         flash('Backup entry updated.', 'success')
         return redirect(url_for('backups'))
 
     conn.close()
     return render_template('backup_form.html', mode='edit', item=item)
 
+@app.route('/api/suggest')
+@login_required
+def api_suggest():
+    field = request.args.get('field', 'customer')
+    if field not in SUGGEST_FIELDS:
+        return jsonify({'error': f"field must be one of: {', '.join(SUGGEST_FIELDS)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', SUGGEST_LIMIT)), 1), SUGGEST_MAX_LIMIT)
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    q = request.args.get('q', '')
+    return jsonify({'field': field, 'q': q, 'results': suggest_index.suggest(field, q, limit)})
+
+def api_fields(allowed, default):
+    """Columns named by ?fields=a,b (in that order), or default. Returns (fields, error)."""
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return list(default), None
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        return None, f"Unknown field(s): {', '.join(unknown)}; choose from {', '.join(allowed)}"
+    return fields, None
 
+def parse_since(value):
+    """An ISO date or date-time as the naive local isoformat() timestamps are stored in, or None."""
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
 
-if __name__ == '__main__':
+@app.route('/api/jobs')
+@login_required
+@cached_page
+def api_jobs():
+    """Jobs newest first, filtered like the dashboard plus stage= and updated_since=.
+
+    Pages with the same after/before cursors as the HTML listings; 'next' and
+    'prev' are ready-made URLs.
+    """
+    fields, error = api_fields(JOB_API_FIELDS, JOB_API_LIST_FIELDS)
+    stage = request.args.get('stage', '').strip()
+    since = request.args.get('updated_since', '').strip()
+    if not error and stage and get_stage_label(stage) is None:
+        error = 'Unknown stage'
+    if not error and since:
+        since = parse_since(since)
+        if since is None:
+            error = 'updated_since must be an ISO date or date-time'
+    if error:
+        return jsonify({'error': error}), 400
+
+    per_page = get_page_size()
+    conn = get_db()
+    cur = conn.cursor()
+    where, params, filters, match = build_job_filters(request.args, cur)
+    where, params = match_clause(where, params, match)
+    params = list(params)
+    if stage:
+        where += " AND stage = ?"
+        params.append(stage)
+    if since:
+        # Spelled as a union so each timestamp index is searched; a plain OR walks the date order instead
+        where += (" AND id IN (SELECT id FROM jobs WHERE updated_at > ? "
+                  "UNION SELECT id FROM jobs WHERE stage_updated_at > ?)")
+        params.extend([since, since])
+    # The page cursors need id and date even when they are not asked for
+    columns = ', '.join(dict.fromkeys(['id', 'date'] + fields))
+    rows, next_cursor, prev_cursor = fetch_jobs_page(cur, where, params, per_page, columns=columns)
+    conn.close()
+    return jsonify({
+        'api_version': JOBS_API_VERSION,
+        'jobs': [{f: row[f] for f in fields} for row in rows],
+        'next': page_url(after=next_cursor),
+        'prev': page_url(before=prev_cursor),
+    })
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+@cached_page
+def api_job(job_id):
+    fields, error = api_fields(JOB_API_FIELDS, JOB_API_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+    conn = get_db()
+    row = conn.execute(f"SELECT {', '.join(fields)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'api_version': JOBS_API_VERSION, 'job': dict(row)})
+
+@app.route('/api/jobs/<int:job_id>/history')
+@login_required
+@cached_page
+def api_job_history(job_id):
+    fields, error = api_fields(HISTORY_API_FIELDS, HISTORY_API_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,))
+    if cur.fetchone() is None:
+        conn.close()
+        return jsonify({'error': 'Job not found'}), 404
+    cur.execute('SELECT * FROM stage_history WHERE job_id = ? ORDER BY updated_at ASC', (job_id,))
+    history = with_user_names(cur.fetchall(), user_directory.get(conn), 'updated_by', 'updated_by_name')
+    conn.close()
+    return jsonify({'api_version': JOBS_API_VERSION, 'job_id': job_id,
+                    'history': [{f: row[f] for f in fields} for row in history]})
+
+@app.route('/api/changes')
+@role_required('superadmin', 'admin', 'staff')
+@cached_page
+def api_changes():
+    """Writes to the CHANGE_FEED_TABLES after ?since=<seq>, oldest first, for keeping a remote copy.
+
+    Each change is an upsert {seq, table, id, row} carrying the row as it is now,
+    or a tombstone {seq, table, id, deleted: true}. Send next_since back as since
+    until more is false. since=0 replays the whole (compacted) log; reset=true
+    means the database was restored behind since, so drop the copy and start
+    again from 0. fields= picks the job columns.
+    """
+    job_fields, error = api_fields(CHANGE_FEED_TABLES['jobs'], CHANGE_FEED_TABLES['jobs'])
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        error = error or 'since must be a next_since value from an earlier response'
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', CHANGES_LIMIT)), 1), CHANGES_MAX_LIMIT)
+    except ValueError:
+        limit = CHANGES_LIMIT
+
+    conn = get_db()
+    cur = conn.cursor()
+    horizon = cur.execute('SELECT horizon FROM change_feed').fetchone()[0]
+    if since < 0 or 0 < since < horizon or since > last_change_seq(conn):
+        conn.close()
+        return jsonify({'api_version': JOBS_API_VERSION, 'since': since, 'reset': True, 'next_since': 0,
+                        'more': True, 'changes': []})
+
+    cur.execute('SELECT seq, tbl, row_id, deleted FROM changes WHERE seq > ? ORDER BY seq LIMIT ?',
+                (since, limit + 1))
+    log = cur.fetchall()
+    more = len(log) > limit
+    log = log[:limit]
+    # Rows changed more than once in this page are sent once, at their newest seq
+    latest = {(change['tbl'], change['row_id']): change for change in log}
+    wanted = {}
+    for (table, row_id), change in latest.items():
+        if not change['deleted']:
+            wanted.setdefault(table, []).append(row_id)
+    rows = {}
+    for table, ids in wanted.items():
+        fields = job_fields if table == 'jobs' else CHANGE_FEED_TABLES[table]
+        columns = ', '.join(dict.fromkeys(['id'] + list(fields)))
+        cur.execute(f"SELECT {columns} FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        rows.update(((table, row['id']), {f: row[f] for f in fields}) for row in cur.fetchall())
+    conn.close()
+
+    changes = []
+    for change in sorted(latest.values(), key=lambda c: c['seq']):
+        key = (change['tbl'], change['row_id'])
+        entry = {'seq': change['seq'], 'table': change['tbl'], 'id': change['row_id']}
+        if change['deleted']:
+            entry['deleted'] = True
+        elif key in rows:
+            entry['row'] = rows[key]
+        else:
+            # Deleted after this page was read; its tombstone comes later in the log
+            continue
+        changes.append(entry)
+    return jsonify({'api_version': JOBS_API_VERSION, 'since': since, 'reset': False,
+                    'next_since': log[-1]['seq'] if log else since, 'more': more, 'changes': changes})
+
+@app.route('/api/customers')
+@login_required
+def api_customers():
+    q = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', SUGGEST_LIMIT)), 1), SUGGEST_MAX_LIMIT)
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    conn = get_db()
+    results = customer_matches(conn.cursor(), q, limit)
+    conn.close()
+    return jsonify({'q': q, 'results': results})
+
+@app.route('/customers/<int:customer_id>')
+@login_required
+def customer_history(customer_id):
+    """Every job of a customer across all the spellings grouped with it, newest first."""
+    per_page = get_page_size()
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute('SELECT c.* FROM customer_names n JOIN customer_names c ON c.id = n.canonical_id WHERE n.id = ?',
+                (customer_id,))
+    customer = cur.fetchone()
+    if not customer:
+        conn.close()
+        flash('Customer not found', 'warning')
+        return redirect(url_for('index'))
+
+    cur.execute('SELECT * FROM customer_names WHERE canonical_id = ? ORDER BY display', (customer['id'],))
+    names = cur.fetchall()
+    jobs, next_cursor, prev_cursor = fetch_jobs_page(
+        cur, 'customer_id IN (SELECT id FROM customer_names WHERE canonical_id = ?)', [customer['id']], per_page)
+    similar = [m for m in customer_matches(cur, customer['display'], whole_name=True) if m['id'] != customer['id']]
+    conn.close()
+    return render_template('customer_history.html', customer=customer, names=names, jobs=jobs, similar=similar,
+                           per_page=per_page, next_url=page_url(after=next_cursor), prev_url=page_url(before=prev_cursor))
+
+@app.route('/customers/merge', methods=['POST'])
+@role_required('superadmin', 'admin')
+def merge_customers():
+    """Group other customers (with all their spellings) under one, so their histories read as one."""
+    into = request.form.get('into', type=int)
+    ids = [i for i in request.form.getlist('ids', type=int) if i != into]
+    if not into or not ids:
+        flash('Choose the customer to keep and at least one to merge into it', 'warning')
+        return redirect(request.referrer or url_for('index'))
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute('SELECT canonical_id, display FROM customer_names WHERE id = ?', (into,))
+    target = cur.fetchone()
+    if not target:
+        conn.close()
+        flash('Customer not found', 'warning')
+        return redirect(url_for('index'))
+    marks = ', '.join('?' * len(ids))
+    cur.execute(
+        f"UPDATE customer_names SET canonical_id = ? WHERE canonical_id IN "
+        f"(SELECT canonical_id FROM customer_names WHERE id IN ({marks})) AND canonical_id != ?",
+        [target['canonical_id'], *ids, target['canonical_id']],
+    )
+    merged = cur.rowcount
+    log_action(session.get('user_id'), 'MERGE_CUSTOMERS',
+               details=f"Grouped {merged} name(s) under {target['display']}", conn=conn)
+    conn.commit()
+    conn.close()
+    flash(f"{merged} name(s) grouped under {target['display']}", 'success')
+    return redirect(url_for('customer_history', customer_id=target['canonical_id']))
+
+@app.route('/customers/<int:customer_id>/split', methods=['POST'])
+@role_required('superadmin', 'admin')
+def split_customer(customer_id):
+    """Take one spelling back out of its group."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute('SELECT canonical_id, display FROM customer_names WHERE id = ?', (customer_id,))
+    name = cur.fetchone()
+    if not name:
+        conn.close()
+        flash('Customer not found', 'warning')
+        return redirect(url_for('index'))
+    if name['canonical_id'] == customer_id:
+        conn.close()
+        flash('This is the main name of its group; merge the group under another name instead', 'warning')
+        return redirect(url_for('customer_history', customer_id=customer_id))
+    cur.execute('UPDATE customer_names SET canonical_id = id WHERE id = ?', (customer_id,))
+    log_action(session.get('user_id'), 'SPLIT_CUSTOMER', details=f"Separated {name['display']}", conn=conn)
+    conn.commit()
+    conn.close()
+    flash(f"{name['display']} is now a separate customer", 'success')
+    return redirect(url_for('customer_history', customer_id=name['canonical_id']))
+
+@app.route('/system/db')
+@role_required('superadmin')
+def system_db():
+    return jsonify(db_pool_stats())
+
+@app.route('/system/audit')
+@role_required('superadmin')
+def system_audit():
+    return jsonify(audit_stats())
+
+@app.route('/system/caches')
+@role_required('superadmin')
+def system_caches():
+    return jsonify({'users': user_directory.snapshot(), 'pages': page_cache.snapshot(),
+                    'suggest': suggest_index.snapshot(), 'uploads': upload_digests.snapshot()})
+
+@app.before_request
+def start_request_metrics():
+    # [started, sql statements, sql seconds, render seconds]
+    _metrics_local.req = [time.perf_counter(), 0, 0.0, 0.0]
+    _metrics_local.endpoint = request.endpoint
+
+def finish_request_metrics(status):
+    req = getattr(_metrics_local, 'req', None)
+    if req is None:
+        return
+    _metrics_local.req = None
+    request_metrics.observe(request.endpoint or 'unmatched', request.method, status,
+                            time.perf_counter() - req[0], req[1], req[2], req[3])
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies (exports, the tracker stream) are timed up to the first byte
+    finish_request_metrics(response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exc):
+    if exc is not None:
+        finish_request_metrics(500)
+    _metrics_local.req = None
+
+def _prom_labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def render_metrics():
+    """Prometheus text exposition of request_metrics plus the pool, audit and stream counters."""
+    routes, statuses, slow, slow_total = request_metrics.snapshot()
+    out = []
+
+    def family(name, kind, help_text):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    family('archive_http_request_duration_seconds', 'histogram', 'Time to produce a response, by route.')
+    for (endpoint, method), (buckets, count, seconds, *rest) in sorted(routes.items()):
+        running = 0
+        for bound, n in zip(METRICS_BUCKETS + (float('inf'),), buckets):
+            running += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            out.append(f"archive_http_request_duration_seconds_bucket{_prom_labels(endpoint=endpoint, method=method, le=le)} {running}")
+        labels = _prom_labels(endpoint=endpoint, method=method)
+        out.append(f"archive_http_request_duration_seconds_sum{labels} {seconds:.6f}")
+        out.append(f"archive_http_request_duration_seconds_count{labels} {count}")
+
+    family('archive_http_requests_total', 'counter', 'Responses by route and status.')
+    for (endpoint, method, status), n in sorted(statuses.items()):
+        out.append(f"archive_http_requests_total{_prom_labels(endpoint=endpoint, method=method, status=status)} {n}")
+
+    per_route = [
+        ('archive_sql_statements_total', 'SQL statements executed while serving the route.', 3, '{}'),
+        ('archive_sql_seconds_total', 'Time spent in SQLite while serving the route.', 4, '{:.6f}'),
+        ('archive_template_render_seconds_total', 'Time spent in render_template while serving the route.', 5, '{:.6f}'),
+    ]
+    for name, help_text, index, fmt in per_route:
+        family(name, 'counter', help_text)
+        for (endpoint, method), values in sorted(routes.items()):
+            out.append(f"{name}{_prom_labels(endpoint=endpoint, method=method)} {fmt.format(values[index])}")
+
+    family('archive_slow_queries_total', 'counter', f'Statements slower than {SLOW_QUERY_MS} ms.')
+    out.append(f"archive_slow_queries_total {slow_total}")
+
+    pool = db_pool_stats()
+    family('archive_db_pool_checkouts_total', 'counter', 'Pooled connection checkouts by outcome.')
+    for key in ('hits', 'misses'):
+        out.append(f"archive_db_pool_checkouts_total{_prom_labels(result=key)} {pool[key]}")
+
+    users = user_directory.snapshot()
+    family('archive_user_directory_lookups_total', 'counter', 'User directory lookups by outcome.')
+    for key, result in (('hits', 'hit'), ('misses', 'miss')):
+        out.append(f"archive_user_directory_lookups_total{_prom_labels(result=result)} {users[key]}")
+
+    pages = page_cache.snapshot()
+    family('archive_page_cache_requests_total', 'counter', 'Cacheable page requests by outcome.')
+    for key, result in (('hits', 'hit'), ('misses', 'miss'), ('not_modified', 'not_modified')):
+        out.append(f"archive_page_cache_requests_total{_prom_labels(result=result)} {pages[key]}")
+    family('archive_page_cache_bytes', 'gauge', 'Rendered pages held in memory.')
+    out.append(f"archive_page_cache_bytes {pages['bytes']}")
+
+    audit = audit_stats()
+    if 'queue_depth' in audit:
+        family('archive_audit_queue_depth', 'gauge', 'Audit rows waiting for the writer thread.')
+        out.append(f"archive_audit_queue_depth {audit['queue_depth']}")
+        family('archive_audit_rows_written_total', 'counter', 'Audit rows committed by the writer thread.')
+        out.append(f"archive_audit_rows_written_total {audit['written']}")
+
+    family('archive_tracker_stream_subscribers', 'gauge', 'Open /tracker/stream connections.')
+    out.append(f"archive_tracker_stream_subscribers {tracker_events.stats()['subscribers']}")
+    return '\n'.join(out) + '\n'
+
+@app.route('/metrics')
+def metrics():
+    # Open to a scraper on this machine; anything that came through a proxy must be a superadmin
+    local = request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+    if not local and session.get('role') != 'superadmin':
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/system/slow-queries')
+@role_required('superadmin')
+def system_slow_queries():
+    routes, statuses, slow, slow_total = request_metrics.snapshot()
+    return jsonify({'threshold_ms': SLOW_QUERY_MS, 'total': slow_total, 'recent': slow[::-1]})
+
+
+def load_config(config=None):
+    """Layer settings into app.config: defaults, the settings file, ARCHIVE_* variables, then config.
+
+    DATABASE and the TUNABLE_SETTINGS are copied back to the module globals the
+    rest of the code reads.
+    """
+    global DB_PATH
+    named = os.environ.get(SETTINGS_ENV)
+    path = named or os.path.join(BASE_DIR, 'settings.cfg')
+    if os.path.exists(path):
+        if path.endswith('.json'):
+            app.config.from_file(path, load=json.load)
+        else:
+            app.config.from_pyfile(path)
+    elif named:
+        raise RuntimeError(f"{SETTINGS_ENV} names a file that does not exist: {path}")
+    app.config.from_prefixed_env(SETTINGS_ENV_PREFIX)
+    if config:
+        app.config.update(config)
+
+    for key in PATH_SETTINGS:
+        app.config[key] = os.path.join(BASE_DIR, app.config[key])
+    DB_PATH = app.config['DATABASE']
+    module = globals()
+    for key in TUNABLE_SETTINGS:
+        module[key] = app.config.get(key, module[key])
+    return app.config
+
+def load_secret_key():
+    """The session signing key from instance/secret_key, created on first start."""
+    path = os.path.join(app.instance_path, 'secret_key')
+    try:
+        with open(path) as fh:
+            key = fh.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    os.makedirs(app.instance_path, exist_ok=True)
+    key = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fh:
+        fh.write(key)
+    return key
+
+def create_app(config=None):
+    """Configure the application for serving and return it (also usable as a WSGI factory).
+
+    Loads settings (see load_config), replaces the development secret key with a
+    persistent random one, migrates the database and starts the maintenance thread.
+    """
+    load_config(config)
+    if app.config['SECRET_KEY'] == DEV_SECRET_KEY:
+        app.config['SECRET_KEY'] = load_secret_key()
+    init_db()
+    if not app.testing:
+        start_maintenance_scheduler()
+        background_pool().submit(suggest_index.refresh)
+    return app
+
+
+def cmd_serve(args):
+    try:
+        from waitress import serve
+    except ImportError:
+        print('waitress is not installed; run: pip install -r requirements.txt')
+        return
+    overrides = {key: value for key, value in (('SERVER_HOST', args.host), ('SERVER_PORT', args.port),
+                                               ('SERVER_THREADS', args.threads)) if value is not None}
+    create_app(overrides)
+    config = app.config
+    print(f"Serving on http://{config['SERVER_HOST']}:{config['SERVER_PORT']} "
+          f"({config['SERVER_THREADS']} threads, database {DB_PATH})")
+    serve(
+        app,
+        host=config['SERVER_HOST'],
+        port=config['SERVER_PORT'],
+        threads=config['SERVER_THREADS'],
+        connection_limit=config['SERVER_CONNECTION_LIMIT'],
+        channel_timeout=config['SERVER_CHANNEL_TIMEOUT'],
+        max_request_body_size=config['MAX_CONTENT_LENGTH'],
+        ident='archive',
+    )
+
+
+def cmd_migrate(args):
+    conn = get_db()
+    if args.apply:
+        print(f"Schema version {schema_version(conn)}, target {SCHEMA_VERSION}")
+        applied = migrate(conn, verbose=True)
+        print(f"{len(applied)} migration(s) applied" if applied else "Already up to date")
+    else:
+        print(f"Schema version {schema_version(conn)} of {SCHEMA_VERSION}")
+        for version, name, done in migration_status(conn):
+            print(f"  [{'x' if done else ' '}] {version:03d} {name}")
+    conn.close()
+
+
+def cmd_thumbnails(args):
+    if Image is None:
+        print('Pillow is not installed; pip install -r requirements.txt')
+        return
+    init_db()
+    conn = get_db()
+    query = 'SELECT id FROM photos'
+    if not args.all:
+        query += " WHERE variants_status IS NULL OR variants_status != 'ready'"
+    photo_ids = [row['id'] for row in conn.execute(query + ' ORDER BY id')]
+    conn.close()
+    total = len(photo_ids)
+    print(f"Building variants for {total} photo(s) with {BACKGROUND_WORKERS} worker(s)")
+    started = time.perf_counter()
+    done = failed = 0
+    for future in queue_photo_variants(photo_ids):
+        if not future.result():
+            failed += 1
+        done += 1
+        if done % 100 == 0 or done == total:
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"  {done}/{total} ({rate:.1f} photos/s, {failed} failed)")
+    shutdown_background_pool()
+
+
+def cmd_analytics(args):
+    init_db()
+    conn = get_db()
+    cur = conn.cursor()
+    if args.rebuild:
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        rebuild_stage_rollups(cur)
+        conn.commit()
+        print(f"Stage rollups rebuilt in {(time.perf_counter() - started) * 1000:.1f} ms")
+    for row in stage_analytics(cur):
+        print(f"  {row['label']:<32} wip {row['wip']:>5}  done {row['completed']:>6}  "
+              f"median {format_duration(row['median_seconds']):>8}  p90 {format_duration(row['p90_seconds']):>8}  "
+              f"max {format_duration(row['max_seconds']):>8}")
+    conn.close()
+
+
+def cmd_import(args):
+    init_db()
+    user_id = None
+    if args.user:
+        conn = get_db()
+        row = conn.execute("SELECT id FROM users WHERE username = ?", (args.user,)).fetchone()
+        conn.close()
+        if not row:
+            print(f"Unknown user {args.user}")
+            return
+        user_id = row['id']
+
+    def progress(stats):
+        print(f"  {stats['rows']} rows, {stats['rows_per_second']} rows/s", end='\r', flush=True)
+
+    fmt = import_format(args.file, args.format)
+    with open(args.file, encoding='utf-8-sig', newline='') as fh:
+        try:
+            stats = import_jobs(iter_import_rows(fh, fmt), on_conflict=args.on_conflict, photos_dir=args.photos,
+                                user_id=user_id, batch_size=args.batch_size, progress=progress)
+        except ImportConflictError as e:
+            print(f"\nImport cancelled, nothing was saved. {e}")
+            return
+    print(f"\n{stats['rows']} rows in {stats['seconds']} s ({stats['rows_per_second']} rows/s): "
+          f"{stats['inserted']} added, {stats['updated']} updated, {stats['skipped']} skipped, "
+          f"{stats['invalid']} invalid, {stats['photos']} photos")
+    for line_no, message in stats['errors']:
+        print(f"  line {line_no}: {message}")
+    log_action(user_id, 'IMPORT_JOBS', details=f"Imported {os.path.basename(args.file)}: {stats['inserted']} added, {stats['updated']} updated")
+
+
+def cmd_export(args):
+    init_db()
+    filters = {key: value for key, value in vars(args).items()
+               if key in ('q', 'mode', 'year', 'month', 'date', 'from_date', 'to_date') and value}
+    compress = args.gzip or bool(args.output and args.output.endswith('.gz'))
+    conn = get_db()
+    queries = export_query(args.dataset, filters, conn.cursor())
+    conn.close()
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    started = time.perf_counter()
+    written = 0
+    try:
+        for chunk in iter_export(queries, args.format, compress):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print(f"Wrote {written} bytes to {args.output} in {time.perf_counter() - started:.2f} s")
+
+
+def cmd_backup(args):
+    init_db()
+    if args.action == 'run':
+        summary = run_backup(args.dest, backup_type='manual')
+        print(f"{summary['snapshot']}: {summary['files_copied']} files, {summary['bytes_copied']} bytes "
+              f"in {summary['duration_seconds']} s ({summary['throughput_bps']} bytes/s) -> {summary['location']}")
+        return
+    if args.action == 'verify':
+        entry, problems = verify_backup(args.dest, args.snapshot, deep=args.deep)
+    else:
+        entry, problems, result = restore_backup(args.dest, args.snapshot)
+    if entry:
+        print(f"{entry['file']} ({entry['size']} bytes, {entry['created_at']})")
+    for problem in problems:
+        print('  ' + problem)
+    if problems:
+        print('Backup is NOT usable' if args.action == 'verify' else 'Nothing was restored')
+    elif args.action == 'verify':
+        print('OK')
+    else:
+        print(f"Restored; previous database kept as {result['safety_copy']}, {result['files_restored']} photo files copied back")
+
+
+def cmd_archive(args):
     init_db()
-    app.run(host='0.0.0.0', port=5000)
+    moved = archive_activity_log(args.months)
+    for month, n in sorted(moved.items()):
+        print(f"  {month}: {n} rows -> activity-{month}.db")
+    print(f"Archived {sum(moved.values())} activity rows older than {args.months} months")
+    if args.vacuum:
+        conn = get_db()
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.close()
+        print(f"Compacted {DB_PATH} to {os.path.getsize(DB_PATH)} bytes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Colour Creations Archive')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('migrate', help='show or apply database schema migrations')
+    group = p.add_mutually_exclusive_group()
+    group.add_argument('--status', action='store_true', help='list migrations (default)')
+    group.add_argument('--apply', action='store_true', help='apply pending migrations')
+    p.set_defaults(func=cmd_migrate)
+    p = sub.add_parser('serve', help='run the production server (waitress)')
+    p.add_argument('--host', help=f'default: SERVER_HOST ({SERVER_HOST})')
+    p.add_argument('--port', type=int, help=f'default: SERVER_PORT ({SERVER_PORT})')
+    p.add_argument('--threads', type=int, help=f'default: SERVER_THREADS ({SERVER_THREADS})')
+    p.set_defaults(func=cmd_serve)
+    p = sub.add_parser('thumbnails', help='backfill thumbnail/preview variants for stored photos')
+    p.add_argument('--all', action='store_true', help='rebuild variants that are already ready too')
+    p.set_defaults(func=cmd_thumbnails)
+    p = sub.add_parser('analytics', help='print stage analytics')
+    p.add_argument('--rebuild', action='store_true', help='regenerate the rollups from stage_history first')
+    p.set_defaults(func=cmd_analytics)
+    p = sub.add_parser('import', help='import legacy job cards from CSV or JSON Lines')
+    p.add_argument('file')
+    p.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+    p.add_argument('--on-conflict', choices=['skip', 'update', 'fail'], default='skip',
+                   help='what to do with job numbers that already exist (default: skip)')
+    p.add_argument('--photos', metavar='DIR', help='directory holding the files named in the photos column')
+    p.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    p.add_argument('--user', metavar='USERNAME', help='record the import as this user')
+    p.set_defaults(func=cmd_import)
+    p = sub.add_parser('export', help='stream jobs, stage history or the activity log as CSV or JSON Lines')
+    p.add_argument('dataset', choices=EXPORT_DATASETS)
+    p.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    p.add_argument('--gzip', action='store_true', help='compress (implied by an output name ending in .gz)')
+    p.add_argument('-o', '--output', help='file to write (default: stdout)')
+    p.add_argument('--q', help='dashboard search text (jobs, history)')
+    p.add_argument('--mode', choices=['job', 'customer', 'keyword'], help='how --q is matched')
+    p.add_argument('--year')
+    p.add_argument('--month')
+    p.add_argument('--date', help='activity on this day (YYYY-MM-DD)')
+    p.add_argument('--from-date')
+    p.add_argument('--to-date')
+    p.set_defaults(func=cmd_export)
+    p = sub.add_parser('backup', help='snapshot the database and photos, or verify/restore a backup')
+    p.add_argument('action', nargs='?', choices=['run', 'verify', 'restore'], default='run')
+    p.add_argument('--dest', help=f'backup folder (default: {BACKUP_FOLDER})')
+    p.add_argument('--snapshot', help='snapshot file name to verify/restore (default: the newest)')
+    p.add_argument('--deep', action='store_true', help='verify: also re-hash every photo')
+    p.set_defaults(func=cmd_backup)
+    p = sub.add_parser('archive', help='move old activity log months into archive databases')
+    p.add_argument('--months', type=int, default=ACTIVITY_RETENTION_MONTHS,
+                   help=f'months to keep in the live table (default: {ACTIVITY_RETENTION_MONTHS})')
+    p.add_argument('--vacuum', action='store_true', help='compact the main database afterwards')
+    p.set_defaults(func=cmd_archive)
+    args = parser.parse_args(argv)
+
+    if args.command:
+        if args.command != 'serve':
+            load_config()
+        args.func(args)
+        return
+    # Development server; use `python app.py serve` in production
+    create_app()
+    app.run(host=app.config['SERVER_HOST'], port=app.config['SERVER_PORT'])
+
+
+if __name__ == '__main__':
+    main()
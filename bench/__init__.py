@@ -0,0 +1,6 @@
+"""Benchmark suite for the archive: synthetic data generator, route scenarios and a load driver.
+
+    python -m bench generate --jobs 100000 --out bench/data/100k
+    python -m bench run --data bench/data/100k --threads 1,8 --out bench/results/before.json
+    python -m bench compare bench/results/before.json bench/results/after.json
+"""
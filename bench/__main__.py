@@ -0,0 +1,244 @@
+"""Command line for the benchmark suite: generate, run and compare (see bench/__init__.py)."""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as archive  # noqa: E402
+
+from .generate import BENCH_PASSWORD, BENCH_USER, generate, point_app_at  # noqa: E402
+from .scenarios import DEFAULT_SCENARIOS, SCENARIOS, Dataset, scenario_rng  # noqa: E402
+
+# Latency changes smaller than this are noise on any machine
+NOISE_FLOOR_MS = 0.5
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, errors, wall):
+    ordered = sorted(x * 1000 for x in latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 50), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'mean_ms': round(sum(ordered) / len(ordered), 3),
+        'max_ms': round(ordered[-1], 3),
+        'throughput_rps': round(len(ordered) / wall, 1),
+    }
+
+
+def prepare_run(data_dir):
+    """Point the app at a scratch copy of the dataset's database so write scenarios leave it untouched."""
+    work = tempfile.mkdtemp(prefix='bench-')
+    point_app_at(data_dir)
+    shutil.copyfile(os.path.join(data_dir, 'database.db'), os.path.join(work, 'database.db'))
+    archive.DB_PATH = os.path.join(work, 'database.db')
+    archive.app.config['BACKUP_FOLDER'] = os.path.join(work, 'backups')
+    archive.init_db()
+    return work
+
+
+def logged_in_client():
+    client = archive.app.test_client()
+    response = client.post('/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f"could not log in as {BENCH_USER!r}; was the dataset made with `python -m bench generate`?")
+    return client
+
+
+def drive(scenario, data, threads, requests, seed):
+    """Run requests of one scenario split over threads, each with its own client. Returns a summary dict."""
+    per_thread = max(1, requests // threads)
+    results = [None] * threads
+    ready = threading.Barrier(threads + 1)
+
+    def worker(index):
+        client = logged_in_client()
+        rng = scenario_rng(seed, scenario.name, index)
+        latencies, errors = [], 0
+        ready.wait()
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            status = scenario.request(client, rng, data)
+            latencies.append(time.perf_counter() - started)
+            if status not in scenario.expect:
+                errors += 1
+        results[index] = (latencies, errors)
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for w in workers:
+        w.start()
+    ready.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - started
+    latencies = [x for lat, errors in results for x in lat]
+    return summarize(latencies, sum(errors for lat, errors in results), wall)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def cmd_generate(args):
+    generate(args.out, jobs=args.jobs, years=args.years, history=args.history, activity=args.activity,
+             photos=args.photos, seed=args.seed, end_date=args.end_date)
+
+
+def cmd_run(args):
+    names = args.scenarios.split(',') if args.scenarios else DEFAULT_SCENARIOS
+    by_name = {s.name: s for s in SCENARIOS}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(unknown)} (have: {', '.join(by_name)})")
+    thread_counts = [int(t) for t in args.threads.split(',')]
+
+    with open(os.path.join(args.data, 'meta.json')) as fh:
+        dataset = json.load(fh)
+    work = prepare_run(args.data)
+    try:
+        conn = archive.get_db()
+        data = Dataset(conn)
+        conn.close()
+        report = {
+            'meta': {
+                'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'dataset': dataset,
+                'requests': args.requests,
+                'warmup': args.warmup,
+                'seed': args.seed,
+            },
+            'scenarios': {},
+        }
+        for name in names:
+            scenario = by_name[name]
+            if args.warmup:
+                drive(scenario, data, 1, args.warmup, args.seed + 1)
+            results = report['scenarios'][name] = {}
+            for threads in thread_counts:
+                summary = results[str(threads)] = drive(scenario, data, threads, args.requests, args.seed)
+                print(f"{name:24} {threads:>3} thr  p50 {summary['p50_ms']:8.2f}  p95 {summary['p95_ms']:8.2f}  "
+                      f"p99 {summary['p99_ms']:8.2f} ms  {summary['throughput_rps']:8.1f} req/s"
+                      + (f"  {summary['errors']} errors" if summary['errors'] else ''), flush=True)
+    finally:
+        archive.flush_audit_log()
+        archive.shutdown_background_pool()
+        archive.close_thread_db()
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as fh:
+            json.dump(report, fh, indent=1)
+        print(f"Wrote {args.out}")
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+def _change(old, new):
+    if not old:
+        return None
+    return round((new - old) / old * 100, 1)
+
+
+def compare(old, new, threshold):
+    """Rows of (scenario, threads, {metric: (old, new, change %)}, regressed) for results in both runs."""
+    rows = []
+    for name, by_threads in new['scenarios'].items():
+        for threads, after in by_threads.items():
+            before = old['scenarios'].get(name, {}).get(threads)
+            if before is None:
+                continue
+            metrics = {key: (before[key], after[key], _change(before[key], after[key]))
+                       for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')}
+            slower = after['p95_ms'] - before['p95_ms'] > max(before['p95_ms'] * threshold / 100, NOISE_FLOOR_MS)
+            fewer = after['throughput_rps'] < before['throughput_rps'] * (1 - threshold / 100)
+            rows.append((name, threads, metrics, slower or fewer or after['errors'] > before['errors']))
+    return rows
+
+
+def cmd_compare(args):
+    with open(args.old) as fh:
+        old = json.load(fh)
+    with open(args.new) as fh:
+        new = json.load(fh)
+    print(f"old: {old['meta'].get('commit')} {old['meta']['started_at']}  "
+          f"new: {new['meta'].get('commit')} {new['meta']['started_at']}")
+    if old['meta']['dataset'].get('rows') != new['meta']['dataset'].get('rows'):
+        print('warning: the runs used different datasets')
+    rows = compare(old, new, args.threshold)
+    for name, threads, metrics, regressed in rows:
+        cells = '  '.join(f"{key[:-3] if key.endswith('_ms') else 'rps'} {b:.2f}->{a:.2f} ({c:+.1f}%)"
+                          if c is not None else f"{key} {b}->{a}" for key, (b, a, c) in metrics.items())
+        print(f"{'REGRESSION' if regressed else 'ok':10} {name:24} {threads:>3} thr  {cells}")
+    regressions = sum(1 for row in rows if row[3])
+    print(f"{regressions} regression(s) beyond {args.threshold}% out of {len(rows)} results")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Archive benchmark suite')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('generate', help='build a seeded synthetic dataset')
+    p.add_argument('--out', required=True, help='dataset folder (replaced if it exists)')
+    p.add_argument('--jobs', type=int, default=10000)
+    p.add_argument('--years', type=int, default=6, help='span of job dates')
+    p.add_argument('--history', type=int, default=6, help='max stage_history rows per job')
+    p.add_argument('--activity', type=int, default=3, help='max activity_log rows per job')
+    p.add_argument('--photos', type=float, default=1.5, help='average photos per job')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--end-date', help='newest job date, YYYY-MM-DD (default: today)')
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser('run', help='drive the routes and report latency percentiles and throughput')
+    p.add_argument('--data', required=True, help='dataset folder from `generate`')
+    p.add_argument('--scenarios', help='comma-separated (default: ' + ','.join(DEFAULT_SCENARIOS) + ')')
+    p.add_argument('--threads', default='1,8', help='comma-separated thread counts (default: 1,8)')
+    p.add_argument('--requests', type=int, default=300, help='requests per scenario and thread count')
+    p.add_argument('--warmup', type=int, default=20)
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--out', help='JSON report file (default: stdout)')
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser('compare', help='diff two run reports and flag regressions')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=10, help='percent change counted as a regression')
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
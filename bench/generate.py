@@ -0,0 +1,190 @@
+"""Seeded synthetic archive: users, jobs, stage history, photos and the activity log.
+
+The same arguments always produce the same rows (timestamps are relative to
+--end-date), so runs against regenerated data stay comparable.
+"""
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import time
+
+from werkzeug.security import generate_password_hash
+
+import app as archive
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench'
+CHUNK = 5000
+PLACEHOLDER_PHOTOS = 64
+
+WORDS = (
+    'brochure leaflet poster booklet calendar catalogue flyer invitation label sticker carton box '
+    'envelope letterhead menu card banner folder notebook certificate ticket voucher wrapper tag '
+    'annual report magazine newsletter programme diary pamphlet insert sleeve bag'
+).split()
+COLOURS = 'four colour two colour single colour spot gold silver pantone black uv varnish matt gloss foil'.split()
+PAPERS = ('Art 150gsm', 'Art 300gsm', 'Bond 80gsm', 'Bristol 250gsm', 'Kraft 120gsm', 'Ivory 230gsm',
+          'Newsprint 48gsm', 'Sticker paper', 'Duplex board 350gsm', 'Matt 170gsm')
+NAME_PARTS = (
+    'Lanka Ceylon Royal Golden Silver Green Blue Sunrise Ocean Island Metro City Prime Star Lotus '
+    'Hill Lake River Temple Crown Eagle Tiger Palm Coral Pearl Ruby Jade Amber Orchid'
+).split()
+NAME_KINDS = ('Traders', 'Holdings', 'Stores', 'Pharmacy', 'Bakery', 'Hotel', 'College', 'Motors',
+              'Textiles', 'Foods', 'Tea', 'Agencies', 'Hardware', 'Distributors', 'Printers')
+ROLES = (('admin', 2), ('staff', 6), ('viewer', 3))
+
+
+def point_app_at(data_dir):
+    """Make app.py use the database and file folders under data_dir."""
+    archive.DB_PATH = os.path.join(data_dir, 'database.db')
+    archive.app.config['UPLOAD_FOLDER'] = os.path.join(data_dir, 'uploads')
+    archive.app.config['BLOB_FOLDER'] = os.path.join(data_dir, 'blobs')
+    archive.app.config['VARIANT_FOLDER'] = os.path.join(data_dir, 'variants')
+    archive.app.config['BACKUP_FOLDER'] = os.path.join(data_dir, 'backups')
+    archive.app.config['ARCHIVE_FOLDER'] = os.path.join(data_dir, 'archive')
+
+
+def placeholder_photos(rng):
+    """PLACEHOLDER_PHOTOS distinct tiny JPEGs (raw bytes if Pillow is missing)."""
+    photos = []
+    for i in range(PLACEHOLDER_PHOTOS):
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if archive.Image is not None:
+            buf = io.BytesIO()
+            archive.Image.new('RGB', (16, 16), colour).save(buf, 'JPEG', quality=70)
+            data = buf.getvalue()
+        else:
+            data = b'\xff\xd8\xff\xe0' + bytes(colour) * 32 + i.to_bytes(2, 'big') + b'\xff\xd9'
+        photos.append((hashlib.sha256(data).hexdigest(), data))
+    return photos
+
+
+def generate(out_dir, jobs=10000, years=6, history=6, activity=3, photos=1.5, seed=1, end_date=None, verbose=True):
+    """Build a fresh archive in out_dir. Returns the parameters written to out_dir/meta.json."""
+    rng = random.Random(seed)
+    end = datetime.date.fromisoformat(end_date) if end_date else datetime.date.today()
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    point_app_at(out_dir)
+    archive.init_db()
+    started = time.perf_counter()
+
+    stages = [code for code, label, group in archive.TRACKER_STAGES]
+    final = stages.index(archive.FINAL_STAGE)
+    customers = sorted({f"{rng.choice(NAME_PARTS)} {rng.choice(NAME_PARTS)} {rng.choice(NAME_KINDS)}"
+                        for _ in range(max(20, jobs // 25))})
+    days = years * 365
+
+    conn = archive.get_db()
+    cur = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')
+    # Index jobs_fts once at the end instead of row by row
+    cur.execute('INSERT INTO fts_bulk_load (active) VALUES (1)')
+
+    pwd_hash = generate_password_hash(BENCH_PASSWORD)
+    users = [("Bench User", BENCH_USER, pwd_hash, 'superadmin')]
+    for role, n in ROLES:
+        users += [(f"{role.title()} {i + 1}", f"{role}{i + 1}", pwd_hash, role) for i in range(n)]
+    cur.executemany("INSERT INTO users (full_name, username, password_hash, role) VALUES (?, ?, ?, ?)", users)
+    cur.execute("SELECT id FROM users WHERE role != 'viewer'")
+    editors = [r['id'] for r in cur.fetchall()]
+
+    placeholders = placeholder_photos(rng)
+    for sha256, data in placeholders:
+        path = archive.blob_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+    cur.executemany(
+        "INSERT INTO blobs (sha256, size, ref_count, created_at) VALUES (?, ?, 0, ?)",
+        [(sha256, len(data), end.isoformat()) for sha256, data in placeholders],
+    )
+
+    counts = {'jobs': 0, 'stage_history': 0, 'photos': 0, 'activity_log': 0}
+    job_rows, history_rows, photo_rows, activity_rows = [], [], [], []
+
+    def flush():
+        cur.executemany(
+            'INSERT INTO jobs (id, job_no, name, date, paper, note, price, serial, created_by, created_at, '
+            'stage, stage_updated_by, stage_updated_at, pre_plate, pre_die, pre_paper) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', job_rows)
+        cur.executemany(
+            'INSERT INTO stage_history (job_id, stage, updated_by, updated_at, pre_plate, pre_die, pre_paper) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', history_rows)
+        cur.executemany(
+            'INSERT INTO photos (job_id, filename, uploaded_at, variants_status, sha256) VALUES (?, ?, ?, ?, ?)',
+            photo_rows)
+        cur.executemany(archive.AUDIT_INSERT, activity_rows)
+        for key, rows in (('jobs', job_rows), ('stage_history', history_rows), ('photos', photo_rows),
+                          ('activity_log', activity_rows)):
+            counts[key] += len(rows)
+            rows.clear()
+
+    for job_id in range(1, jobs + 1):
+        # Older jobs are spread evenly; job ids follow the date order of a real archive
+        age = int(days * (1 - job_id / jobs))
+        day = end - datetime.timedelta(days=age)
+        created = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(minutes=rng.randrange(600))
+        by = rng.choice(editors)
+        customer = customers[int(len(customers) * rng.random() ** 3)]
+        note = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) + ', ' + rng.choice(COLOURS)
+        flags = (rng.random() < 0.3, rng.random() < 0.15, rng.random() < 0.2)
+
+        # Jobs older than two months are delivered; recent ones are somewhere in production
+        current = final if age > 60 else rng.randint(0, final)
+        between = rng.sample(range(1, current), min(max(current - 1, 0), max(history - 2, 0)))
+        path = sorted({0, current, *between})
+        at = created
+        for index in path:
+            history_rows.append((job_id, stages[index], rng.choice(editors), at.isoformat(), *flags))
+            at += datetime.timedelta(hours=rng.expovariate(1 / 10))
+        stage_at = history_rows[-1][3]
+
+        job_rows.append((
+            job_id, f"CC{job_id:07d}", customer, day.isoformat(), rng.choice(PAPERS), note,
+            str(rng.randrange(5, 500) * 100), f"S{rng.randrange(10 ** 6):06d}", by, created.isoformat(),
+            stages[current], history_rows[-1][2], stage_at, *flags,
+        ))
+        for n in range(int(photos * 2 * rng.random() + 0.5)):
+            sha256 = placeholders[rng.randrange(PLACEHOLDER_PHOTOS)][0]
+            photo_rows.append((job_id, f"photo_{job_id}_{n}.jpg", created.isoformat(), 'pending', sha256))
+
+        job_no = job_rows[-1][1]
+        events = [(by, 'CREATE_JOB', created.isoformat(), f"Created job {job_no}")]
+        for _, stage, user_id, when, *rest in history_rows[len(history_rows) - len(path) + 1:]:
+            events.append((user_id, 'UPDATE_STAGE', when, f"Stage -> {stage}"))
+        for user_id, action, when, details in events[:activity]:
+            activity_rows.append((user_id, action, job_id, job_no, details, when))
+
+        if len(job_rows) >= CHUNK:
+            flush()
+            if verbose:
+                print(f"  {job_id} jobs", end='\r', flush=True)
+    flush()
+
+    cur.execute('DELETE FROM fts_bulk_load')
+    archive.index_customers(cur)
+    conn.commit()
+    conn.execute("INSERT INTO jobs_fts (jobs_fts) VALUES ('rebuild')")
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    archive.close_thread_db()
+
+    meta = {
+        'jobs': jobs, 'years': years, 'history': history, 'activity': activity, 'photos': photos,
+        'seed': seed, 'end_date': end.isoformat(), 'rows': counts,
+        'seconds': round(time.perf_counter() - started, 1),
+        'schema_version': archive.SCHEMA_VERSION,
+    }
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as fh:
+        json.dump(meta, fh, indent=1)
+    if verbose:
+        print(f"Generated {counts} in {meta['seconds']} s -> {out_dir}")
+    return meta
@@ -0,0 +1,74 @@
+"""Route scenarios. Each builds one request from a seeded RNG and facts about the dataset."""
+import random
+
+import app as archive
+
+from .generate import NAME_PARTS, WORDS
+
+
+class Dataset:
+    """What the scenarios need to know about the generated data, read once per run."""
+
+    def __init__(self, conn):
+        row = conn.execute('SELECT min(id), max(id) FROM jobs').fetchone()
+        self.min_id, self.max_id = row[0] or 1, row[1] or 1
+        self.months = [(r['year'], r['month']) for r in
+                       conn.execute('SELECT year, month FROM job_date_facets WHERE job_count > 0 ORDER BY year, month')]
+        self.open_ids = [r['id'] for r in conn.execute(
+            'SELECT id FROM jobs WHERE stage IS NOT ? ORDER BY id DESC LIMIT 500', (archive.FINAL_STAGE,))]
+        self.stages = [code for code, label, group in archive.TRACKER_STAGES]
+
+    def job_id(self, rng):
+        return rng.randint(self.min_id, self.max_id)
+
+
+class Scenario:
+    def __init__(self, name, build, method='GET', expect=(200,)):
+        self.name = name
+        self.build = build
+        self.method = method
+        self.expect = expect
+
+    def request(self, client, rng, data):
+        """Issue one request; returns the response status."""
+        path, form = self.build(rng, data)
+        if self.method == 'POST':
+            response = client.post(path, data=form)
+        else:
+            response = client.get(path)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+def _month(rng, data):
+    year, month = rng.choice(data.months) if data.months else ('', '')
+    return f"year={year}&month={month}"
+
+
+def _stage_update(rng, data):
+    job_id = rng.choice(data.open_ids) if data.open_ids else data.job_id(rng)
+    return f"/tracker/update/{job_id}", {'stage': rng.choice(data.stages)}
+
+
+SCENARIOS = [
+    Scenario('dashboard', lambda rng, data: ('/', None)),
+    Scenario('dashboard_month', lambda rng, data: (f"/?{_month(rng, data)}", None)),
+    Scenario('dashboard_count', lambda rng, data: ('/?count=1', None)),
+    Scenario('search_keyword', lambda rng, data: (f"/?mode=keyword&q={rng.choice(WORDS)}", None)),
+    Scenario('search_keyword_prefix', lambda rng, data: (f"/?mode=keyword&q={rng.choice(WORDS)[:3]}", None)),
+    Scenario('search_customer', lambda rng, data: (f"/?mode=customer&q={rng.choice(NAME_PARTS)}", None)),
+    Scenario('search_job_no', lambda rng, data: (f"/?mode=job&q={data.job_id(rng):07d}", None)),
+    Scenario('job_detail', lambda rng, data: (f"/job/{data.job_id(rng)}", None)),
+    Scenario('tracker', lambda rng, data: ('/tracker', None)),
+    Scenario('tracker_job', lambda rng, data: (f"/tracker/job/{data.job_id(rng)}", None)),
+    Scenario('activity', lambda rng, data: ('/activity', None)),
+    Scenario('analytics', lambda rng, data: ('/analytics', None)),
+    Scenario('export_month', lambda rng, data: (f"/export/jobs?{_month(rng, data)}", None)),
+    Scenario('stage_update', _stage_update, method='POST', expect=(302,)),
+]
+DEFAULT_SCENARIOS = [s.name for s in SCENARIOS if s.name not in ('export_month', 'stage_update')]
+
+
+def scenario_rng(seed, name, thread):
+    return random.Random(f"{seed}:{name}:{thread}")
@@ -15,15 +15,18 @@ IF NOT EXIST "venv" (
 echo Activating virtual environment...
 call venv\Scripts\activate.bat
 
-echo Installing required packages...
-pip install --upgrade pip
-pip install -r requirements.txt
+rem Install packages only for a new venv or when requirements.txt has changed
+fc /b requirements.txt venv\requirements.installed >nul 2>&1
+IF ERRORLEVEL 1 (
+    echo Installing required packages...
+    pip install -r requirements.txt && copy /y requirements.txt venv\requirements.installed >nul
+)
 
 echo.
-echo Starting Flask server...
+echo Starting server...
 echo.
 
-python app.py
+python app.py serve
 
 echo.
 echo ==============================
@@ -0,0 +1,85 @@
+// Live tracker board: patches rows in place from /tracker/stream (Server-Sent Events).
+//
+// Markup expected in tracker.html:
+//   <table data-tracker-stream="{{ url_for('tracker_stream') }}" data-last-event-id="{{ stream_last_id }}">
+//     <tr data-job-id="{{ job.id }}"> ... <td data-field="stage_label">...</td> ... </tr>
+//   </table>
+//   <template id="tracker-row-template"> a <tr> using the same data-field cells </template>  (optional)
+//
+// Cells are matched by data-field against the job fields in each event. Boolean flags
+// (pre_plate, pre_die, pre_paper) set a data-on attribute instead of text.
+(function () {
+  'use strict';
+
+  var table = document.querySelector('[data-tracker-stream]');
+  if (!table || !window.EventSource) {
+    return;
+  }
+  var body = table.tBodies[0] || table;
+  var FLAGS = { pre_plate: true, pre_die: true, pre_paper: true };
+
+  function fill(row, job) {
+    row.setAttribute('data-job-id', job.id);
+    row.setAttribute('data-stage', job.stage || '');
+    var cells = row.querySelectorAll('[data-field]');
+    for (var i = 0; i < cells.length; i++) {
+      var field = cells[i].getAttribute('data-field');
+      if (!(field in job)) {
+        continue;
+      }
+      if (FLAGS[field]) {
+        cells[i].setAttribute('data-on', job[field] ? '1' : '0');
+      } else {
+        cells[i].textContent = job[field] == null ? '' : job[field];
+      }
+    }
+    row.classList.add('tracker-row-updated');
+    setTimeout(function () { row.classList.remove('tracker-row-updated'); }, 2000);
+  }
+
+  function newRow() {
+    var tpl = document.getElementById('tracker-row-template');
+    if (!tpl) {
+      return null;
+    }
+    return tpl.content.firstElementChild.cloneNode(true);
+  }
+
+  var url = table.getAttribute('data-tracker-stream');
+  var lastId = table.getAttribute('data-last-event-id');
+  if (lastId) {
+    url += (url.indexOf('?') < 0 ? '?' : '&') + 'last_event_id=' + encodeURIComponent(lastId);
+  }
+  var source = new EventSource(url);
+
+  source.addEventListener('job', function (e) {
+    var job = JSON.parse(e.data);
+    var row = body.querySelector('tr[data-job-id="' + job.id + '"]');
+    if (!row) {
+      // Only rows on the first page get new jobs; later pages would shift under the reader
+      if (document.location.search.indexOf('after=') >= 0 || document.location.search.indexOf('before=') >= 0) {
+        return;
+      }
+      row = newRow();
+      if (!row) {
+        return;
+      }
+      body.insertBefore(row, body.firstChild);
+    }
+    fill(row, job);
+  });
+
+  source.addEventListener('delete', function (e) {
+    var job = JSON.parse(e.data);
+    var row = body.querySelector('tr[data-job-id="' + job.id + '"]');
+    if (row) {
+      row.parentNode.removeChild(row);
+    }
+  });
+
+  // Server could not replay what we missed (restart or too far behind): reload once
+  source.addEventListener('reset', function () {
+    source.close();
+    window.location.reload();
+  });
+})();
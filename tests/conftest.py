@@ -0,0 +1,76 @@
+"""Fixtures: each test gets its own database and file folders under tmp_path."""
+import json
+import os
+import sys
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as archive  # noqa: E402
+
+FOLDERS = ('UPLOAD_FOLDER', 'BLOB_FOLDER', 'VARIANT_FOLDER', 'BACKUP_FOLDER', 'ARCHIVE_FOLDER')
+
+
+@pytest.fixture
+def archive_app(tmp_path, monkeypatch):
+    """app.py configured for testing against an empty, migrated database in tmp_path."""
+    # Keep a developer's settings.cfg and the instance secret key out of the tests
+    settings = tmp_path / 'settings.json'
+    settings.write_text('{}')
+    monkeypatch.setenv(archive.SETTINGS_ENV, str(settings))
+    saved_config = dict(archive.app.config)
+    for key in ('DB_PATH', '_fts_enabled', '_maintenance_scheduler', *archive.TUNABLE_SETTINGS):
+        monkeypatch.setattr(archive, key, getattr(archive, key))
+    config = {'TESTING': True, 'SECRET_KEY': 'test', 'AUDIT_MODE': 'sync',
+              'DATABASE': str(tmp_path / 'database.db')}
+    config.update({key: str(tmp_path / key.lower()) for key in FOLDERS})
+    archive.close_thread_db()
+    archive.create_app(config)
+    archive.page_cache.clear()
+    archive.user_directory.invalidate()
+    archive.suggest_index.invalidate()
+    yield archive
+    archive.shutdown_background_pool(wait=True)
+    archive.close_thread_db()
+    archive.page_cache.clear()
+    archive.app.config.clear()
+    archive.app.config.update(saved_config)
+
+
+def add_user(archive, username, role, full_name=None):
+    conn = archive.get_db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (full_name, username, password_hash, role) VALUES (?, ?, ?, ?)",
+        (full_name or username.title(), username, generate_password_hash('secret'), role),
+    )
+    conn.commit()
+    user_id = cur.lastrowid
+    conn.close()
+    return user_id
+
+
+def log_in(client, user_id, role, full_name='Tester'):
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['role'] = role
+        session['full_name'] = full_name
+
+
+@pytest.fixture
+def admin(archive_app):
+    """A test client logged in as a fresh superadmin."""
+    client = archive_app.app.test_client()
+    log_in(client, add_user(archive_app, 'root', 'superadmin'), 'superadmin')
+    return client
+
+
+def add_job(client, job_no, name='Lanka Printers', **form):
+    """Save a job through POST /add (as the page script does) and return its id."""
+    response = client.post('/add', data={'job_no': job_no, 'name': name, 'date': '2024-03-01', **form},
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return json.loads(response.get_data())['id']
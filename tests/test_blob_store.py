@@ -0,0 +1,51 @@
+import os
+import time
+
+
+def place(path, age_hours):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    when = time.time() - age_hours * 3600
+    os.utime(path, (when, when))
+    return path
+
+
+def test_sweep_removes_only_old_files_with_no_blobs_row(archive_app):
+    old = archive_app.BLOB_SWEEP_GRACE_HOURS + 1
+    kept_sha, orphan_sha, recent_sha = 'aa' * 32, 'bb' * 32, 'cc' * 32
+    conn = archive_app.get_db()
+    conn.execute("INSERT INTO blobs (sha256, size, ref_count, created_at) VALUES (?, 0, 1, '2024-01-01')", (kept_sha,))
+    conn.commit()
+    conn.close()
+    kept = place(archive_app.blob_path(kept_sha), old)
+    orphan = place(archive_app.blob_path(orphan_sha), old)
+    recent = place(archive_app.blob_path(recent_sha), 0)
+    tmp = os.path.join(archive_app.app.config['BLOB_FOLDER'], 'tmp')
+    spool = place(os.path.join(tmp, 'spool-1'), old)
+    part = place(os.path.join(tmp, 'upload-1'), old)
+
+    assert archive_app.sweep_blob_store() == 2
+    assert not os.path.exists(orphan) and not os.path.exists(spool)
+    # Referenced, still within the grace period, or a resumable upload's part: left alone
+    assert os.path.exists(kept) and os.path.exists(recent) and os.path.exists(part)
+
+
+def test_rolled_back_blob_is_swept_by_the_scheduler_pass(archive_app, monkeypatch):
+    monkeypatch.setattr(archive_app, 'BACKUP_INTERVAL_HOURS', 0)
+    monkeypatch.setattr(archive_app, 'ACTIVITY_RETENTION_MONTHS', 0)
+    spooled = os.path.join(archive_app.app.config['BLOB_FOLDER'], 'tmp', 'spool-2')
+    os.makedirs(os.path.dirname(spooled), exist_ok=True)
+    with open(spooled, 'wb') as fh:
+        fh.write(b'photo')
+    conn = archive_app.get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    archive_app.commit_blob(conn.cursor(), spooled, 'dd' * 32, 5)
+    conn.rollback()
+    conn.close()
+    stored = archive_app.blob_path('dd' * 32)
+    assert os.path.exists(stored)
+
+    aged = time.time() - (archive_app.BLOB_SWEEP_GRACE_HOURS + 1) * 3600
+    os.utime(stored, (aged, aged))
+    archive_app.run_maintenance()
+    assert not os.path.exists(stored)
@@ -0,0 +1,77 @@
+from conftest import add_job
+
+
+def replay(client, since=0, **args):
+    """Follow next_since until more is false; returns (changes, last response)."""
+    changes = []
+    while True:
+        data = client.get('/api/changes', query_string={'since': since, **args}).get_json()
+        assert not data['reset']
+        changes.extend(data['changes'])
+        since = data['next_since']
+        if not data['more']:
+            return changes, data
+
+
+def final_state(changes):
+    return {(c['table'], c['id']): c.get('row', 'deleted') for c in changes}
+
+
+def test_compaction_keeps_the_latest_change_per_row(archive_app, admin):
+    kept, gone = add_job(admin, 'J-1'), add_job(admin, 'J-2')
+    conn = archive_app.get_db()
+    for note in ('one', 'two', 'three'):
+        conn.execute('UPDATE jobs SET note = ? WHERE id = ?', (note, kept))
+        conn.commit()
+    conn.close()
+    assert admin.post(f'/delete_job/{gone}').status_code == 302
+    before, _ = replay(admin)
+
+    assert archive_app.compact_changes() > 0
+    assert archive_app.compact_changes() == 0
+
+    conn = archive_app.get_db()
+    per_row = conn.execute('SELECT tbl, row_id, count(*) FROM changes GROUP BY tbl, row_id HAVING count(*) > 1').fetchall()
+    conn.close()
+    assert per_row == []
+    after, _ = replay(admin)
+    # A replay from 0 still rebuilds the same tables: the same final state per row
+    assert final_state(after) == final_state(before)
+    jobs = {c['id']: c for c in after if c['table'] == 'jobs'}
+    assert jobs[kept]['row']['note'] == 'three'
+    assert jobs[gone]['deleted'] is True
+
+
+def test_client_resumes_without_missing_changes_after_compaction(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    _, last = replay(admin)
+    conn = archive_app.get_db()
+    conn.execute("UPDATE jobs SET note = 'later' WHERE id = ?", (job_id,))
+    conn.commit()
+    conn.close()
+    archive_app.compact_changes()
+    changes, _ = replay(admin, since=last['next_since'])
+    assert [(c['table'], c['id'], c['row']['note']) for c in changes if c['table'] == 'jobs'] == [('jobs', job_id, 'later')]
+
+
+def test_restore_resets_clients_behind_the_horizon(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    _, last = replay(admin)
+    seen = last['next_since']
+    conn = archive_app.get_db()
+    archive_app.restart_change_feed(conn, archive_app.last_change_seq(conn))
+    conn.close()
+
+    data = admin.get('/api/changes', query_string={'since': seen}).get_json()
+    assert data['reset'] is True and data['next_since'] == 0
+    # Starting over from 0 gets the whole database again, with seqs past what was seen
+    changes, _ = replay(admin)
+    assert {c['id'] for c in changes if c['table'] == 'jobs'} == {job_id}
+    assert min(c['seq'] for c in changes) > seen
+
+
+def test_since_past_the_end_is_a_reset(archive_app, admin):
+    add_job(admin, 'J-1')
+    data = admin.get('/api/changes', query_string={'since': 10 ** 6}).get_json()
+    assert data['reset'] is True
+    assert admin.get('/api/changes', query_string={'since': 'x'}).status_code == 400
@@ -0,0 +1,34 @@
+from conftest import add_job
+
+
+def test_one_word_query_finds_multi_word_names(archive_app, admin):
+    add_job(admin, 'J-1', name='Blue Lanka Agencies')
+    add_job(admin, 'J-2', name='Lanka Printers')
+    add_job(admin, 'J-3', name='Ceylon Traders')
+    names = [c['name'] for c in admin.get('/api/customers', query_string={'q': 'lanka'}).get_json()['results']]
+    assert sorted(names) == ['Blue Lanka Agencies', 'Lanka Printers']
+
+
+def test_jobs_written_by_other_tools_are_indexed_at_start_up(archive_app):
+    conn = archive_app.get_db()
+    conn.execute("INSERT INTO jobs (job_no, name, date, stage) "
+                 "VALUES ('J-1', 'Lanka Printers', '2024-03-01', 'PRE_DESIGN')")
+    conn.commit()
+    conn.close()
+    archive_app.init_db()
+    conn = archive_app.get_db()
+    matches = archive_app.customer_matches(conn.cursor(), 'lanka')
+    conn.close()
+    assert [m['name'] for m in matches] == ['Lanka Printers']
+
+
+def test_lookups_do_not_write(archive_app, admin):
+    add_job(admin, 'J-1')
+    conn = archive_app.get_db()
+    conn.execute("INSERT INTO jobs (job_no, name, date, stage) VALUES ('J-2', 'Stray', '2024-03-01', 'PRE_DESIGN')")
+    conn.commit()
+    conn.close()
+    admin.get('/api/customers', query_string={'q': 'stray'})
+    conn = archive_app.get_db()
+    assert conn.execute('SELECT count(*) FROM jobs WHERE customer_id IS NULL').fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+
+from conftest import add_job
+
+
+def test_scheduler_starts_with_backups_and_archival_off(archive_app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(archive_app, 'BACKUP_INTERVAL_HOURS', 0)
+    monkeypatch.setattr(archive_app, 'ACTIVITY_RETENTION_MONTHS', 0)
+    monkeypatch.setattr(archive_app, '_maintenance_stop', threading.Event())
+    monkeypatch.setattr(archive_app, 'run_maintenance', lambda: calls.append(time.time()))
+    archive_app.start_maintenance_scheduler()
+    try:
+        assert archive_app._maintenance_scheduler is not None
+        deadline = time.time() + 5
+        while not calls and time.time() < deadline:
+            time.sleep(0.01)
+        assert calls
+    finally:
+        archive_app._maintenance_stop.set()
+        archive_app._maintenance_scheduler.join(5)
+
+
+def test_upkeep_runs_with_backups_and_archival_off(archive_app, admin, monkeypatch):
+    monkeypatch.setattr(archive_app, 'BACKUP_INTERVAL_HOURS', 0)
+    monkeypatch.setattr(archive_app, 'ACTIVITY_RETENTION_MONTHS', 0)
+    job_id = add_job(admin, 'J-1')
+    conn = archive_app.get_db()
+    # Superseded change-log rows, a job written by another tool, an abandoned upload
+    conn.execute("UPDATE jobs SET note = 'again' WHERE id = ?", (job_id,))
+    conn.execute("INSERT INTO jobs (job_no, name, date, stage) VALUES ('J-2', 'Ceylon Traders', '2024-03-02', 'PRE_DESIGN')")
+    conn.execute("INSERT INTO photo_uploads (id, job_id, filename, size, created_at) "
+                 "VALUES ('old', ?, 'a.jpg', 10, '2000-01-01T00:00:00')", (job_id,))
+    conn.commit()
+    conn.close()
+    part = archive_app.upload_part_path('old')
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    open(part, 'wb').close()
+    # A store file whose blobs row was rolled back, old enough to be past the grace period
+    orphan = archive_app.blob_path('ab' * 32)
+    os.makedirs(os.path.dirname(orphan), exist_ok=True)
+    open(orphan, 'wb').close()
+    aged = time.time() - (archive_app.BLOB_SWEEP_GRACE_HOURS + 1) * 3600
+    os.utime(orphan, (aged, aged))
+
+    archive_app.run_maintenance()
+
+    conn = archive_app.get_db()
+    assert conn.execute("SELECT count(*) FROM changes WHERE tbl = 'jobs' AND row_id = ?",
+                        (job_id,)).fetchone()[0] == 1
+    assert conn.execute('SELECT count(*) FROM jobs WHERE customer_id IS NULL').fetchone()[0] == 0
+    assert conn.execute('SELECT count(*) FROM photo_uploads').fetchone()[0] == 0
+    assert conn.execute('SELECT count(*) FROM backup_log').fetchone()[0] == 0
+    conn.close()
+    assert not os.path.exists(part)
+    assert not os.path.exists(orphan)
+
@@ -0,0 +1,65 @@
+import sqlite3
+
+from conftest import add_job
+
+
+def note_of(client, job_id):
+    return client.get(f'/api/jobs/{job_id}').get_json()['job']['note']
+
+
+def test_pages_are_served_from_cache_until_a_write(archive_app, admin):
+    job_id = add_job(admin, 'J-1', note='first')
+    assert note_of(admin, job_id) == 'first'
+    hits = archive_app.page_cache.snapshot()['hits']
+    assert note_of(admin, job_id) == 'first'
+    assert archive_app.page_cache.snapshot()['hits'] == hits + 1
+
+    conn = archive_app.get_db()
+    conn.execute("UPDATE jobs SET note = 'second' WHERE id = ?", (job_id,))
+    conn.commit()
+    conn.close()
+    assert note_of(admin, job_id) == 'second'
+
+
+def test_writes_by_another_process_invalidate(archive_app, admin):
+    job_id = add_job(admin, 'J-1', note='first')
+    assert note_of(admin, job_id) == 'first'
+    other = sqlite3.connect(archive_app.DB_PATH)
+    other.execute("UPDATE jobs SET note = 'outside' WHERE id = ?", (job_id,))
+    other.commit()
+    other.close()
+    assert note_of(admin, job_id) == 'outside'
+
+
+def test_etag_revalidation(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    first = admin.get(f'/api/jobs/{job_id}')
+    again = admin.get(f'/api/jobs/{job_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    admin.post('/tracker/bulk', json={'job_ids': [job_id], 'stage': 'POST_PACKING'})
+    changed = admin.get(f'/api/jobs/{job_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+
+
+def test_cache_is_keyed_per_user(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    admin.get(f'/api/jobs/{job_id}')
+    stores = archive_app.page_cache.snapshot()['stores']
+    with admin.session_transaction() as session:
+        session['user_id'] += 1
+    admin.get(f'/api/jobs/{job_id}')
+    assert archive_app.page_cache.snapshot()['stores'] == stores + 1
+
+
+def test_least_recently_used_pages_are_evicted(archive_app, monkeypatch):
+    monkeypatch.setattr(archive_app, 'PAGE_CACHE_MAX_BYTES', 4 * (1000 + archive_app.PageCache.ENTRY_OVERHEAD))
+    cache = archive_app.PageCache()
+    for key in 'abcd':
+        cache.put(key, 1, b'x' * 1000, 'text/html')
+    cache.get('a', 1)
+    cache.put('e', 1, b'x' * 1000, 'text/html')
+    assert list(cache.entries) == ['c', 'd', 'a', 'e']
+    assert cache.get('a', 2) is None
+    # One page never takes more than a quarter of the cache
+    cache.put('big', 1, b'x' * 2000, 'text/html')
+    assert 'big' not in cache.entries
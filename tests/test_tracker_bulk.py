@@ -0,0 +1,40 @@
+import pytest
+
+from conftest import add_job
+
+
+@pytest.mark.parametrize('body, error', [
+    ({'job_ids': '12', 'stage': 'POST_PACKING'}, 'job_ids must be a list of integers'),
+    ({'job_ids': [1, '2'], 'stage': 'POST_PACKING'}, 'job_ids must be a list of integers'),
+    ({'job_ids': [True], 'stage': 'POST_PACKING'}, 'job_ids must be a list of integers'),
+    ({'job_ids': [1], 'stage': 'POST_PACKING', 'outsource': [['a']]}, 'outsource must be a list of strings'),
+    ({'job_ids': [1], 'stage': 'POST_PACKING', 'outsource': 'plate_sent'}, 'outsource must be a list of strings'),
+    ({'job_ids': [1], 'stage': 5}, 'Unknown stage'),
+    ({'job_ids': [1], 'stage': 'NOWHERE'}, 'Unknown stage'),
+    ({'job_ids': [1], 'stage': 'POST_PACKING', 'outsource': ['nope']}, 'Unknown outsourced processing flag'),
+    ({'job_ids': [], 'stage': 'POST_PACKING'}, 'No jobs selected'),
+])
+def test_bad_json_is_rejected_before_any_write(archive_app, admin, body, error):
+    job_ids = [add_job(admin, 'J-1'), add_job(admin, 'J-2')]
+    response = admin.post('/tracker/bulk', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+    conn = archive_app.get_db()
+    stages = [row[0] for row in conn.execute('SELECT stage FROM jobs WHERE id IN (?, ?)', job_ids)]
+    conn.close()
+    assert stages == ['PRE_DESIGN', 'PRE_DESIGN']
+
+
+def test_bulk_update_applies_stage_flags_and_stamps(archive_app, admin):
+    first, second = add_job(admin, 'J-1'), add_job(admin, 'J-2', stage='POST_PACKING')
+    response = admin.post('/tracker/bulk', json={'job_ids': [first, second, 999], 'stage': 'POST_PACKING',
+                                                 'pre_plate': True, 'outsource': ['plate_sent']})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [job['id'] for job in data['applied']] == [first, second]
+    assert data['skipped'] == [{'id': 999, 'reason': 'not found'}]
+    conn = archive_app.get_db()
+    rows = conn.execute('SELECT stage, pre_plate, plate_sent_at IS NOT NULL FROM jobs WHERE id IN (?, ?) ORDER BY id',
+                        (first, second)).fetchall()
+    conn.close()
+    assert [tuple(row) for row in rows] == [('POST_PACKING', 1, 1), ('POST_PACKING', 1, 1)]
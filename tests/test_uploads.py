@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+
+from conftest import add_job, add_user, log_in
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def photo_bytes():
+    if Image is None:
+        return b'\xff\xd8\xff\xe0' + bytes(range(256)) * 4 + b'\xff\xd9'
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), (200, 30, 30)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def start(client, job_id, data, **extra):
+    response = client.post(f'/api/jobs/{job_id}/uploads',
+                           json={'filename': 'cover.jpg', 'size': len(data), **extra})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+def test_chunks_resume_from_the_server_offset_and_finalize(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    data = photo_bytes()
+    upload = start(admin, job_id, data, sha256=hashlib.sha256(data).hexdigest())
+    assert upload['offset'] == 0
+    half = len(data) // 2
+
+    assert admin.put(f"{upload['url']}?offset=0", data=data[:half]).get_json()['offset'] == half
+    # A client that lost track of what arrived asks, and a wrong offset is refused
+    assert admin.get(upload['url']).get_json()['offset'] == half
+    response = admin.put(f"{upload['url']}?offset=0", data=data[half:])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == half
+    # Finalizing early says how much is missing
+    assert admin.post(f"{upload['url']}/finalize").status_code == 409
+
+    assert admin.put(f"{upload['url']}?offset={half}", data=data[half:]).get_json()['offset'] == len(data)
+    response = admin.post(f"{upload['url']}/finalize")
+    assert response.status_code == 201
+    photo = response.get_json()
+    assert photo['sha256'] == hashlib.sha256(data).hexdigest()
+    assert os.path.exists(archive_app.blob_path(photo['sha256']))
+    assert not os.path.exists(archive_app.upload_part_path(upload['id']))
+    assert admin.get(upload['url']).status_code == 404
+    conn = archive_app.get_db()
+    assert conn.execute('SELECT count(*) FROM photos WHERE job_id = ?', (job_id,)).fetchone()[0] == 1
+    conn.close()
+
+
+def test_more_bytes_than_announced_are_refused(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    upload = start(admin, job_id, b'12345')
+    response = admin.put(f"{upload['url']}?offset=0", data=b'123456')
+    assert response.status_code == 413
+
+
+def test_sha256_mismatch_drops_the_upload(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    data = photo_bytes()
+    upload = start(admin, job_id, data, sha256='0' * 64)
+    admin.put(f"{upload['url']}?offset=0", data=data)
+    assert admin.post(f"{upload['url']}/finalize").status_code == 422
+    assert not os.path.exists(archive_app.upload_part_path(upload['id']))
+
+
+def test_expiry_removes_unfinished_uploads_only(archive_app, admin):
+    job_id = add_job(admin, 'J-1')
+    stale, fresh = start(admin, job_id, b'12345'), start(admin, job_id, b'12345')
+    conn = archive_app.get_db()
+    conn.execute("UPDATE photo_uploads SET created_at = '2000-01-01T00:00:00' WHERE id = ?", (stale['id'],))
+    conn.commit()
+    conn.close()
+
+    assert archive_app.expire_uploads() == 1
+    assert admin.get(stale['url']).status_code == 404
+    assert not os.path.exists(archive_app.upload_part_path(stale['id']))
+    assert admin.get(fresh['url']).status_code == 200
+    assert os.path.exists(archive_app.upload_part_path(fresh['id']))
+
+
+def test_staff_upload_only_to_their_own_recent_jobs(archive_app, admin, monkeypatch):
+    staff = archive_app.app.test_client()
+    staff_id = add_user(archive_app, 'clerk', 'staff')
+    log_in(staff, staff_id, 'staff')
+    theirs, others = add_job(staff, 'J-1'), add_job(admin, 'J-2')
+
+    start(staff, theirs, b'12345')
+    assert staff.post(f'/api/jobs/{others}/uploads', json={'filename': 'a.jpg', 'size': 5}).status_code == 403
+    # The window is its own setting, not the upload retention
+    monkeypatch.setattr(archive_app, 'UPLOAD_EXPIRY_HOURS', 0)
+    start(staff, theirs, b'12345')
+    monkeypatch.setattr(archive_app, 'STAFF_UPLOAD_WINDOW_HOURS', 0)
+    assert staff.post(f'/api/jobs/{theirs}/uploads', json={'filename': 'a.jpg', 'size': 5}).status_code == 403